@@ -3,5 +3,18 @@ from . import models
 
 # Register your models here.
 admin.site.register(models.Author)
-admin.site.register(models.Post)
-admin.site.register(models.Inbox)
\ No newline at end of file
+admin.site.register(models.Image)
+admin.site.register(models.Inbox)
+admin.site.register(models.RemoteFollow)
+admin.site.register(models.Follow)
+admin.site.register(models.FeedEntry)
+
+@admin.register(models.Post)
+class PostAdmin(admin.ModelAdmin):
+    list_display = ('title', 'author', 'visibility', 'unlisted', 'timestamp')
+    list_filter = ('visibility', 'unlisted')
+    list_select_related = ('author__user',)
+
+    def get_queryset(self, request):
+        # The change form reads the body on its own; the changelist never shows it
+        return super().get_queryset(request).without_body()
@@ -0,0 +1,191 @@
+"""
+Content-addressed storage for image posts.
+
+The bytes of an image are saved once through Django's default storage (DEFAULT_FILE_STORAGE: S3 in
+production, MEDIA_ROOT in development), named by their SHA-256, and recorded as an Image row that posts point
+at (Post.image). The spec's "data:image/...;base64,..." body is only built for federation payloads; that of
+a small image is kept in the shared cache.
+
+Posts moved over by migration 0050 keep their base64 body as well until clear_image_bodies has checked the
+stored copy, and fall back to it while the stored copy is missing.
+"""
+import base64
+import hashlib
+import logging
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+from .models import Image
+
+
+# Migration 0050 writes under the same prefix
+PREFIX = 'images'
+MAX_AGE = getattr(settings, 'IMAGE_MAX_AGE', 86400)
+DATA_URL_TIMEOUT = getattr(settings, 'IMAGE_DATA_URL_TIMEOUT', 3600)
+DATA_URL_CACHE_MAX = getattr(settings, 'IMAGE_DATA_URL_CACHE_MAX', 256 * 1024)
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+storage = default_storage
+
+# A single byte range; other forms (multiple ranges) get the whole image, as RFC 7233 allows
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def name(digest):
+    """
+    Storage name of the image with this digest.
+    """
+    return f'{PREFIX}/{digest[:2]}/{digest}'
+
+
+def durable(digest, size):
+    """
+    Whether the storage holds all size bytes of the image with this digest.
+    """
+    try:
+        return storage.exists(name(digest)) and storage.size(name(digest)) == size
+    except OSError:
+        return False
+
+
+def write(chunks):
+    """
+    Save the bytes of chunks to the storage unless an image with the same content is already there.
+    Returns (sha256 hex digest, size in bytes).
+    """
+    sha, size = hashlib.sha256(), 0
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in chunks:
+            sha.update(chunk)
+            tmp.write(chunk)
+            size += len(chunk)
+        digest = sha.hexdigest()
+        target = name(digest)
+        if not durable(digest, size):
+            # A partial copy would make save pick another name
+            storage.delete(target)
+            tmp.seek(0)
+            saved = storage.save(target, File(tmp))
+            if saved != target:
+                # Another worker saved the same bytes meanwhile
+                storage.delete(saved)
+    return digest, size
+
+
+def store(chunks):
+    """
+    The Image for the bytes of chunks, written to disk as they are read.
+    """
+    digest, size = write(chunks)
+    return Image.objects.get_or_create(sha256=digest, defaults={'size': size})[0]
+
+
+def decode_data_url(content):
+    """
+    Bytes of a "data:...;base64,..." body. Raises ValueError if it is not valid base64.
+    """
+    return base64.b64decode(content.split(',', 1)[-1], validate=True)
+
+
+def data_url(digest, content_type):
+    """
+    The spec's embedded form of a stored image, e.g. "data:image/png;base64,...".
+    Images up to IMAGE_DATA_URL_CACHE_MAX bytes are cached; larger ones are read again each time, so no
+    worker keeps their bytes after the response.
+    """
+    key = 'image-base64:' + digest
+    encoded = cache.get(key)
+    if encoded is None:
+        pieces, size, rest = [], 0, b''
+        try:
+            with storage.open(name(digest), 'rb') as file:
+                # Whole groups of 3 bytes encode without padding, so the pieces join into one base64 string
+                for chunk in iter(lambda: file.read(CHUNK_SIZE * 3), b''):
+                    size += len(chunk)
+                    chunk = rest + chunk
+                    whole = len(chunk) - len(chunk) % 3
+                    pieces.append(base64.b64encode(chunk[:whole]).decode('ascii'))
+                    rest = chunk[whole:]
+                pieces.append(base64.b64encode(rest).decode('ascii'))
+        except OSError:
+            logger.warning('Image %s is missing from the storage', digest)
+            return ''
+        encoded = ''.join(pieces)
+        if size <= DATA_URL_CACHE_MAX:
+            cache.set(key, encoded, DATA_URL_TIMEOUT)
+    return 'data:' + content_type + ',' + encoded
+
+
+def _read(file, length):
+    with file:
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, image, content_type):
+    """
+    Response with the bytes of image, honouring If-None-Match and a single Range; None if the storage
+    does not have them.
+    """
+    etag = '"' + image.sha256 + '"'
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            file = storage.open(name(image.sha256), 'rb')
+        except OSError:
+            logger.warning('Image %s is missing from the storage', image.sha256)
+            return None
+        match = _RANGE.match(request.headers.get('Range', ''))
+        if request.headers.get('If-Range', etag) != etag or not match or not any(match.groups()):
+            response = FileResponse(file, content_type=content_type)
+            # Remote storages don't give FileResponse a local path to take the length from
+            response['Content-Length'] = image.size
+        else:
+            start, end = match.groups()
+            if start:
+                start, end = int(start), min(int(end), image.size - 1) if end else image.size - 1
+            else:
+                start, end = max(image.size - int(end), 0), image.size - 1
+            if start > end:
+                file.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{image.size}'
+            else:
+                file.seek(start)
+                response = StreamingHttpResponse(_read(file, end - start + 1), status=206, content_type=content_type)
+                response['Content-Range'] = f'bytes {start}-{end}/{image.size}'
+                response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    # Images can belong to friends-only posts, so only the viewer's own cache may keep them
+    patch_cache_control(response, private=True, max_age=MAX_AGE)
+    return response
+
+
+def prune():
+    """
+    Delete the images no post uses any more. Returns how many were deleted.
+    """
+    deleted = 0
+    for digest in list(Image.objects.filter(posts__isnull=True).values_list('sha256', flat=True)):
+        # Checked again per image, in case a post picked it up meanwhile
+        if Image.objects.filter(sha256=digest, posts__isnull=True).delete()[0]:
+            storage.delete(name(digest))
+            cache.delete('image-base64:' + digest)
+            deleted += 1
+    return deleted
@@ -0,0 +1,68 @@
+import heapq
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.models import RemotePost
+from Profile import timeline
+from Profile.models import Author
+
+
+class Command(BaseCommand):
+    help = 'Compare the bytes and latency of a home timeline page with and without deferred post bodies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', help='Id of the viewer; defaults to the first author')
+        parser.add_argument('--size', type=int, default=timeline.PAGE_SIZE, help='Posts per page')
+        parser.add_argument('--repeat', type=int, default=20, help='Times each page is built')
+
+    def full_page(self, author, size):
+        # The same page read with whole rows, as before bodies were deferred
+        public = timeline.public_posts().select_related('author__user').order_by('-timestamp', '-id')
+        own = timeline.feed(author).select_related('post__author__user').order_by('-timestamp', '-post')
+        remote = RemotePost.objects.order_by('-timestamp', '-remote_id')
+        merged = heapq.merge(((post.timestamp, timeline.LOCAL, str(post.id), post) for post in public[:size + 1]),
+                             ((entry.timestamp, timeline.LOCAL, str(entry.post_id), entry.post) for entry in own[:size + 1]),
+                             ((post.timestamp, timeline.REMOTE, post.remote_id, post) for post in remote[:size + 1]),
+                             key=lambda entry: entry[:3], reverse=True)
+        return [post if source == timeline.LOCAL else timeline.as_post(post)
+                for _, source, _, post in islice(merged, size)]
+
+    def light_page(self, author, size):
+        return timeline.page(author, size=size)
+
+    def measure(self, build, author, size, repeat):
+        # Bytes are what the database sends back for the page's queries, counted by running them again;
+        # latency is building the page as a whole
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            build(author, size)
+        size_bytes = 0
+        with connection.cursor() as cursor:
+            for sql, params in queries:
+                cursor.execute(sql, params)
+                size_bytes += sum(len(value.encode()) if isinstance(value, str) else len(str(value))
+                                  for row in cursor.fetchall() for value in row if value is not None)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            build(author, size)
+        return len(queries), size_bytes, (time.perf_counter() - started) / repeat * 1e3
+
+    def handle(self, *args, **options):
+        authors = Author.objects.filter(user__isnull=False)
+        author = authors.filter(id=options['author']).first() if options['author'] else authors.first()
+        if author is None:
+            raise CommandError('No such author')
+        size, repeat = options['size'], options['repeat']
+
+        light = self.measure(self.light_page, author, size, repeat)
+        full = self.measure(self.full_page, author, size, repeat)
+        for name, (queries, size_bytes, ms) in (('full rows', full), ('bodies of shown posts only', light)):
+            self.stdout.write(f'timeline page, {name}: {queries} queries, {size_bytes} bytes, {ms:.2f}ms')
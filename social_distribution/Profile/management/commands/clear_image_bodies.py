@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from Profile import images
+from Profile.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Empty the base64 bodies of image posts whose stored image has been checked to be complete'
+
+    def handle(self, *args, **options):
+        cleared = missing = 0
+        posts = Post.objects.filter(image__isnull=False).exclude(content='').select_related('image')
+        for post_id, digest, size in list(posts.values_list('id', 'image', 'image__size')):
+            if images.durable(digest, size):
+                cleared += Post.objects.filter(pk=post_id).update(content='')
+            else:
+                missing += 1
+        self.stdout.write(f'{cleared} bodies cleared, {missing} kept because their stored image is missing')
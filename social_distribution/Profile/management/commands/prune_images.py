@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from Profile import images
+
+
+class Command(BaseCommand):
+    help = 'Delete stored images that no post uses any more'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{images.prune()} images deleted')
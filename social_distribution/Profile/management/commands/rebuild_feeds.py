@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from Profile.models import Author, FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Recompute the FeedEntry rows behind home timelines from posts and follows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--author', action='append', help='Only rebuild the feed of this author id (repeatable)')
+        parser.add_argument('--batch', type=int, default=1000, help='Entries written per INSERT batch')
+
+    def handle(self, *args, **options):
+        owners = None
+        if options['author']:
+            owners = list(Author.objects.filter(id__in=options['author']))
+        written = FeedEntry.objects.rebuild(owners, batch_size=options['batch'])
+        self.stdout.write(f'{written} feed entries written')
@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.utils.functional import SimpleLazyObject
+
+from .models import Author
+
+
+def current_author(request):
+    """
+    The local Author acting in request, with its inbox loaded, or None for anonymous users and remote
+    nodes (Connections).
+    """
+    user = getattr(request, 'user', None)
+    if not isinstance(user, User) or not user.is_authenticated:
+        return None
+    author = Author.objects.select_related('inbox').filter(user=user).first()
+    if author is not None:
+        # Shares the request's User both ways, so author.user, author.displayName and user.author
+        # (in templates too) need no further queries
+        author.user = user
+    return author
+
+
+class CurrentAuthorMiddleware:
+    """
+    Sets request.author, resolved by current_author on first use and then kept for the request.
+
+    Resolution waits for that first use, so api views see the user DRF authenticated (session, token or
+    Connection) and not only the session's. request.author wraps None when there is no local author:
+    test it with "if request.author", not "is None".
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.author = SimpleLazyObject(lambda: current_author(request))
+        return self.get_response(request)
@@ -0,0 +1,66 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+FIELDS = (('remote_following_uuid', 'following'), ('remote_followers_uuid', 'follower'))
+
+
+def split_uuid_strings(apps, schema_editor):
+    Author = apps.get_model('Profile', 'Author')
+    RemoteFollow = apps.get_model('Profile', 'RemoteFollow')
+    follows = []
+    for author in Author.objects.exclude(remote_following_uuid__isnull=True, remote_followers_uuid__isnull=True):
+        for field, direction in FIELDS:
+            for remote_id in dict.fromkeys((getattr(author, field) or '').split()):
+                follows.append(RemoteFollow(author_id=author.id, remote_id=remote_id, direction=direction))
+    RemoteFollow.objects.bulk_create(follows, ignore_conflicts=True)
+
+
+def join_uuid_strings(apps, schema_editor):
+    Author = apps.get_model('Profile', 'Author')
+    RemoteFollow = apps.get_model('Profile', 'RemoteFollow')
+    for author in Author.objects.filter(remote_follows__isnull=False).distinct():
+        for field, direction in FIELDS:
+            ids = RemoteFollow.objects.filter(author_id=author.id, direction=direction).values_list('remote_id', flat=True)
+            setattr(author, field, ' '.join(ids) or None)
+        author.save(update_fields=[field for field, _ in FIELDS])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0042_auto_20210414_1423'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemoteFollow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remote_id', models.CharField(max_length=200)),
+                ('direction', models.CharField(choices=[('following', 'Following'), ('follower', 'Follower')], max_length=10)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remote_follows', to='Profile.author')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='remotefollow',
+            index=models.Index(fields=['remote_id', 'direction'], name='Profile_rem_remote__720c43_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='remotefollow',
+            constraint=models.UniqueConstraint(fields=('author', 'direction', 'remote_id'), name='unique_remote_follow'),
+        ),
+        migrations.RunPython(split_uuid_strings, join_uuid_strings),
+        migrations.RemoveField(
+            model_name='author',
+            name='remote_followers_uuid',
+        ),
+        migrations.RemoveField(
+            model_name='author',
+            name='remote_following_uuid',
+        ),
+    ]
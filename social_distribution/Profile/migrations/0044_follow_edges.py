@@ -0,0 +1,72 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def through(apps, name):
+    return apps.get_model('Profile', 'Author')._meta.get_field(name).remote_field.through
+
+
+def merge_follow_tables(apps, schema_editor):
+    Follow = apps.get_model('Profile', 'Follow')
+    # following holds (follower -> followed), followers holds (followed -> follower)
+    edges = set(through(apps, 'following').objects.values_list('from_author_id', 'to_author_id'))
+    edges |= {(dst, src) for src, dst in through(apps, 'followers').objects.values_list('from_author_id', 'to_author_id')}
+    Follow.objects.bulk_create([Follow(src_id=src, dst_id=dst, is_mutual=(dst, src) in edges) for src, dst in edges])
+
+
+def split_follow_table(apps, schema_editor):
+    Follow = apps.get_model('Profile', 'Follow')
+    edges = list(Follow.objects.values_list('src_id', 'dst_id'))
+    Following, Followers = through(apps, 'following'), through(apps, 'followers')
+    Following.objects.bulk_create([Following(from_author_id=src, to_author_id=dst) for src, dst in edges])
+    Followers.objects.bulk_create([Followers(from_author_id=dst, to_author_id=src) for src, dst in edges])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0043_remote_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_mutual', models.BooleanField(default=False)),
+                ('dst', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_edges_in', to='Profile.author')),
+                ('src', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_edges_out', to='Profile.author')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['dst', 'src'], name='Profile_fol_dst_id_0f7273_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['src', 'is_mutual'], name='Profile_fol_src_id_e1fb21_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('src', 'dst'), name='unique_follow'),
+        ),
+        migrations.RunPython(merge_follow_tables, split_follow_table),
+        migrations.RemoveField(
+            model_name='author',
+            name='followers',
+        ),
+        # A plain M2M can't be altered to use a through model, so it is dropped and added back
+        migrations.RemoveField(
+            model_name='author',
+            name='following',
+        ),
+        migrations.AddField(
+            model_name='author',
+            name='following',
+            field=models.ManyToManyField(blank=True, related_name='followers', through='Profile.Follow', to='Profile.Author'),
+        ),
+    ]
@@ -0,0 +1,113 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def author_identity(author):
+    # Frozen copy of Profile.models.author_identity
+    if not isinstance(author, dict):
+        return '', ''
+    author_id = str(author.get('authorID') or author.get('id') or '')
+    return author_id.strip().rstrip('/').rsplit('/', 1)[-1][:200], str(author.get('host') or '')[:200]
+
+
+def backfill(apps, schema_editor):
+    Inbox = apps.get_model('Profile', 'Inbox')
+    in_inbox = [through.objects.filter(postlike=models.OuterRef('pk'))
+                for through in (Inbox.post_like_items.through, Inbox.post_like_items_cleared.through)]
+    for name, target, order in (('Comment', None, ('pk',)),
+                                ('PostLike', 'post_id_id', ('-in_inbox', '-in_cleared', 'pk')),
+                                ('CommentLike', 'comment_id_id', ('pk',))):
+        model = apps.get_model('Profile', name)
+        rows = model.objects.all()
+        if name == 'PostLike':
+            # Likes carry no timestamp. Of an author's likes of a post, keep one the post's author was notified
+            # of, so no inbox entry is lost with the duplicates
+            rows = rows.annotate(in_inbox=models.Exists(in_inbox[0]), in_cleared=models.Exists(in_inbox[1]))
+        seen = set()
+        duplicates, batch = [], []
+        for row in rows.order_by(*order).iterator(chunk_size=BATCH_SIZE):
+            row.author_id, row.author_host = author_identity(row.author)
+            if target and row.author_id:
+                # The same author liking the same thing twice; keep the first in the order above
+                key = (getattr(row, target), row.author_id)
+                if key in seen:
+                    duplicates.append(row.pk)
+                seen.add(key)
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_update(batch, ['author_id', 'author_host'])
+                batch = []
+        model.objects.bulk_update(batch, ['author_id', 'author_host'])
+
+        recount = set()
+        for start in range(0, len(duplicates), BATCH_SIZE):
+            chunk = model.objects.filter(pk__in=duplicates[start:start + BATCH_SIZE])
+            if name == 'PostLike':
+                recount.update(chunk.values_list('post_id', flat=True))
+            chunk.delete()
+        recount_likes(apps, recount - {None})
+
+
+def recount_likes(apps, post_ids):
+    Post = apps.get_model('Profile', 'Post')
+    PostLike = apps.get_model('Profile', 'PostLike')
+    counts = dict(PostLike.objects.filter(post_id__in=post_ids).values_list('post_id').annotate(n=models.Count('pk')).order_by())
+    for post_id in post_ids:
+        Post.objects.filter(pk=post_id).update(likes_count=counts.get(post_id, 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0044_follow_edges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='author_host',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='author_id',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='commentlike',
+            name='author_host',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='commentlike',
+            name='author_id',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='postlike',
+            name='author_host',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='postlike',
+            name='author_id',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'author_id'], name='Profile_com_post_id_d4fe36_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentlike',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, author_id=''), fields=('comment_id', 'author_id'), name='unique_comment_like'),
+        ),
+        migrations.AddConstraint(
+            model_name='postlike',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, author_id=''), fields=('post_id', 'author_id'), name='unique_post_like'),
+        ),
+    ]
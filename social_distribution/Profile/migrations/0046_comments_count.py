@@ -0,0 +1,27 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_comments(apps, schema_editor):
+    Post = apps.get_model('Profile', 'Post')
+    Comment = apps.get_model('Profile', 'Comment')
+    for post_id, n in Comment.objects.filter(post__isnull=False).values_list('post').annotate(n=Count('id')).order_by():
+        Post.objects.filter(pk=post_id).update(comments_count=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0045_author_identity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
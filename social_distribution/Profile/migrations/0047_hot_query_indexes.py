@@ -0,0 +1,33 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0046_comments_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commentlike',
+            index=models.Index(fields=['comment_id', 'author_id'], name='commentlike_comment_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(unlisted=False), fields=['visibility', '-timestamp'], name='post_timeline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-timestamp'], name='post_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['to_author', '-timestamp'], name='post_to_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postlike',
+            index=models.Index(fields=['post_id', 'author_id'], name='postlike_post_author_idx'),
+        ),
+    ]
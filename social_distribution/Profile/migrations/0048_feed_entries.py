@@ -0,0 +1,60 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    # Same rules as FeedEntryManager.audience
+    Post = apps.get_model('Profile', 'Post')
+    Follow = apps.get_model('Profile', 'Follow')
+    FeedEntry = apps.get_model('Profile', 'FeedEntry')
+
+    related = {}
+    for src, dst in Follow.objects.values_list('src', 'dst').iterator():
+        related.setdefault(src, set()).add(dst)
+        related.setdefault(dst, set()).add(src)
+
+    entries = []
+    posts = Post.objects.exclude(visibility='PUBLIC').filter(unlisted=False)
+    for post_id, timestamp, author, to_author, visibility in \
+            posts.values_list('id', 'timestamp', 'author', 'to_author', 'visibility').iterator():
+        audience = {}
+        if author is not None:
+            if visibility == 'FRIENDS':
+                audience.update((owner, 'friends') for owner in related.get(author, ()))
+            audience[author] = 'own'
+        if to_author is not None:
+            audience[to_author] = 'received'
+        entries += [FeedEntry(owner_id=owner, post_id=post_id, timestamp=timestamp, reason=reason)
+                    for owner, reason in audience.items()]
+    FeedEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0047_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('reason', models.CharField(choices=[('own', 'Own'), ('friends', 'Friends'), ('received', 'Received')], max_length=10)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='Profile.author')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='Profile.post')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['owner', '-timestamp', '-post'], name='feed_owner_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'post'), name='unique_feed_entry'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,167 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:56
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def move_read_state(apps, schema_editor):
+    Inbox = apps.get_model('Profile', 'Inbox')
+    Post = apps.get_model('Profile', 'Post')
+    now = django.utils.timezone.now()
+
+    # (cleared m2m, link model, item column)
+    for cleared, through, item in (
+        (Inbox.post_items_cleared.through, apps.get_model('Profile', 'InboxPost'), 'post_id'),
+        (Inbox.follow_items_cleared.through, apps.get_model('Profile', 'InboxFollow'), 'follow_id'),
+        (Inbox.post_like_items_cleared.through, apps.get_model('Profile', 'InboxLike'), 'like_id'),
+    ):
+        cleared_item = [f.attname for f in cleared._meta.fields if f.attname not in ('id', 'inbox_id')][0]
+        for inbox_id, item_id in cleared.objects.values_list('inbox_id', cleared_item).iterator():
+            # Private posts were only ever listed through to_author, so some cleared items have no link yet
+            through.objects.update_or_create(inbox_id=inbox_id, **{item: item_id}, defaults={'cleared_at': now})
+
+    # Posts sent to an author now live in their inbox like every other item
+    InboxPost = apps.get_model('Profile', 'InboxPost')
+    inboxes = dict(apps.get_model('Profile', 'Author').objects.filter(inbox__isnull=False).values_list('id', 'inbox'))
+    for post_id, to_author, timestamp in Post.objects.filter(to_author__isnull=False) \
+            .values_list('id', 'to_author', 'timestamp').iterator():
+        if to_author in inboxes:
+            InboxPost.objects.get_or_create(inbox_id=inboxes[to_author], post_id=post_id, defaults={'added': timestamp})
+
+    unread = {}
+    for through in ('InboxPost', 'InboxFollow', 'InboxLike'):
+        rows = apps.get_model('Profile', through).objects.filter(cleared_at__isnull=True)
+        for inbox_id, n in rows.values_list('inbox').annotate(n=Count('id')).order_by():
+            unread[inbox_id] = unread.get(inbox_id, 0) + n
+    for inbox_id, n in unread.items():
+        Inbox.objects.filter(pk=inbox_id).update(unread_count=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Search', '0007_hot_query_indexes'),
+        ('Profile', '0048_feed_entries'),
+    ]
+
+    operations = [
+        # The item m2ms get explicit link models on top of the tables Django already made for them
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.CreateModel(
+                name='InboxPost',
+                fields=[
+                    ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('inbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Profile.inbox')),
+                    ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='Profile.post')),
+                ],
+                options={
+                    'db_table': 'Profile_inbox_post_items',
+                    'abstract': False,
+                    'unique_together': {('inbox', 'post')},
+                },
+            ),
+            migrations.CreateModel(
+                name='InboxLike',
+                fields=[
+                    ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('inbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Profile.inbox')),
+                    ('like', models.ForeignKey(db_column='postlike_id', on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='Profile.postlike')),
+                ],
+                options={
+                    'db_table': 'Profile_inbox_post_like_items',
+                    'abstract': False,
+                    'unique_together': {('inbox', 'like')},
+                },
+            ),
+            migrations.CreateModel(
+                name='InboxFollow',
+                fields=[
+                    ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                    ('follow', models.ForeignKey(db_column='friendrequest_id', on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='Search.friendrequest')),
+                    ('inbox', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Profile.inbox')),
+                ],
+                options={
+                    'db_table': 'Profile_inbox_follow_items',
+                    'abstract': False,
+                    'unique_together': {('inbox', 'follow')},
+                },
+            ),
+            migrations.AlterField(
+                model_name='inbox',
+                name='follow_items',
+                field=models.ManyToManyField(null=True, related_name='inbox_follows', through='Profile.InboxFollow', to='Search.FriendRequest'),
+            ),
+            migrations.AlterField(
+                model_name='inbox',
+                name='post_items',
+                field=models.ManyToManyField(null=True, related_name='inbox_posts', through='Profile.InboxPost', to='Profile.Post'),
+            ),
+            migrations.AlterField(
+                model_name='inbox',
+                name='post_like_items',
+                field=models.ManyToManyField(null=True, related_name='inbox_likes', through='Profile.InboxLike', to='Profile.PostLike'),
+            ),
+        ]),
+        migrations.AddField(
+            model_name='inboxpost',
+            name='added',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='inboxpost',
+            name='cleared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inboxlike',
+            name='added',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='inboxlike',
+            name='cleared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inboxfollow',
+            name='added',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='inboxfollow',
+            name='cleared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='inboxpost',
+            index=models.Index(fields=['inbox', 'cleared_at', '-added'], name='inboxpost_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxlike',
+            index=models.Index(fields=['inbox', 'cleared_at', '-added'], name='inboxlike_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxfollow',
+            index=models.Index(fields=['inbox', 'cleared_at', '-added'], name='inboxfollow_state_idx'),
+        ),
+        migrations.AddField(
+            model_name='inbox',
+            name='unread_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(move_read_state, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='inbox',
+            name='follow_items_cleared',
+        ),
+        migrations.RemoveField(
+            model_name='inbox',
+            name='post_items_cleared',
+        ),
+        migrations.RemoveField(
+            model_name='inbox',
+            name='post_like_items_cleared',
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 3.1.6 on 2026-10-18 04:02
+
+import base64
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+IMAGE_TYPES = ('image/png;base64', 'image/jpeg;base64')
+
+
+# Frozen copy of Profile.images' naming and writing, so later changes there don't change this migration
+def image_name(digest):
+    return f'images/{digest[:2]}/{digest}'
+
+
+def save_image(data):
+    digest = hashlib.sha256(data).hexdigest()
+    name = image_name(digest)
+    if not (default_storage.exists(name) and default_storage.size(name) == len(data)):
+        default_storage.delete(name)
+        saved = default_storage.save(name, ContentFile(data))
+        if saved != name:
+            default_storage.delete(saved)
+    return digest
+
+
+def move_images(apps, schema_editor):
+    """
+    Save embedded images to the file storage and link their posts to them. The base64 bodies are kept:
+    clear_image_bodies empties them once it has checked the stored copies, which a release-phase
+    migration on an ephemeral disk could not.
+    """
+    Image = apps.get_model('Profile', 'Image')
+    Post = apps.get_model('Profile', 'Post')
+    embedded = Post.objects.filter(contentType__in=IMAGE_TYPES, content__startswith='data:')
+    # Bodies are read one at a time; only the ids are held
+    for post_id in list(embedded.values_list('id', flat=True)):
+        content = Post.objects.filter(pk=post_id).values_list('content', flat=True).get()
+        try:
+            data = base64.b64decode(content.split(',', 1)[-1], validate=True)
+        except ValueError:
+            continue
+        digest = save_image(data)
+        Image.objects.get_or_create(sha256=digest, defaults={'size': len(data)})
+        Post.objects.filter(pk=post_id).update(image=digest)
+
+
+def restore_images(apps, schema_editor):
+    Post = apps.get_model('Profile', 'Post')
+    for post_id, digest, content_type in list(Post.objects.filter(image__isnull=False, content='')
+                                              .values_list('id', 'image', 'contentType')):
+        try:
+            with default_storage.open(image_name(digest), 'rb') as file:
+                encoded = base64.b64encode(file.read()).decode('ascii')
+        except OSError:
+            continue
+        Post.objects.filter(pk=post_id).update(content='data:' + content_type + ',' + encoded)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0049_inbox_read_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Image',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('size', models.BigIntegerField()),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='posts', to='Profile.image'),
+        ),
+        migrations.RunPython(move_images, restore_images),
+    ]
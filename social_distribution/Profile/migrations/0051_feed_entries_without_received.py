@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+def drop_received(apps, schema_editor):
+    FeedEntry = apps.get_model('Profile', 'FeedEntry')
+    received = FeedEntry.objects.filter(reason='received')
+    # A post sent to its own author is still theirs
+    received.filter(post__author=models.F('owner')).update(reason='own')
+    received.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Profile', '0050_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_received, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='feedentry',
+            name='reason',
+            field=models.CharField(choices=[('own', 'Own'), ('friends', 'Friends')], max_length=10),
+        ),
+    ]
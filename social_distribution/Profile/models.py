@@ -1,6 +1,6 @@
 import uuid, commonmark
 
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.db.models.signals import post_save
@@ -8,7 +8,6 @@ from django.dispatch import receiver
 from django.utils import timezone
 from django.forms import ModelForm
 from django.urls import reverse
-from django.core.validators import int_list_validator
 
 # https://simpleisbetterthancomplex.com/tutorial/2016/07/22/how-to-extend-django-user-model.html#onetoone
 # https://stackoverflow.com/questions/16925129/generate-unique-id-in-django-from-a-model-field/30637668
@@ -24,8 +23,9 @@ class Author(models.Model):
 
     inbox = models.OneToOneField('Inbox', on_delete=models.CASCADE, related_name='inbox', null=True)
 
-    following = models.ManyToManyField('self', symmetrical=False, related_name="following_list", null=True, blank=True)
-    followers = models.ManyToManyField('self', symmetrical=False, related_name="follower_list", null=True, blank=True)
+    # author.followers is the reverse side; edges are written through Follow.objects.follow/unfollow
+    following = models.ManyToManyField('self', symmetrical=False, through='Follow', through_fields=('src', 'dst'),
+                                       related_name="followers", blank=True)
 
     # posts_cleared = models.ManyToManyField('Post', related_name="posts_cleared")
     # friend_requests_cleared = models.ManyToManyField('Search.FriendRequest', related_name="friend_requests_cleared")
@@ -34,10 +34,6 @@ class Author(models.Model):
     remote_host = models.CharField(max_length=50, blank=True)
     remote_username = models.CharField(max_length=50, blank=True)
 
-    #remote_friends_uuid = models.TextField(validators=[int_list_validator], null=True, blank=True)
-    remote_following_uuid = models.TextField(validators=[int_list_validator], null=True, blank=True)
-    remote_followers_uuid = models.TextField(validators=[int_list_validator], null=True, blank=True)
-
     # DEBUG
     debug = models.TextField(max_length=500, blank=True, null=True)
 
@@ -82,11 +78,159 @@ class Author(models.Model):
     def host(self, value):
         self.remote_host = value
 
+    @property
+    def friends(self):
+        return Follow.objects.friends_of(self)
+
+    # Follows with authors on other nodes, see RemoteFollow
+    @property
+    def remote_following(self):
+        return list(self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWING).values_list('remote_id', flat=True))
+
+    @property
+    def remote_followers(self):
+        return list(self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWER).values_list('remote_id', flat=True))
+
+    @property
+    def remote_friends(self):
+        followers = self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWER).values('remote_id')
+        return list(self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWING, remote_id__in=followers)
+                    .values_list('remote_id', flat=True))
+
+    def is_following_remote(self, remote_id):
+        return self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWING, remote_id=remote_id).exists()
+
+    def is_followed_by_remote(self, remote_id):
+        return self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWER, remote_id=remote_id).exists()
+
+    def follow_remote(self, remote_id):
+        RemoteFollow.objects.get_or_create(author=self, remote_id=str(remote_id), direction=RemoteFollow.Direction.FOLLOWING)
+
+    def unfollow_remote(self, remote_id):
+        self.remote_follows.filter(direction=RemoteFollow.Direction.FOLLOWING, remote_id=remote_id).delete()
+
+    def add_remote_follower(self, remote_id):
+        RemoteFollow.objects.get_or_create(author=self, remote_id=str(remote_id), direction=RemoteFollow.Direction.FOLLOWER)
+
     def __str__(self):
         return self.displayName
 
+
+class FollowManager(models.Manager):
+    def follow(self, src, dst):
+        """
+        Make src follow dst, keeping is_mutual right on both edges of the pair.
+        """
+        with transaction.atomic():
+            # Lock both authors in a fixed order so crossing follows see each other's edge
+            list(Author.objects.select_for_update().filter(pk__in=[src.pk, dst.pk]).order_by('pk').values_list('pk'))
+            edge, created = self.get_or_create(src=src, dst=dst)
+            if created and self.filter(src=dst, dst=src).update(is_mutual=True):
+                edge.is_mutual = True
+                edge.save(update_fields=['is_mutual'])
+            if created:
+                FeedEntry.objects.link(src, dst)
+        return edge
+
+    def unfollow(self, src, dst):
+        with transaction.atomic():
+            list(Author.objects.select_for_update().filter(pk__in=[src.pk, dst.pk]).order_by('pk').values_list('pk'))
+            deleted, _ = self.filter(src=src, dst=dst).delete()
+            if deleted and not self.filter(src=dst, dst=src).update(is_mutual=False):
+                FeedEntry.objects.unlink(src, dst)
+        return bool(deleted)
+
+    def friends_of(self, author):
+        """
+        Local authors that follow author back, in one indexed join.
+        """
+        return Author.objects.filter(follow_edges_in__src=author, follow_edges_in__is_mutual=True)
+
+
+class Follow(models.Model):
+    """
+    src follows dst. is_mutual is set on both edges while dst also follows src.
+    """
+    src = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='follow_edges_out')
+    dst = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='follow_edges_in')
+    created = models.DateTimeField(default=timezone.now)
+    is_mutual = models.BooleanField(default=False)
+
+    objects = FollowManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['src', 'dst'], name='unique_follow'),
+        ]
+        indexes = [
+            models.Index(fields=['dst', 'src']),
+            models.Index(fields=['src', 'is_mutual']),
+        ]
+
+    def __str__(self):
+        return f'{self.src} follows {self.dst}'
+
+
+class RemoteFollow(models.Model):
+    """
+    A follow between a local author and an author on another node, identified by the id their node uses.
+    FOLLOWING: author follows remote_id. FOLLOWER: remote_id follows author.
+    """
+    class Direction(models.TextChoices):
+        FOLLOWING = 'following'
+        FOLLOWER = 'follower'
+
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='remote_follows')
+    remote_id = models.CharField(max_length=200)
+    direction = models.CharField(max_length=10, choices=Direction.choices)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['author', 'direction', 'remote_id'], name='unique_remote_follow'),
+        ]
+        indexes = [models.Index(fields=['remote_id', 'direction'])]
+
+    def __str__(self):
+        return f'{self.author} {self.direction} {self.remote_id}'
+
     
 
+class Image(models.Model):
+    """
+    The bytes of an image post, saved once to the file storage by Profile.images.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    size = models.BigIntegerField()
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.sha256
+
+
+class PostQuerySet(models.QuerySet):
+    # Columns only a post's own page, its cards and the api read; they dwarf the rest of the row
+    BODY = ('content', 'description')
+
+    def without_body(self):
+        """
+        These posts without their body columns, for pages that only show titles, authors and dates.
+        Reading post.content afterwards costs a query per post; see fill_bodies.
+        """
+        return self.defer(*self.BODY)
+
+    def fill_bodies(self, posts):
+        """
+        Load the body columns of posts read with without_body, in one query.
+        For listings that read more rows than they show: only the rows shown need their bodies.
+        """
+        missing = {post.pk: post for post in posts if set(self.BODY) & post.get_deferred_fields()}
+        for pk, *body in self.filter(pk__in=missing).values_list('pk', *self.BODY):
+            for field, value in zip(self.BODY, body):
+                setattr(missing[pk], field, value)
+        return posts
+
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -112,13 +256,16 @@ class Post(models.Model):
     )
 
     content = models.TextField(blank=True)
+    # Image posts keep their bytes here and an empty content; see Profile.images
+    image = models.ForeignKey(Image, on_delete=models.PROTECT, null=True, blank=True, related_name="posts")
     author = models.ForeignKey(Author, on_delete=models.CASCADE, null=True, related_name="posts")
 
     remote_author_id = models.CharField(max_length=200, blank=True, null=True)
     remote_author_displayName = models.CharField(max_length=200, blank=True, null=True)
 
     categories = models.ManyToManyField('PostCategory', blank=True)
-    #comments_count = models.IntegerField(default=0)
+    # Counters are only written through adjust_counter() and manage.py reconcile_counters
+    comments_count = models.IntegerField(default=0)
     #comments_page_size = models.IntegerField(default=50)
     #comments_first_page = models.CharField(max_length=200, null=True) # URL to first page of comments for this post
     #comments = models.ManyToManyField('Comment', blank=True)
@@ -141,6 +288,17 @@ class Post(models.Model):
 
     unlisted = models.BooleanField(default=False) # used for images so that they don't show up in timelines
 
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        # Timelines, author listings and inboxes all read newest first. Timelines never show unlisted
+        # posts; a partial index matches Django's `NOT unlisted` where a column in the key would not on SQLite.
+        indexes = [
+            models.Index(fields=['visibility', '-timestamp'], condition=models.Q(unlisted=False), name='post_timeline_idx'),
+            models.Index(fields=['author', '-timestamp'], name='post_author_idx'),
+            models.Index(fields=['to_author', '-timestamp'], name='post_to_author_idx'),
+        ]
+
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
     def type(self):
@@ -175,12 +333,141 @@ class Post(models.Model):
         else:
             return self._host
 
+    @classmethod
+    def adjust_counter(cls, post_id, field, delta):
+        """
+        Atomically add delta to a counter column (likes_count or comments_count) of a post.
+        Only that column is written, so concurrent updates don't lose increments and the body isn't rewritten.
+        """
+        cls.objects.filter(pk=post_id).update(**{field: models.F(field) + delta})
+
     def content_html(self):
         if self.contentType == Post.ContentType.PLAIN:
             return self.content
         elif self.contentType == Post.ContentType.MARKDOWN:
             return commonmark.commonmark(self.content)
 
+
+class FeedEntryManager(models.Manager):
+    def audience(self, post, related=None):
+        """
+        {owner id: reason} of the feeds post belongs in: its author's, and for FRIENDS posts, those of the authors
+        they follow or are followed by.
+        Public and unlisted posts are in no feed; timelines read public posts from post_timeline_idx.
+        Posts sent to an author (to_author: private posts, posts pushed by remote nodes) stay in their inbox only.
+        Parameters
+        ----------
+        post: a saved Post
+        related: optional function author id -> ids of the authors they follow or are followed by,
+            used by rebuild() to avoid a query per post
+        """
+        Reason = FeedEntry.Reason
+        if post.unlisted or post.visibility == Post.Visibility.PUBLIC:
+            return {}
+        audience = {}
+        if post.author_id is not None:
+            if post.visibility == Post.Visibility.FRIENDS:
+                if related is None:
+                    edges = Follow.objects.filter(models.Q(src=post.author_id) | models.Q(dst=post.author_id))
+                    others = {src if dst == post.author_id else dst for src, dst in edges.values_list('src', 'dst')}
+                else:
+                    others = related(post.author_id)
+                audience.update((owner, Reason.FRIENDS) for owner in others)
+            audience[post.author_id] = Reason.OWN
+        return audience
+
+    def fan_out(self, post):
+        """
+        Put post in the feed of everyone who may see it (and take it out of everyone else's), in bulk.
+        """
+        entries = [FeedEntry(owner_id=owner, post=post, timestamp=post.timestamp, reason=reason)
+                   for owner, reason in self.audience(post).items()]
+        with transaction.atomic():
+            self.filter(post=post).delete()
+            self.bulk_create(entries, ignore_conflicts=True)
+
+    def link(self, a, b):
+        """
+        a and b now follow one another in at least one direction: each sees the other's FRIENDS posts.
+        """
+        entries = []
+        for owner, author in ((a, b), (b, a)):
+            posts = Post.objects.filter(author=author, visibility=Post.Visibility.FRIENDS, unlisted=False)
+            entries += [FeedEntry(owner=owner, post_id=post_id, timestamp=timestamp, reason=FeedEntry.Reason.FRIENDS)
+                        for post_id, timestamp in posts.values_list('id', 'timestamp')]
+        self.bulk_create(entries, ignore_conflicts=True)
+
+    def unlink(self, a, b):
+        """
+        Neither of a and b follows the other any more.
+        """
+        self.filter(models.Q(owner=a, post__author=b) | models.Q(owner=b, post__author=a),
+                    reason=FeedEntry.Reason.FRIENDS).delete()
+
+    def rebuild(self, owners=None, batch_size=1000):
+        """
+        Recompute feeds from posts and follows. Returns the number of entries written.
+        """
+        related = {}
+        for src, dst in Follow.objects.values_list('src', 'dst').iterator():
+            related.setdefault(src, set()).add(dst)
+            related.setdefault(dst, set()).add(src)
+        owners = None if owners is None else {owner.pk for owner in owners}
+
+        stale = self.all() if owners is None else self.filter(owner__in=owners)
+        stale.delete()
+        posts = Post.objects.exclude(visibility=Post.Visibility.PUBLIC).filter(unlisted=False) \
+            .only('id', 'timestamp', 'author', 'to_author', 'visibility', 'unlisted')
+        written, entries = 0, []
+        for post in posts.iterator():
+            for owner, reason in self.audience(post, lambda author: related.get(author, ())).items():
+                if owners is None or owner in owners:
+                    entries.append(FeedEntry(owner_id=owner, post_id=post.id, timestamp=post.timestamp, reason=reason))
+            if len(entries) >= batch_size:
+                self.bulk_create(entries, ignore_conflicts=True)
+                written, entries = written + len(entries), []
+        self.bulk_create(entries, ignore_conflicts=True)
+        return written + len(entries)
+
+
+class FeedEntry(models.Model):
+    """
+    post appears on owner's home timeline. Written on post save and on follow/unfollow (fan-out on write),
+    so a timeline is one range scan of owner's entries plus the public posts.
+    """
+    class Reason(models.TextChoices):
+        OWN = 'own'
+        FRIENDS = 'friends'     # FRIENDS post of an author owner follows or is followed by
+
+    owner = models.ForeignKey(Author, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_entries')
+    # Copy of post.timestamp so the feed is ordered by its own index
+    timestamp = models.DateTimeField()
+    reason = models.CharField(max_length=10, choices=Reason.choices)
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [models.Index(fields=['owner', '-timestamp', '-post'], name='feed_owner_idx')]
+
+    def __str__(self):
+        return f'{self.post} in feed of {self.owner}'
+
+
+def author_identity(author):
+    """
+    (id, host) of a serialized author. Remote nodes send the id as a url, so it is reduced to the
+    trailing uuid (or taken from authorID) to match what local authors serialize to.
+    """
+    if not isinstance(author, dict):
+        return '', ''
+    author_id = str(author.get('authorID') or author.get('id') or '')
+    return author_id.strip().rstrip('/').rsplit('/', 1)[-1][:200], str(author.get('host') or '')[:200]
+
+
 class PostCategory(models.Model):
     name = models.CharField(max_length=50)
 
@@ -190,6 +477,9 @@ class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, related_name="comments")
     # author = models.ForeignKey(Author, on_delete=models.CASCADE, null=True, related_name="commenter")
     author = models.JSONField(null=True)
+    # Extracted from author on save, so comments can be filtered by who wrote them
+    author_id = models.CharField(max_length=200, blank=True)
+    author_host = models.CharField(max_length=200, blank=True)
 
     content = models.TextField(blank=True)
 
@@ -210,6 +500,11 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [models.Index(fields=['post', 'author_id'])]
+
+    def save(self, *args, **kwargs):
+        self.author_id, self.author_host = author_identity(self.author)
+        super().save(*args, **kwargs)
 
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
@@ -229,10 +524,17 @@ class Like(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     # author = models.ForeignKey(Author, on_delete=models.CASCADE, null=True)
     author = models.JSONField(null=True)
+    # Extracted from author on save, see author_identity
+    author_id = models.CharField(max_length=200, blank=True, db_index=True)
+    author_host = models.CharField(max_length=200, blank=True)
 
     class Meta:
         abstract = True
 
+    def save(self, *args, **kwargs):
+        self.author_id, self.author_host = author_identity(self.author)
+        super().save(*args, **kwargs)
+
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
     def type(self):
@@ -256,6 +558,12 @@ class CommentLike(Like):
     post_id = models.ForeignKey(Post, on_delete=models.CASCADE, null=True)
     comment_id = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['comment_id', 'author_id'], condition=~models.Q(author_id=''), name='unique_comment_like'),
+        ]
+        indexes = [models.Index(fields=['comment_id', 'author_id'], name='commentlike_comment_author_idx')]
+
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
 
     # Buggy
@@ -281,6 +589,12 @@ class CommentLike(Like):
 
 class PostLike(Like):
     post_id = models.ForeignKey(Post, on_delete=models.CASCADE, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post_id', 'author_id'], condition=~models.Q(author_id=''), name='unique_post_like'),
+        ]
+        indexes = [models.Index(fields=['post_id', 'author_id'], name='postlike_post_author_idx')]
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
     def object(self):
@@ -346,14 +660,41 @@ class PostLike(Like):
 
 
 class Inbox(models.Model):
-    follow_items = models.ManyToManyField('Search.FriendRequest', null=True, related_name="inbox_follows")
-    post_items = models.ManyToManyField(Post, null=True, related_name="inbox_posts")
-    post_like_items = models.ManyToManyField(PostLike, null=True, related_name="inbox_likes")
-
-
-    follow_items_cleared = models.ManyToManyField('Search.FriendRequest', null=True, related_name="inbox_follows_cleared")
-    post_items_cleared = models.ManyToManyField(Post, null=True, related_name="inbox_posts_cleared")
-    post_like_items_cleared = models.ManyToManyField(PostLike, null=True, related_name="inbox_likes_cleared")
+    follow_items = models.ManyToManyField('Search.FriendRequest', null=True, related_name="inbox_follows", through='InboxFollow')
+    post_items = models.ManyToManyField(Post, null=True, related_name="inbox_posts", through='InboxPost')
+    post_like_items = models.ManyToManyField(PostLike, null=True, related_name="inbox_likes", through='InboxLike')
+
+    # Items not cleared yet; kept by Profile.signals, recounted by manage.py reconcile_counters
+    unread_count = models.IntegerField(default=0)
+
+    def _entries(self, cleared):
+        # One filter() call, so the state is read from this inbox's own link rows
+        if cleared is None:
+            return {'inbox_entries__inbox': self}
+        return {'inbox_entries__inbox': self, 'inbox_entries__cleared_at__isnull': not cleared}
+
+    def posts(self, cleared=None):
+        """
+        Posts in this inbox, newest first: cleared=False for new ones, True for cleared ones, None for all.
+        """
+        return Post.objects.filter(**self._entries(cleared)).select_related('author__user').order_by('-timestamp')
+
+    def follows(self, cleared=None):
+        return self.follow_items.model.objects.filter(**self._entries(cleared)).select_related('sender__user')
+
+    def likes(self, cleared=None):
+        return PostLike.objects.filter(**self._entries(cleared))
+
+    def clear(self):
+        """
+        Mark everything in this inbox as cleared: one UPDATE per item table, no rows copied.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            for through in (InboxPost, InboxFollow, InboxLike):
+                through.objects.filter(inbox=self, cleared_at__isnull=True).update(cleared_at=now)
+            Inbox.objects.filter(pk=self.pk).update(unread_count=0)
+        self.unread_count = 0
 
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
@@ -364,3 +705,43 @@ class Inbox(models.Model):
     @type.setter
     def type(self, val):
         pass
+
+
+class InboxItem(models.Model):
+    """
+    Link between an inbox and one of its items. cleared_at is set when the owner clears their inbox;
+    the rows are kept so "Cleared" can still list them.
+    """
+    inbox = models.ForeignKey(Inbox, on_delete=models.CASCADE, related_name='+')
+    added = models.DateTimeField(default=timezone.now)
+    cleared_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+        indexes = [models.Index(fields=['inbox', 'cleared_at', '-added'], name='%(class)s_state_idx')]
+
+
+# These reuse the tables Django created for the plain many-to-many fields
+class InboxPost(InboxItem):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='inbox_entries')
+
+    class Meta(InboxItem.Meta):
+        db_table = 'Profile_inbox_post_items'
+        unique_together = ('inbox', 'post')
+
+
+class InboxFollow(InboxItem):
+    follow = models.ForeignKey('Search.FriendRequest', on_delete=models.CASCADE, related_name='inbox_entries',
+                               db_column='friendrequest_id')
+
+    class Meta(InboxItem.Meta):
+        db_table = 'Profile_inbox_follow_items'
+        unique_together = ('inbox', 'follow')
+
+
+class InboxLike(InboxItem):
+    like = models.ForeignKey(PostLike, on_delete=models.CASCADE, related_name='inbox_entries', db_column='postlike_id')
+
+    class Meta(InboxItem.Meta):
+        db_table = 'Profile_inbox_post_like_items'
+        unique_together = ('inbox', 'like')
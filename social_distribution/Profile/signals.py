@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import Author, Inbox
+from api import outbox
+from .models import Author, Comment, FeedEntry, Inbox, InboxFollow, InboxLike, InboxPost, Post, PostLike
+from . import images
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -23,3 +26,97 @@ def create_user_profile(sender, instance, created, **kwargs):
 		author.inbox = inbox
 
 		author.save()
+
+
+def counted(sender, instance):
+	# (post id, counter) a like or comment counts towards
+	if sender is PostLike:
+		return instance.post_id_id, 'likes_count'
+	return instance.post_id, 'comments_count'
+
+@receiver(post_save, sender=PostLike)
+@receiver(post_save, sender=Comment)
+def count_added(sender, instance, created, **kwargs):
+	"""
+	Keep Post.likes_count / Post.comments_count in step with new likes and comments.
+	"""
+	post_id, field = counted(sender, instance)
+	if created and post_id is not None:
+		Post.adjust_counter(post_id, field, 1)
+
+@receiver(post_delete, sender=PostLike)
+@receiver(post_delete, sender=Comment)
+def count_removed(sender, instance, **kwargs):
+	# When the post itself is being deleted this updates nothing
+	post_id, field = counted(sender, instance)
+	if post_id is not None:
+		Post.adjust_counter(post_id, field, -1)
+
+
+@receiver(pre_save, sender=Post)
+def store_embedded_image(sender, instance, raw=False, **kwargs):
+	"""
+	Move a "data:image/...;base64," body (from the api, a shared remote post, ...) into the image store.
+	Identical images end up as one file and one Image.
+	"""
+	if raw or 'content' in instance.get_deferred_fields():
+		return
+	if instance.contentType not in (Post.ContentType.PNG, Post.ContentType.JPEG) or not instance.content.startswith('data:'):
+		return
+	try:
+		data = images.decode_data_url(instance.content)
+	except ValueError:
+		return
+	instance.image = images.store([data])
+	instance.content = ''
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, raw=False, **kwargs):
+	"""
+	Write a new or edited post into the feeds of everyone who may see it, see FeedEntry.
+	"""
+	if not raw:
+		FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def deliver_to_recipient(sender, instance, created, raw=False, **kwargs):
+	# Posts sent to one author (private posts, posts from remote nodes) go to their inbox
+	if created and not raw and instance.to_author_id is not None:
+		instance.inbox_posts.add(*Inbox.objects.filter(inbox=instance.to_author_id))
+
+@receiver(m2m_changed, sender=InboxPost)
+@receiver(m2m_changed, sender=InboxFollow)
+@receiver(m2m_changed, sender=InboxLike)
+def count_unread(sender, instance, action, reverse, pk_set, **kwargs):
+	"""
+	Keep Inbox.unread_count in step with items added through inbox.*_items.add() or item.inbox_*.add().
+	pk_set only holds the links that did not exist yet.
+	"""
+	if action != 'post_add' or not pk_set:
+		return
+	if reverse:
+		Inbox.objects.filter(pk__in=pk_set).update(unread_count=F('unread_count') + 1)
+	else:
+		Inbox.objects.filter(pk=instance.pk).update(unread_count=F('unread_count') + len(pk_set))
+
+@receiver(post_delete, sender=InboxPost)
+@receiver(post_delete, sender=InboxFollow)
+@receiver(post_delete, sender=InboxLike)
+def uncount_unread(sender, instance, **kwargs):
+	if instance.cleared_at is None:
+		Inbox.objects.filter(pk=instance.inbox_id, unread_count__gt=0).update(unread_count=F('unread_count') - 1)
+
+
+@receiver(outbox.delivered)
+def record_remote_follow(sender, item, **kwargs):
+	"""
+	A remote node accepted a follow request from a local author: only now does the author follow the recipient.
+	"""
+	actor = item.payload.get('actor')
+	if item.payload.get('type') != 'follow' or not isinstance(actor, dict):
+		return
+	author = Author.objects.filter(id=actor.get('authorID')).first()
+	if author is not None:
+		author.follow_remote(item.recipient)
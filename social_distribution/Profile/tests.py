@@ -1,7 +1,24 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, RequestFactory
 from django.urls import reverse, resolve
-from django.contrib.auth.models import User
-from .models import Post, Author
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from Search.models import FriendRequest
+from django.utils import timezone
+from api.models import Connection, OutboxItem, RemoteAuthor, RemotePost
+from .models import Post, Author, Comment, FeedEntry, Follow, Image, Inbox, InboxPost, PostLike, RemoteFollow
+from . import images, timeline
+from .middleware import CurrentAuthorMiddleware
+from api import directory, outbox, plain, routing
+from base64 import b64encode
+from datetime import timedelta
+from io import StringIO
+import os
+import tempfile
+from unittest import mock
 import uuid
 
 class ViewPostTests(TestCase):
@@ -20,6 +37,17 @@ class ViewPostTests(TestCase):
         self.assertEqual(response.status_code, 200, 'Correct author ID and post ID should return 200')
         self.assertEqual(response.context['post'], self.post1, msg='Incorrect post displayed')
 
+    def test_anonymous_listing(self):
+        self.setup()
+        Post.objects.create(title='Unlisted', author=self.author1, unlisted=True)
+        url = reverse('Profile:view_posts', kwargs={'author_id': self.author1.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post.title for post in response.context['posts']], ['Test Post 1'])
+
+        self.client.force_login(self.user1)
+        self.assertEqual(len(self.client.get(url).context['posts']), 2, 'The owner sees their unlisted posts')
+
     def test_wrong_author(self):
         self.setup()
         response = self.client.get(reverse('Profile:view_post', kwargs={'author_id':self.author2.id, 'post_id':self.post1.id}))
@@ -145,6 +173,35 @@ class TestNewPost(TestCase):
         self.assertEqual(post.content, 'New post content')
         self.assertEqual(post.author, self.author1)
 
+    def test_friends_post_goes_to_remote_friends(self):
+        self.setup()
+        self.login()
+        self.author1.follow_remote('friend')
+        self.author1.add_remote_follower('friend')
+        self.author1.follow_remote('followed')
+
+        self.client.post(reverse('Profile:new_post'), data={
+            'title': 'Friends only', 'contentType': 'text/plain', 'content': 'hi', 'visibility': 'FRIENDS'})
+        self.assertEqual(list(OutboxItem.objects.values_list('recipient', flat=True)), ['friend'])
+
+    def test_private_post_to_remote_author(self):
+        self.setup()
+        self.login()
+        conn = Connection.objects.create(name='remote', url='http://remote/')
+        routing.learn('known', conn)
+        data = {'title': 'DM', 'contentType': 'text/plain', 'content': 'hi', 'visibility': 'PRIVATE'}
+
+        with mock.patch('api.federation.requests.Session.request', return_value=mock.Mock(status_code=404)):
+            response = self.client.post(reverse('Profile:private_post', kwargs={'author_id': 'nobody'}), data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.exists(), 'A DM nobody can receive should not be kept')
+        self.assertFalse(OutboxItem.objects.exists())
+
+        response = self.client.post(reverse('Profile:private_post', kwargs={'author_id': 'known'}), data=data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.get().to_remote_author_id, 'known')
+        self.assertEqual(OutboxItem.objects.get().connection, conn)
+
 class TestDeletePost(TestCase):
     def setup(self):
         self.client = Client()
@@ -224,4 +281,475 @@ class TestFriendRequest(TestCase):
         )
 
         self.assertEqual((set(self.author1.friends.all())), set([self.author2]))
-        self.assertEqual((set(self.author2.friends.all())), set([self.author1]))
\ No newline at end of file
+        self.assertEqual((set(self.author2.friends.all())), set([self.author1]))
+
+class TestRemoteFollow(TestCase):
+    def setup(self):
+        self.client = Client()
+        self.user1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author1 = self.user1.author
+        self.client.force_login(self.user1)
+
+    def test_remote_friends(self):
+        self.setup()
+        self.author1.follow_remote('a')
+        self.author1.follow_remote('b')
+        self.author1.follow_remote('a')
+        self.author1.add_remote_follower('b')
+        self.author1.add_remote_follower('c')
+
+        self.assertEqual(sorted(self.author1.remote_following), ['a', 'b'])
+        self.assertEqual(self.author1.remote_friends, ['b'])
+        self.assertTrue(self.author1.is_followed_by_remote('c'))
+        self.assertFalse(self.author1.is_following_remote('c'))
+        self.assertEqual(RemoteFollow.objects.count(), 4, 'Repeated follows should not add rows')
+
+    def test_unfollow_remote(self):
+        self.setup()
+        self.author1.follow_remote('a')
+        self.author1.follow_remote('ab')
+        self.client.get(reverse('Profile:unfollow', kwargs={'author_id':'a'}))
+        self.assertEqual(self.author1.remote_following, ['ab'])
+
+    def test_follow_recorded_on_delivery(self):
+        self.setup()
+        Connection.objects.create(name='localhost', url='http://localhost/')
+        conn = Connection.objects.create(name='remote', url='http://remote/')
+        for remote_id in ('ok', 'rejects'):
+            RemoteAuthor.objects.create(connection=conn, remote_id=remote_id, displayName=remote_id, data={'id': remote_id, 'displayName': remote_id})
+
+        for remote_id in ('ok', 'rejects', 'nobody'):
+            self.client.get(reverse('Profile:follow', kwargs={'author_id': remote_id}))
+        self.assertEqual(self.author1.remote_following, [], 'Nothing is recorded before delivery')
+
+        def inbox(method, url, **kwargs):
+            return mock.Mock(status_code=400 if '/rejects/' in url else 201)
+
+        with mock.patch('api.federation.requests.Session.request', side_effect=inbox):
+            outbox.deliver(outbox.claim('w1'))
+        self.assertEqual(self.author1.remote_following, ['ok'])
+
+
+class TestFollow(TestCase):
+    def setup(self):
+        self.author1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True).author
+        self.author2 = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+        self.author3 = User.objects.create_user('test3', 'test3@gmail.com', 'pwd', is_active=True).author
+
+    def test_mutual_follow(self):
+        self.setup()
+        Follow.objects.follow(self.author1, self.author2)
+        Follow.objects.follow(self.author1, self.author3)
+        self.assertEqual(list(self.author1.friends), [])
+        self.assertEqual(set(self.author2.followers.all()), set([self.author1]))
+
+        Follow.objects.follow(self.author2, self.author1)
+        Follow.objects.follow(self.author2, self.author1)
+        self.assertEqual(list(self.author1.friends), [self.author2])
+        self.assertEqual(list(Follow.objects.friends_of(self.author2)), [self.author1])
+        self.assertEqual(Follow.objects.filter(is_mutual=True).count(), 2, 'Both edges of the pair should be mutual')
+
+    def test_unfollow_clears_mutual(self):
+        self.setup()
+        Follow.objects.follow(self.author1, self.author2)
+        Follow.objects.follow(self.author2, self.author1)
+        self.assertTrue(Follow.objects.unfollow(self.author2, self.author1))
+        self.assertFalse(Follow.objects.unfollow(self.author2, self.author1))
+        self.assertEqual(list(self.author1.friends), [])
+        self.assertFalse(Follow.objects.get(src=self.author1, dst=self.author2).is_mutual)
+
+
+class TestCommentVisibility(TestCase):
+    def setup(self):
+        self.client = Client()
+        self.user1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.user2 = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True)
+        self.author1 = self.user1.author
+        self.author2 = self.user2.author
+        self.post = Post.objects.create(title='Friends only', author=self.author2, visibility='FRIENDS')
+        self.client.force_login(self.user1)
+
+    def test_friends_post_comments(self):
+        self.setup()
+        mine = Comment.objects.create(post=self.post, author={'id': str(self.author1.id)}, content='mine')
+        Comment.objects.create(post=self.post, author={'id': 'https://remote.example/author/other'}, content='theirs')
+        self.assertEqual(mine.author_id, str(self.author1.id))
+
+        response = self.client.get(reverse('Profile:view_post', kwargs={'author_id':self.author2.id, 'post_id':self.post.id}))
+        self.assertEqual(list(response.context['comments']), [mine])
+
+    def test_like_toggles(self):
+        self.setup()
+        url = reverse('Profile:like', kwargs={'author_id':self.author2.id, 'post_id':self.post.id})
+        self.client.get(url)
+        self.assertEqual(list(PostLike.objects.values_list('author_id', flat=True)), [str(self.author1.id)])
+        self.client.get(url)
+        self.assertEqual(PostLike.objects.count(), 0)
+
+
+class TestCounters(TestCase):
+    def setup(self):
+        self.author1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True).author
+        self.post = Post.objects.create(title='Counted', content='x' * 1000, author=self.author1)
+
+    def test_counters_follow_likes_and_comments(self):
+        self.setup()
+        like = PostLike.objects.create(post_id=self.post, author={'id': 'a'})
+        PostLike.objects.create(post_id=self.post, author={'id': 'b'})
+        Comment.objects.create(post=self.post, author={'id': 'a'}, content='hi')
+        like.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 1))
+
+    def test_reconcile_counters(self):
+        self.setup()
+        PostLike.objects.create(post_id=self.post, author={'id': 'a'})
+        Post.objects.filter(pk=self.post.pk).update(likes_count=7, comments_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.likes_count, self.post.comments_count), (1, 0))
+
+
+class TestFeed(TestCase):
+    def setup(self):
+        self.author1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True).author
+        self.author2 = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+        self.author3 = User.objects.create_user('test3', 'test3@gmail.com', 'pwd', is_active=True).author
+
+    def feed(self, author):
+        return set(FeedEntry.objects.filter(owner=author).values_list('post__title', 'reason'))
+
+    def test_fan_out_on_write(self):
+        self.setup()
+        Follow.objects.follow(self.author1, self.author2)
+        Post.objects.create(title='friends', author=self.author2, visibility='FRIENDS')
+        Post.objects.create(title='public', author=self.author2)
+        Post.objects.create(title='private', author=self.author3, visibility='PRIVATE', to_author=self.author1)
+        self.assertEqual(self.feed(self.author1), {('friends', 'friends')}, 'Private posts stay in the inbox')
+        self.assertEqual(self.feed(self.author2), {('friends', 'own')})
+        self.assertEqual(self.feed(self.author3), {('private', 'own')})
+
+        post = Post.objects.get(title='friends')
+        post.visibility = 'PUBLIC'
+        post.save()
+        self.assertEqual(self.feed(self.author1), set())
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        self.setup()
+        Post.objects.create(title='two', author=self.author2, visibility='FRIENDS')
+        Post.objects.create(title='one', author=self.author1, visibility='FRIENDS')
+        Follow.objects.follow(self.author1, self.author2)
+        self.assertEqual(self.feed(self.author1), {('one', 'own'), ('two', 'friends')})
+        self.assertEqual(self.feed(self.author2), {('two', 'own'), ('one', 'friends')})
+
+        Follow.objects.follow(self.author2, self.author1)
+        Follow.objects.unfollow(self.author1, self.author2)
+        self.assertIn(('two', 'friends'), self.feed(self.author1), 'author2 still follows author1')
+        Follow.objects.unfollow(self.author2, self.author1)
+        self.assertEqual(self.feed(self.author1), {('one', 'own')})
+        self.assertEqual(self.feed(self.author2), {('two', 'own')})
+
+    def test_rebuild(self):
+        self.setup()
+        Follow.objects.follow(self.author1, self.author2)
+        Post.objects.create(title='friends', author=self.author2, visibility='FRIENDS')
+        Post.objects.create(title='private', author=self.author3, visibility='PRIVATE', to_author=self.author1)
+        expected = set(FeedEntry.objects.values_list('owner', 'post', 'reason'))
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(set(FeedEntry.objects.values_list('owner', 'post', 'reason')), expected)
+
+
+class TestInboxState(TestCase):
+    def setup(self):
+        self.client = Client()
+        self.user1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author1 = self.user1.author
+        self.author2 = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+
+    def unread(self):
+        return Inbox.objects.get(pk=self.author1.inbox.pk).unread_count
+
+    def titles(self, option):
+        response = self.client.get(reverse('Profile:inbox'), {'inbox_option': option})
+        return [post.title for post in response.context['posts']]
+
+    def test_unread_count(self):
+        self.setup()
+        shared = Post.objects.create(title='shared', author=self.author2)
+        self.author1.inbox.post_items.add(shared)
+        Post.objects.create(title='private', author=self.author2, visibility='PRIVATE', to_author=self.author1)
+        like = PostLike.objects.create(post_id=shared, author={'id': 'a'})
+        self.author1.inbox.post_like_items.add(like)
+        self.assertEqual(self.unread(), 3)
+
+        shared.delete()
+        self.assertEqual(self.unread(), 1, 'Deleting a post takes it and its likes out of the inbox')
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.unread(), 1)
+
+    def test_clear(self):
+        self.setup()
+        self.client.force_login(self.user1)
+        Post.objects.create(title='old', author=self.author2, visibility='PRIVATE', to_author=self.author1)
+        self.client.post(reverse('Profile:inbox'), {'clear_signal': 'clear'})
+        self.assertEqual(self.unread(), 0)
+        self.assertIsNotNone(InboxPost.objects.get(post__title='old').cleared_at)
+
+        Post.objects.create(title='new', author=self.author2, visibility='PRIVATE', to_author=self.author1)
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(self.titles('New'), ['new'])
+        self.assertEqual(self.titles('Cleared'), ['old'])
+        self.assertEqual(self.titles('All'), ['new', 'old'])
+
+
+class TestPostBodies(TestCase):
+    def test_deferred_bodies(self):
+        author = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True).author
+        sender = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+        Post.objects.create(title='private', author=sender, visibility='PRIVATE', to_author=author, content='x' * 10000)
+        self.assertEqual(author.inbox.posts().get().get_deferred_fields(), set(), 'The inbox shows every body it reads')
+        post = Post.objects.without_body().get()
+        self.assertTrue({'content', 'description'} <= post.get_deferred_fields())
+        post.title = 'renamed'
+        post.save()
+        self.assertIn('content', post.get_deferred_fields(), 'Saving the title should not load the body')
+        self.assertEqual(Post.objects.get(pk=post.pk).content, 'x' * 10000)
+
+    def test_timeline_loads_shown_bodies(self):
+        author = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True).author
+        for i in range(5):
+            Post.objects.create(title=f'public {i}', author=author, content=f'public body {i}')
+            Post.objects.create(title=f'own {i}', author=author, visibility='FRIENDS', content=f'own body {i}')
+        queries = []
+
+        def capture(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            posts, _ = timeline.page(author, size=4)
+            bodies = [post.content for post in posts]
+        self.assertEqual(len(queries), 4, 'Three sources, then one query for the bodies of the page')
+        self.assertEqual(sorted(bodies), ['own body 3', 'own body 4', 'public body 3', 'public body 4'])
+        self.assertNotIn('"content"', queries[0] + queries[1], 'Rows read past the page should not carry bodies')
+
+
+class TestImages(TestCase):
+    def setup(self):
+        self.client = Client()
+        self.user = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author = self.user.author
+        self.client.force_login(self.user)
+        self.data = b'\x89PNG' + bytes(range(256)) * 4
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch.object(images, 'storage', FileSystemStorage(location=root.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self):
+        self.client.post(reverse('Profile:new_image_post'), {
+            'title': 'image', 'visibility': 'PUBLIC',
+            'image': SimpleUploadedFile('image.png', self.data, content_type='image/png'),
+        })
+        return Post.objects.get(title='image')
+
+    def test_upload_and_serve(self):
+        self.setup()
+        post = self.upload()
+        self.assertEqual(post.content, '')
+        with images.storage.open(images.name(post.image_id), 'rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+        url = reverse('Profile:view_post', kwargs={'author_id': self.author.id, 'post_id': post.id})
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['ETag'], '"' + post.image_id + '"')
+        self.assertIn('max-age', response['Cache-Control'])
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        partial = self.client.get(url, HTTP_RANGE='bytes=4-7')
+        self.assertEqual(partial.status_code, 206)
+        self.assertEqual(b''.join(partial.streaming_content), self.data[4:8])
+        self.assertEqual(partial['Content-Range'], f'bytes 4-7/{len(self.data)}')
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(self.data)}-').status_code, 416)
+
+    def test_federation_body_and_dedupe(self):
+        self.setup()
+        post = self.upload()
+        body = 'data:image/png;base64,' + b64encode(self.data).decode('ascii')
+        self.assertEqual(plain.post(post, plain.Context())['content'], body)
+
+        # The same bytes arriving as a spec body, e.g. a shared remote post
+        copy = Post.objects.create(title='copy', author=self.author, contentType=Post.ContentType.PNG, content=body)
+        self.assertEqual((copy.image_id, copy.content), (post.image_id, ''))
+        self.client.post(reverse('Profile:share_post', kwargs={'author_id': self.author.id, 'post_id': post.id}), {
+            'title': 'shared', 'contentType': Post.ContentType.PNG, 'visibility': 'PUBLIC',
+        })
+        self.assertEqual(Post.objects.get(title='shared').image_id, post.image_id)
+        self.assertEqual(Image.objects.count(), 1)
+        self.assertEqual(images.storage.listdir('images/' + post.image_id[:2])[1], [post.image_id])
+
+        Post.objects.all().delete()
+        self.assertEqual(images.prune(), 1)
+        self.assertFalse(images.storage.exists(images.name(post.image_id)))
+
+    def test_only_small_data_urls_cached(self):
+        self.setup()
+        post = self.upload()
+        body = 'data:image/png;base64,' + b64encode(self.data).decode('ascii')
+        cache.clear()
+        # Reads that don't end on a 3-byte boundary still join into one base64 string
+        with mock.patch.object(images, 'CHUNK_SIZE', 7), mock.patch.object(images, 'DATA_URL_CACHE_MAX', len(self.data) - 1):
+            self.assertEqual(images.data_url(post.image_id, post.contentType), body)
+        self.assertIsNone(cache.get('image-base64:' + post.image_id))
+        self.assertEqual(images.data_url(post.image_id, post.contentType), body)
+        self.assertIsNotNone(cache.get('image-base64:' + post.image_id))
+
+    def test_bodies_kept_until_checked(self):
+        self.setup()
+        body = 'data:image/png;base64,' + b64encode(self.data).decode('ascii')
+        post = Post.objects.create(title='moved', author=self.author, contentType=Post.ContentType.PNG, content=body)
+        # As migration 0050 leaves a post: linked to its image, body still there
+        Post.objects.filter(pk=post.pk).update(content=body)
+        images.storage.delete(images.name(post.image_id))
+        cache.clear()
+
+        url = reverse('Profile:view_post', kwargs={'author_id': self.author.id, 'post_id': post.id})
+        self.assertEqual(self.client.get(url).content, self.data, 'A missing stored copy falls back to the body')
+        out = StringIO()
+        call_command('clear_image_bodies', stdout=out)
+        self.assertIn('0 bodies cleared, 1 kept', out.getvalue())
+
+        images.store([self.data])
+        call_command('clear_image_bodies', stdout=StringIO())
+        self.assertEqual(Post.objects.get(pk=post.pk).content, '')
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), self.data)
+
+
+class TestCurrentAuthor(TestCase):
+    def setup(self):
+        self.user = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author = self.user.author
+
+    def resolve(self, user, view):
+        request = RequestFactory().get('/')
+        request.user = user
+        return CurrentAuthorMiddleware(view)(request)
+
+    def test_resolved_once(self):
+        self.setup()
+        user = User.objects.get(pk=self.user.pk)
+
+        def view(request):
+            # One query for the author and its inbox, however often the view and its templates ask
+            with self.assertNumQueries(1):
+                return (request.author.id, request.author.inbox.id, request.author.displayName,
+                        request.user.author.id, request.author.id)
+        self.assertEqual(self.resolve(user, view), (self.author.id, self.author.inbox.id, 'test1',
+                                                    self.author.id, self.author.id))
+
+    def test_no_local_author(self):
+        self.setup()
+        remote = Connection.objects.create(name='remote', url='http://remote/')
+        for user in (AnonymousUser(), remote):
+            with self.assertNumQueries(0):
+                self.assertFalse(self.resolve(user, lambda request: bool(request.author)))
+
+        self.client.login(username='test1', password='pwd')
+        self.assertEqual(self.client.get(reverse('Profile:home')).wsgi_request.author, self.author)
+
+
+class TestTimeline(TestCase):
+    def setup(self):
+        self.client = Client()
+        self.user1 = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author1 = self.user1.author
+        self.author2 = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+        self.author3 = User.objects.create_user('test3', 'test3@gmail.com', 'pwd', is_active=True).author
+        Follow.objects.follow(self.author1, self.author2)
+
+        now = timezone.now()
+        def post(title, author, visibility='PUBLIC', minutes=0):
+            return Post.objects.create(title=title, author=author, visibility=visibility, timestamp=now - timedelta(minutes=minutes))
+        post('public', self.author3, minutes=1)
+        post('followed friends', self.author2, 'FRIENDS', minutes=3)
+        post('own private', self.author1, 'PRIVATE', minutes=5)
+        post('stranger friends', self.author3, 'FRIENDS', minutes=2)
+        post('stranger private', self.author3, 'PRIVATE', minutes=2)
+        # Sent to author1: their inbox, not their timeline
+        Post.objects.create(title='sent', author=self.author3, visibility='PRIVATE', to_author=self.author1,
+                            timestamp=now - timedelta(minutes=1))
+
+        # As federation_worker mirrors them; the home page only reads the mirror
+        self.conn = Connection.objects.create(name='remote', url='http://remote/', authors_synced=now, posts_synced=now)
+        for i, minutes in enumerate((0, 2, 4)):
+            RemotePost.objects.create(connection=self.conn, remote_id=f'r{i}', author_id='ra', timestamp=now - timedelta(minutes=minutes),
+                                      data={'title': f'remote {i}', 'author': {'displayName': 'remote'}, 'content': 'hi', 'contentType': 'text/plain'})
+        self.expected = ['remote 0', 'public', 'remote 1', 'followed friends', 'remote 2', 'own private']
+
+    def test_pages_merge_local_and_remote(self):
+        self.setup()
+        titles, cursor = [], None
+        while True:
+            posts, cursor = timeline.page(self.author1, cursor, size=2)
+            titles += [p.title for p in posts]
+            if cursor is None:
+                break
+        self.assertEqual(titles, self.expected)
+
+    def test_home_and_infinite_scroll(self):
+        self.setup()
+        self.client.force_login(self.user1)
+        with mock.patch.object(timeline, 'PAGE_SIZE', 4):
+            home = self.client.get(reverse('Profile:home'))
+        self.assertEqual(home.status_code, 200)
+        self.assertEqual([p.title for p in home.context['posts']], self.expected[:4])
+        self.assertEqual(home.context['posts'][0].author.displayName, 'remote')
+
+        more = self.client.get(reverse('Profile:timeline'), {'cursor': home.context['next_cursor']})
+        self.assertEqual([p.title for p in more.context['posts']], self.expected[4:])
+        self.assertIsNone(more.context['next_cursor'])
+        self.assertEqual(self.client.get(reverse('Profile:timeline'), {'cursor': 'junk'}).status_code, 404)
+
+
+class TestQueryPlans(TestCase):
+    """
+    The timeline, listing and inbox queries should be served by an index, not a table scan.
+    """
+    def hot_queries(self):
+        author = uuid.uuid4()
+        return [
+            ('home public', Post.objects.filter(visibility='PUBLIC', unlisted=False).order_by('-timestamp'), True),
+            ('home friends', Post.objects.filter(visibility='FRIENDS', unlisted=False).filter(author__in=[author]).order_by('-timestamp'), True),
+            ('own posts', Post.objects.filter(author=author, unlisted=False).order_by('-timestamp'), True),
+            ('api posts', Post.objects.filter(author__id=author, visibility='PUBLIC', unlisted=False).order_by('-timestamp'), True),
+            ('inbox', Post.objects.filter(to_author=author).order_by('-timestamp'), True),
+            ('inbox state', InboxPost.objects.filter(inbox=1, cleared_at__isnull=True).order_by('-added'), True),
+            ('friend requests', FriendRequest.objects.filter(receiver_id=author, sender_id=author), False),
+            ('liked', PostLike.objects.filter(post_id=uuid.uuid4(), author_id=str(author)), False),
+            ('feed', FeedEntry.objects.filter(owner=author).order_by('-timestamp', '-post'), True),
+            ('remote timeline', RemotePost.objects.filter(timestamp__lte=timezone.now()).order_by('-timestamp', '-remote_id'), True),
+            ('remote author search', RemoteAuthor.objects.filter(directory.prefix('search_name', 'ali')), False),
+        ]
+
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Empty test tables are cheaper to scan; make the planner show whether an index is usable
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest('No plan expectations for ' + connection.vendor)
+
+        for name, queryset, ordered in self.hot_queries():
+            plan = queryset.explain()
+            if connection.vendor == 'sqlite':
+                self.assertIn('USING', plan, f'{name} should use an index:\n{plan}')
+                self.assertNotRegex(plan, r'(?m)SCAN \w+$', f'{name} should not scan the table:\n{plan}')
+                if ordered:
+                    self.assertNotIn('TEMP B-TREE', plan, f'{name} should be ordered by its index:\n{plan}')
+            else:
+                self.assertIn('Index', plan, f'{name} should use an index:\n{plan}')
+                self.assertNotIn('Seq Scan', plan, f'{name} should not scan the table:\n{plan}')
@@ -0,0 +1,115 @@
+"""
+Home timeline: public posts, the viewer's FeedEntry rows and the mirrored public posts of remote nodes,
+merged newest first, one page at a time.
+"""
+import base64
+import heapq
+import json
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from api.models import RemotePost
+from .models import Author, FeedEntry, Post, PostQuerySet
+
+
+PAGE_SIZE = getattr(settings, 'TIMELINE_PAGE_SIZE', 20)
+
+# Breaks timestamp ties between the two sources: local posts come first
+LOCAL, REMOTE = 1, 0
+
+
+def public_posts():
+    return Post.objects.filter(visibility=Post.Visibility.PUBLIC, unlisted=False)
+
+
+def feed(author):
+    """
+    The non-public posts on author's timeline (their own, and FRIENDS posts of the authors they follow or
+    are followed by), as FeedEntry rows. Posts sent to author are read from their inbox instead.
+    """
+    return FeedEntry.objects.filter(owner=author)
+
+
+def as_post(remote):
+    """
+    Unsaved Post standing in for a RemotePost, so templates treat both alike.
+    """
+    item = remote.data
+    author = item.get('author') if isinstance(item.get('author'), dict) else {}
+    return Post(
+        id=remote.remote_id,
+        author=Author(id=remote.author_id, remote_username=author.get('displayName', '')),
+        timestamp=remote.timestamp,
+        title=item.get('title', ''),
+        content=item.get('content', ''),
+        contentType=str(item.get('contentType', '')).split(';')[0],
+    )
+
+
+def _encode(timestamp, source, post_id):
+    data = json.dumps([timestamp.isoformat(), source, str(post_id)])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _decode(cursor):
+    try:
+        timestamp, source, post_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        timestamp = parse_datetime(timestamp)
+        if source == LOCAL:
+            post_id = uuid.UUID(post_id)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError('Invalid cursor')
+    if timestamp is None or source not in (LOCAL, REMOTE):
+        raise ValueError('Invalid cursor')
+    return timestamp, source, post_id
+
+
+def page(author, cursor=None, size=None):
+    """
+    One page of author's timeline.
+    Parameters
+    ----------
+    author: the viewer
+    cursor: the next value of the previous page, or None for the newest posts
+    size: posts per page, TIMELINE_PAGE_SIZE by default
+    Returns
+    -------
+    (posts, next cursor or None). Remote posts are unsaved Posts, see as_post.
+    Raises ValueError for a cursor that was not made by this function.
+    """
+    size = size or PAGE_SIZE
+    # Up to three pages are read to fill one; bodies are only loaded for the posts that make the page
+    public = public_posts().without_body().select_related('author__user').order_by('-timestamp', '-id')
+    own = feed(author).select_related('post__author__user').defer(*('post__' + field for field in PostQuerySet.BODY)) \
+        .order_by('-timestamp', '-post')
+    remote = RemotePost.objects.order_by('-timestamp', '-remote_id')
+    if cursor:
+        timestamp, source, post_id = _decode(cursor)
+        if source == LOCAL:
+            public = public.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=post_id))
+            own = own.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, post__lt=post_id))
+            remote = remote.filter(timestamp__lte=timestamp)
+        else:
+            public = public.filter(timestamp__lt=timestamp)
+            own = own.filter(timestamp__lt=timestamp)
+            remote = remote.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, remote_id__lt=post_id))
+
+    # Each source is read one page deep; merging them keeps the page in timestamp order.
+    # Feeds hold no public posts, so the local sources never overlap.
+    merged = heapq.merge(((post.timestamp, LOCAL, str(post.id), post) for post in public[:size + 1]),
+                         ((entry.timestamp, LOCAL, str(entry.post_id), entry.post) for entry in own[:size + 1]),
+                         ((post.timestamp, REMOTE, post.remote_id, post) for post in remote[:size + 1]),
+                         key=lambda entry: entry[:3], reverse=True)
+    entries = list(islice(merged, size + 1))
+
+    next_cursor = None
+    if len(entries) > size:
+        entries = entries[:size]
+        next_cursor = _encode(*entries[-1][:3])
+    Post.objects.fill_bodies([post for _, source, _, post in entries if source == LOCAL])
+    posts = [post if source == LOCAL else as_post(post) for _, source, _, post in entries]
+    return posts, next_cursor
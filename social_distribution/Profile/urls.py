@@ -9,6 +9,7 @@ app_name = 'Profile'
 
 urlpatterns = [
     url(r'^$', Profile_views.home, name='home'), #homepage
+    path('timeline', Profile_views.home_timeline, name='timeline'), # next page of the homepage, for infinite scroll
     url(r'^login/$', auth_views.LoginView.as_view(template_name='profile/login.html'), name='login'), #login page, use the default view from django
     url(r'^logout/$', auth_views.LogoutView.as_view(next_page='Profile:login'), name='logout'), #logout will direct to the login page
     url(r'^signup/$', Profile_views.signup, name='signup'), #signup
@@ -1,15 +1,16 @@
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth import login, authenticate
 from django.db.models.query import InstanceCheckMeta
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.views import generic
-from django.http import HttpResponseForbidden, HttpResponse
+from django.http import HttpResponseForbidden, HttpResponse, HttpResponseNotFound
 from django.forms import ModelForm
 from django.views.decorators.cache import cache_page
 from django.core.serializers import serialize
-from base64 import b64encode, b64decode
+from base64 import b64decode
 import commonmark, requests, ast, json
 
 from django.db.models import Q
@@ -18,16 +19,45 @@ from django.http import HttpResponseRedirect
 
 from .forms import UserForm, AuthorForm, SignUpForm, PostForm, ImagePostForm, CommentForm
 
-from .models import Author, Post, CommentLike, PostLike, Inbox
+from .models import Author, Follow, Post, CommentLike, PostLike, Inbox
 from Search.models import FriendRequest
 from api.models import Connection
 from api.serializers import AuthorSerializer, PostSerializer
+from api import directory, federation, outbox, routing
 
 from .helpers import timestamp_beautify
+from . import images, timeline
 
-DEFAULT_HEADERS = {'Referer': 'https://team3-socialdistribution.herokuapp.com/', 'Mode': 'no-cors'}
 TEAM3_URL = "https://team3-socialdistribution.herokuapp.com/"
 
+def remote_post_body(author, post, visibility):
+	"""
+	Inbox payload for sending one of our posts to a remote author.
+	"""
+	return {
+		"type": "post",
+		"title": post.title,
+		"id": f"{post.id}",
+		"source": post.source,
+		"origin": post.origin,
+		"description": post.origin,
+		"contentType": post.contentType,
+		"author": {
+			"type": "author",
+			"id": str(author.id),
+			"authorID": str(author.id),
+			"host": TEAM3_URL,
+			"displayName": author.displayName,
+			"url": f"{TEAM3_URL}author/{author.id}",
+			"github": f"https://github.com/{author.github}/"
+		},
+		"categories": [category.name for category in post.categories.all()],
+		"comments": f"{TEAM3_URL}author/{author.id}/posts/{post.id}/comments",
+		"published": str(post.timestamp),
+		"visibility": visibility,
+		"unlisted": False
+	}
+
 # Create your views here.
 
 @login_required(login_url='/login/')
@@ -40,63 +70,25 @@ def home(request):
 	-------
 	Render to the home.html
 	"""
-	# Grab all public posts
-	public_posts = Post.objects.filter(visibility='PUBLIC', unlisted=False).order_by('-timestamp')
-
-	# Grab self posts
-	self_posts = Post.objects.filter(author=request.user.author, unlisted=False).order_by('-timestamp')
-
-	# Grab posts from those who are your friends
-	author = Author.objects.get(user__username=request.user.username)
-	friends = author.following.all() & author.followers.all()
-
-	followers = author.followers.all()
-	following = author.following.all()
-
-	follower_posts = Post.objects.filter(visibility='FRIENDS', unlisted=False).filter(author__in=followers).order_by('-timestamp')
-	following_posts = Post.objects.filter(visibility='FRIENDS', unlisted=False).filter(author__in=following).order_by('-timestamp')
+	posts, next_cursor = timeline.page(request.author)
+	return render(request, 'profile/home.html', {'posts': posts, 'next_cursor': next_cursor})
 
-	# Merge posts, sort them
-	local_posts = public_posts | self_posts | follower_posts | following_posts
-
-	posts = []
-	posts.append(local_posts)
-
-	# TODO: Grabbing remote friends posts.
-	remote_posts = []
-
-	for connection in Connection.objects.all():
-		if connection.name == 'localhost':
-			pass
-		else:
-			url = connection.url + 'service/authors/'
-			response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-			if response.status_code == 200:
-				for author in response.json()['items']:
-					author_id = author['id']
-					new_url = f'{connection.url}service/author/{author_id}/posts/'
-					response = requests.get(new_url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if response.status_code == 200:
-						posts_remote = response.json()['posts']
-						if len(posts) > 0:
-							for item in posts_remote:
-								if item['visibility'] == 'PUBLIC':
-									post_id = item['id']
-									post = Post(
-										id = item['id'],
-										author = Author(
-											id = item['author']['id'],
-											remote_username = item['author']['displayName'],
-										),
-										timestamp = item['published'],
-										title = item['title'],
-										content = item['content'],
-										contentType = item['contentType'].split(';')[0],
-									)
-									remote_posts.append(post)
-	posts.append(remote_posts)
-
-	return render(request, 'profile/home.html', {'posts': posts})
+@login_required(login_url='/login/')
+def home_timeline(request):
+	"""
+	The next page of the home timeline, for infinite scroll.
+	Parameters
+	----------
+	cursor: query parameter, the next_cursor of the page before
+	Returns
+	-------
+	The post cards of that page, ending with the marker for the page after it
+	"""
+	try:
+		posts, next_cursor = timeline.page(request.author, request.GET.get('cursor'))
+	except ValueError:
+		return HttpResponseNotFound()
+	return render(request, 'profile/timeline_page.html', {'posts': posts, 'next_cursor': next_cursor})
 
 @login_required(login_url='/login/')
 def update_profile(request):
@@ -111,7 +103,7 @@ def update_profile(request):
 	"""
 	if request.method == 'POST':
 		user_form = UserForm(request.POST, instance=request.user)
-		author_form = AuthorForm(request.POST, instance=request.user.author)
+		author_form = AuthorForm(request.POST, instance=request.author)
 		if user_form.is_valid() and author_form.is_valid():
 			user_form.save()
 			author_form.save()
@@ -121,7 +113,7 @@ def update_profile(request):
 			messages.error(request, 'Please correct the error below.')
 	else:
 		user_form = UserForm(instance=request.user)
-		author_form = AuthorForm(instance=request.user.author)
+		author_form = AuthorForm(instance=request.author)
 	return render(request, 'profile/profile.html', {
 		'user_form': user_form,
 		'author_form': author_form
@@ -153,89 +145,58 @@ def signup(request):
 
 
 def friends_list(request):
-	user = Author.objects.get(user__username=request.user.username)
+	user = request.author
 
 	following = user.following.all()
 	followers = user.followers.all()
 
 	# Grab friends
-	friends = following & followers
-
-	if user.remote_following_uuid:
-		following_remote = user.remote_following_uuid.strip().split(" ")
-	else:
-		following_remote = []
+	friends = user.friends
 
-	if user.remote_followers_uuid:
-		followers_remote = user.remote_followers_uuid.strip().split(" ")
-	else:
-		followers_remote = []
-
-	friends_remote = []
-	if following_remote and followers_remote:
-		for f in following_remote:
-			if f in followers_remote:
-				friends_remote.append(f)
+	following_remote = user.remote_following
+	followers_remote = user.remote_followers
+	friends_remote = user.remote_friends
 
 	friends = list(friends) 
 	following = list(following) 
 	followers = list(followers)
 
-	for connection in Connection.objects.all():
-		if friends_remote:
-			for i in range(len(friends_remote)):
-				if type(friends_remote[i]) == str:
-					url = f'{connection.url}service/author/' + friends_remote[i] + '/'
-					response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if response.status_code == 200:
-						friends.append(response.json())
-						friends_remote.pop(i)
-
-		if following_remote:
-			for i in range(len(following_remote)):
-				if type(following_remote[i]) == str:
-					url = f'{connection.url}service/author/' + following_remote[i] + '/'
-					response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if response.status_code == 200:
-						following.append(response.json())
-
-		if followers_remote:
-			for i in range(len(followers_remote)):
-				if type(followers_remote[i]) == str:
-					url = f'{connection.url}service/author/' + followers_remote[i] + '/'
-					response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if response.status_code == 200:
-						followers.append(response.json())
-						followers_remote.pop(i)
+	# One request per remote id, to the node that hosts it
+	found = routing.find_authors(following_remote + followers_remote)
+	friends += [found[f] for f in friends_remote if f in found]
+	following += [found[f] for f in following_remote if f in found]
+	followers += [found[f] for f in followers_remote if f in found]
 
 	return render(request, 'profile/list.html', {'friends': friends, 'following': following, 'followers': followers})
 
 def view_posts(request, author_id):
 	author = Author.objects.get(id=author_id)
 	posts = author.posts.all()
-	if author.id != request.user.author.id: # Only show unlisted posts if viewed by the owner
-		posts.filter(unlisted=False)
+	if not (request.author and author.id == request.author.id): # Only show unlisted posts if viewed by the owner
+		posts = posts.filter(unlisted=False)
 	return render(request, 'profile/posts.html', {'posts':posts, 'author':author})
 
 def view_post(request, author_id, post_id):
 
 	current_user = request.user
-	post = Post.objects.filter(id=post_id, author__id=author_id).first()
+	post = Post.objects.filter(id=post_id, author__id=author_id).select_related('image').first()
 	if post:
+		if post.image_id:
+			response = images.serve(request, post.image, post.contentType.split(';')[0])
+			# Bodies not yet cleared by clear_image_bodies still hold the image
+			if response is not None or not post.content:
+				return response or HttpResponseNotFound()
 
 		liked = False
 
 		#--- Comments Block ---#
 		# https://djangocentral.com/creating-comments-system-with-django/
-		if post.author == current_user.author:
+		if request.author and post.author == request.author:
 			comments = post.comments.all()
 		elif post.visibility=='FRIENDS':
-			comments = []
-			for comment in post.comments.all():
-				print(comment.author)
-				# comment_author = json.loads(comment.author)
-				if comment.author['id'] == str(current_user.author.id) or comment.author['id'] == str(post.author.id):
-					comments.append(comment)
+			# Anonymous viewers only see the post author's own comments
+			commenters = [str(post.author.id)] + ([str(request.author.id)] if request.author else [])
+			comments = post.comments.filter(author_id__in=commenters)
 		else:
 			comments = post.comments.all()
 		
@@ -243,11 +204,13 @@ def view_post(request, author_id, post_id):
 
 		new_comment = None
 		if request.method == 'POST':
+			if not request.author:
+				return redirect_to_login(request.get_full_path(), '/login/')
 			comment_form = CommentForm(data=request.POST)
 			if comment_form.is_valid():
 				new_comment = comment_form.save(commit=False)
 				new_comment.post = post
-				new_comment.author = AuthorSerializer(request.user.author).data
+				new_comment.author = AuthorSerializer(request.author).data
 				new_comment.save()
 				# new_comment = CommentForm()
 				# ref: https://stackoverflow.com/questions/5773408/how-to-clear-form-fields-after-a-submit-in-django
@@ -259,12 +222,7 @@ def view_post(request, author_id, post_id):
 			comment_form = CommentForm()
 		#--- end of Comments Block ---#
 
-		try:
-			obj = PostLike.objects.get(post_id=post, author=AuthorSerializer(request.user.author).data)
-		except:
-			liked = False
-		else:
-			liked = True
+		liked = bool(request.author) and PostLike.objects.filter(post_id=post, author_id=str(request.author.id)).exists()
 
 		if post.contentType == Post.ContentType.MARKDOWN:
 			post.content = commonmark.commonmark(post.content)
@@ -275,11 +233,10 @@ def view_post(request, author_id, post_id):
 		return render(request, 'profile/post.html', {'post':post, 'current_user':current_user, 'liked':liked, 'comments':comments, 'comment_form':comment_form})
 	else:
 		# Remote post
-		for connection in Connection.objects.all():
-			url = connection.url + 'service/author/' + author_id + '/posts/' + post_id + '/'
-			response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-			if response.status_code == 200:
-				post = response.json()
+		connection = routing.post_connection(author_id, post_id)
+		if connection is not None:
+			post = federation.get_json(connection, 'service/author/' + author_id + '/posts/' + post_id + '/')
+			if post is not None:
 				liked,_,_,count = handle_remote_likes(current_user,author_id,post_id) # TODO need to get like status
 
 				# Comment Block #
@@ -289,10 +246,8 @@ def view_post(request, author_id, post_id):
 					if comment_form.is_valid():
 						json_data = {}
 						json_data['comment'] = request.POST.get('content')
-						comment_url = connection.url+'service/author/'+ author_id+'/posts/'+post_id+ '/comment/'
-						response = requests.post(comment_url,data=json.dumps(json_data),headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
+						response = federation.post(connection, 'service/author/'+ author_id+'/posts/'+post_id+ '/comment/', json_data)
 						if response != 200:
-							print(response.status_code)
 							return redirect('Profile:view_post', author_id, post_id)
 						comment_form = CommentForm()
 
@@ -314,8 +269,8 @@ def view_post(request, author_id, post_id):
 					post['content'] = commonmark.commonmark(post['content'])
 
 				return render(request, 'profile/post.html', {'post':post, 'current_user':current_user, 'liked':liked, 'comments':comments, 'comment_form':comment_form,'remote':True,'like_count':count})
-			else:
-				return redirect('Profile:home')
+		# Neither we nor the node hosting the author have this post
+		return HttpResponseNotFound()
 
 
 
@@ -325,7 +280,7 @@ class CreatePostView(generic.CreateView):
 	fields = ['title', 'source', 'origin', 'contentType', 'description', 'content', 'categories', 'visibility', 'unlisted']
 
 	def form_valid(self, form):
-		author = self.request.user.author
+		author = self.request.author
 		self.success_url = '/author/' + str(author.id) + '/view_posts'
 		form.instance.author = author
 
@@ -333,55 +288,14 @@ class CreatePostView(generic.CreateView):
 		response = super().form_valid(form)
 
 		# LOCAL: only send to inbox of those who are your friends.
-		friends = author.followers.all() & author.following.all()
 		if form.instance.visibility == "FRIENDS":
-			for friend in friends:
-				friend.inbox.post_items.add(form.instance)
-
-		# REMOTE: TODO (same logic)
-		if author.remote_following_uuid:
-			remote_following = author.remote_following_uuid.strip().split(" ")
-		else:
-			remote_following = []
-		if author.remote_followers_uuid:
-			remote_followers = author.remote_followers_uuid.strip().split(" ")
-		else:
-			remote_followers = []
-		remote_friends = list(set(remote_following) & set(remote_followers))
+			form.instance.inbox_posts.add(*Inbox.objects.filter(inbox__in=author.friends))
 
+		# REMOTE: delivered by the federation worker, so the redirect doesn't wait on remote nodes
 		if form.instance.visibility == "FRIENDS":
-			for connection in Connection.objects.all():
-				for uuid in remote_following:
-					url = connection.url + 'service/author/' + str(uuid)
-					get_response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if get_response.status_code == 200:
-						# This is a valid author
-						body = {
-							"type": "post",
-							"title": form.instance.title,
-							"id": f"{form.instance.id}",
-							"source": form.instance.source,
-							"origin": form.instance.origin,
-							"description": form.instance.origin,
-							"contentType": form.instance.contentType,
-							"author": {
-								"type": "author",
-								"id": str(author.id),
-								"authorID": str(author.id),
-								"host": TEAM3_URL,
-								"displayName": author.displayName,
-								"url": f"{TEAM3_URL}author/{author.id}",
-								"github": f"https://github.com/{author.github}/"
-							},
-							"categories": [category.name for category in form.instance.categories.all()],
-							"comments": f"{TEAM3_URL}author/{author.id}/posts/{form.instance.id}/comments",
-							"published": str(form.instance.timestamp),
-							"visibility": "PRIVATE_TO_FRIENDS",
-							"unlisted": False
-						}
-						inbox_url = connection.url + 'service/author/' + str(uuid) + '/inbox/'
-						post_response = requests.post(inbox_url, json.dumps(body), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-						print(post_response.status_code)
+			body = remote_post_body(author, form.instance, "PRIVATE_TO_FRIENDS")
+			for uuid in author.remote_friends:
+				outbox.enqueue(str(uuid), body)
 
 		return response
 
@@ -391,15 +305,15 @@ def new_image_post(request):
 		form = ImagePostForm(request.POST, request.FILES)
 		if form.is_valid():
 			image_post = form.save(commit=False)
-			image_post.content = b64encode(request.FILES['image'].read()).decode('ascii') # https://stackoverflow.com/a/45151058
+			# Written to the image store chunk by chunk; the api still sees the spec's base64 body
+			image_post.image = images.store(request.FILES['image'].chunks())
 			image_post.contentType = request.FILES['image'].content_type + ';base64'
-			image_post.content = 'data:' + image_post.contentType + ',' + image_post.content
-			image_post.author = request.user.author
+			image_post.author = request.author
 			image_post.unlisted = True
 			image_post.save()
 
 			form.save_m2m() # https://docs.djangoproject.com/en/3.1/topics/forms/modelforms/#the-save-method
-			return redirect('Profile:view_posts', author_id=request.user.author.id)
+			return redirect('Profile:view_posts', author_id=request.author.id)
 
 	else:
 		form = ImagePostForm()
@@ -409,7 +323,7 @@ def new_image_post(request):
 @login_required(login_url='/login/')
 def edit_post(request, post_id):
 	post = Post.objects.get(id=post_id)
-	if post.author.id != request.user.author.id:
+	if post.author.id != request.author.id:
 		return HttpResponseForbidden()
 
 	if request.method == 'POST':
@@ -425,12 +339,12 @@ def edit_post(request, post_id):
 
 @login_required(login_url='/login/')
 def delete_post(request, post_id):
-	post = Post.objects.get(id=post_id)
-	if post.author.id != request.user.author.id:
+	post = Post.objects.without_body().get(id=post_id)
+	if post.author.id != request.author.id:
 		return HttpResponseForbidden()
 	else:
 		post.delete()
-		return redirect('Profile:view_posts', author_id=request.user.author.id)
+		return redirect('Profile:view_posts', author_id=request.author.id)
 
 def share_post(request, post_id, author_id):
 
@@ -438,11 +352,10 @@ def share_post(request, post_id, author_id):
 
 	if not post:
 		# Remote post
-		for connection in Connection.objects.all():
-			url = connection.url + 'service/author/' + author_id + '/posts/' + post_id + '/'
-			response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-			if response.status_code == 200:
-				post_j = response.json()
+		connection = routing.post_connection(author_id, post_id)
+		if connection is not None:
+			post_j = federation.get_json(connection, 'service/author/' + author_id + '/posts/' + post_id + '/')
+			if post_j is not None:
 				post = Post(
 					title = post_j['title'],
 					source = post_j['source'],
@@ -455,7 +368,7 @@ def share_post(request, post_id, author_id):
 	else:
 		author_original = post.author.displayName
 
-	author = request.user.author
+	author = request.author
 
 	if request.method == "GET":
 		form = PostForm(instance=post, initial={'title': f'{post.title} ---Shared from {author_original}'})
@@ -467,59 +380,20 @@ def share_post(request, post_id, author_id):
 			# post_share = form.save(commit=False)
 			# post_share.save()
 
+			# Shared local images point at the same stored bytes; remote ones are stored by content, see signals
+			if post.image_id and not form.instance.content:
+				form.instance.image = post.image
 			form.save()
 
 			# LOCAL: only send to inbox of those who are your friends.
-			friends = author.followers.all() & author.following.all()
 			if form.instance.visibility == "FRIENDS":
-				for friend in friends:
-					friend.inbox.post_items.add(form.instance)
+				form.instance.inbox_posts.add(*Inbox.objects.filter(inbox__in=author.friends))
 
 			# REMOTE:
-			if author.remote_following_uuid:
-				remote_following = author.remote_following_uuid.strip().split(" ")
-			else:
-				remote_following = []
-			if author.remote_followers_uuid:
-				remote_followers = author.remote_followers_uuid.strip().split(" ")
-			else:
-				remote_followers = []
-			remote_friends = list(set(remote_following) & set(remote_followers))
-
 			if form.instance.visibility == "FRIENDS":
-				for connection in Connection.objects.all():
-					for uuid in remote_friends:
-						url = connection.url + 'service/author/' + str(uuid)
-						get_response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-						if get_response.status_code == 200:
-							# This is a valid author
-							body = {
-								"type": "post",
-								"title": form.instance.title,
-								"id": f"{form.instance.id}",
-								"source": form.instance.source,
-								"origin": form.instance.origin,
-								"description": form.instance.origin,
-								"contentType": form.instance.contentType,
-								"author": {
-									"type": "author",
-									"id": str(author.id),
-									"authorID": str(author.id),
-									"host": TEAM3_URL,
-									"displayName": author.displayName,
-									"url": f"{TEAM3_URL}author/{author.id}",
-									"github": f"https://github.com/{author.github}/"
-								},
-								"categories": [category.name for category in form.instance.categories.all()],
-								"comments": f"{TEAM3_URL}author/{author.id}/posts/{form.instance.id}/comments",
-								"published": str(form.instance.timestamp),
-								"visibility": "PRIVATE_TO_FRIENDS",
-								"unlisted": False
-							}
-							inbox_url = connection.url + 'service/author/' + str(uuid) + '/inbox/'
-							post_response = requests.post(inbox_url, json.dumps(body), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-							print(post_response.status_code)
-
+				body = remote_post_body(author, form.instance, "PRIVATE_TO_FRIENDS")
+				for uuid in author.remote_friends:
+					outbox.enqueue(str(uuid), body)
 
 			return redirect('Profile:view_posts', author.id)
 		else:
@@ -530,7 +404,7 @@ def view_github_activity(request):
 	#get the current user's github username if available
 	#need a helper function to get timestamp in a better format
 	try:
-		github_username = str(request.user.author.github)
+		github_username = str(request.author.github)
 		github_url = f'https://api.github.com/users/{github_username}/events/public'
 		response = requests.get(github_url)
 		jsonResponse = response.json()
@@ -596,7 +470,7 @@ def view_github_activity(request):
 		return render(request, 'profile/github_activity.html')
 
 def post_github(request):
-	author = request.user.author
+	author = request.author
 	if request.method == "GET":
 		content = ast.literal_eval(request.GET.get("activity"))
 		form = PostForm(initial={
@@ -617,7 +491,7 @@ def post_github(request):
 
 def view_profile(request, author_id):
 
-	user = Author.objects.get(user__username=request.user.username)
+	user = request.author
 	local = True
 
 	# Try to grab from local server
@@ -629,47 +503,29 @@ def view_profile(request, author_id):
 	except:
 		# Remote author!
 		local = False
-		for connection in Connection.objects.all():
+		connections = list(Connection.objects.all())
+		for connection in connections:
 			if connection.name == "localhost":
 				found_author = Author(
 					id=author_id,
 					remote_username='Local Tester'
 				)
 				posts = None
-				try:
-					following_status = True if author_id in user.remote_following_uuid else False
-				except:
-					following_status = False
-
-				try:
-					follower_status = True if author_id in user.remote_followers_uuid else False
-				except:
-					follower_status = False
-			else:
-				url = connection.url + 'service/authors/'
-				response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-				if response.status_code == 200:
-					for author in response.json()['items']:
-						# Found a match!
-						if author_id == author['id']:
-							# Grab posts
-							url = connection.url + 'service/author/' + author_id + '/posts/'
-							response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-							if response.status_code == 200:
-								posts = response.json()['posts']
-
-								# Set correct author
-								found_author = author
-								try:
-									following_status = True if author_id in user.remote_following_uuid else False
-								except:
-									following_status = False
-
-								try:
-									follower_status = True if author_id in user.remote_followers_uuid else False
-								except:
-									follower_status = False
-
+				following_status = user.is_following_remote(author_id)
+				follower_status = user.is_followed_by_remote(author_id)
+
+		# Find the author in the mirrored directories, then grab posts from the node that has them
+		remote_author = directory.lookup(author_id)
+		if remote_author:
+			connection = remote_author.connection
+			response = federation.fetch_all([(author_id, connection, 'service/author/' + author_id + '/posts/')])
+			if author_id in response:
+				posts = response[author_id]['posts']
+
+				# Set correct author
+				found_author = remote_author.data
+				following_status = user.is_following_remote(author_id)
+				follower_status = user.is_followed_by_remote(author_id)
 
 	if following_status or follower_status:
 		follow_status = True
@@ -682,55 +538,35 @@ def view_profile(request, author_id):
 					'follower_status': follower_status, 'follow_status': follow_status, 'local': local})
 
 def follow(request, author_id):
-	sender = request.user.author
+	sender = request.author
 	local = True
 	try:
 		receiver = Author.objects.get(id=author_id)
 	except:
 		local = False
-		for connection in Connection.objects.all():
-			if connection.name == "localhost":
-				temp = sender.remote_following_uuid
-				if temp:
-					if author_id not in temp:
-						sender.remote_following_uuid += f' {author_id}'
-				else:
-					sender.remote_following_uuid = author_id
-				sender.save()
-			else:
-				url = connection.url + 'service/authors/'
-				response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-				if response.status_code == 200:
-					for author in response.json()['items']:
-						# Found a match!
-						if author_id == author['id']:
-							receiver = author
-
-							post_data = {}
-							post_data['type'] = 'follow'
-							post_data['summary'] = sender.displayName + ' wants to follow ' + receiver['displayName']
-							post_data['actor'] = {
-								'type': 'author',\
-								'id': f"{TEAM3_URL}author/{sender.id}",\
-								'authorID': str(sender.id),\
-								'host': TEAM3_URL,\
-								'displayName': sender.displayName,\
-								'github': f"https://github.com/{sender.github}/"\
-							}
-							post_data['object'] = receiver
-
-							# Send request to remote
-							url = connection.url + 'service/author/' + receiver['id'] + '/inbox/'
-							post_response = requests.post(url, json.dumps(post_data), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-							if post_response == None or post_response.status_code in [200, 201, 304]:
-								temp = sender.remote_following_uuid
-								if temp:
-									if author_id not in temp:
-										sender.remote_following_uuid += f' {author_id}'
-								else:
-									sender.remote_following_uuid = author_id
-									
-								sender.save()
+
+		# Found a match!
+		remote_author = directory.lookup(author_id)
+		if remote_author:
+			connection = remote_author.connection
+			receiver = remote_author.data
+
+			post_data = {}
+			post_data['type'] = 'follow'
+			post_data['summary'] = sender.displayName + ' wants to follow ' + receiver['displayName']
+			post_data['actor'] = {
+				'type': 'author',\
+				'id': f"{TEAM3_URL}author/{sender.id}",\
+				'authorID': str(sender.id),\
+				'host': TEAM3_URL,\
+				'displayName': sender.displayName,\
+				'github': f"https://github.com/{sender.github}/"\
+			}
+			post_data['object'] = receiver
+
+			# Send request to remote; delivery is retried by the federation worker, which records the follow
+			# once the node has accepted it (see Profile.signals.record_remote_follow)
+			outbox.enqueue(receiver['id'], post_data, connection=connection)
 
 	if local:
 		# Create friend request
@@ -743,13 +579,12 @@ def follow(request, author_id):
 		receiver.inbox.follow_items.add(friend_request)
 
 		# Add the receiver to the sender's following list
-		sender.following.add(receiver)
-		receiver.followers.add(sender)
+		Follow.objects.follow(sender, receiver)
 
 	return redirect('Profile:view_profile', author_id)
 
 def unfollow(request, author_id):
-	user = Author.objects.get(user__username=request.user.username)
+	user = request.author
 	try:
 		# Local
 		user_following = Author.objects.get(id=author_id)
@@ -758,15 +593,11 @@ def unfollow(request, author_id):
 		# Remove connection
 
 		# ToDo: what other models must be updated? See email
-		user.following.remove(user_following)
-		user_following.followers.remove(user)
+		Follow.objects.unfollow(user, user_following)
 
 	except:
 		# Remote
-		remote_following_list = user.remote_following_uuid.strip().split(" ")
-		remote_following_list.remove(author_id)
-		user.remote_following_uuid = " ".join(remote_following_list)
-		user.save()
+		user.unfollow_remote(author_id)
 
 	return redirect('Profile:view_profile', author_id)
 
@@ -774,7 +605,7 @@ def unfollow(request, author_id):
 def like_post(request, author_id, post_id):
 	current_user = request.user
 	try:
-		post = Post.objects.filter(id=post_id, author__id=author_id).get()
+		post = Post.objects.without_body().filter(id=post_id, author__id=author_id).get()
 		found = True
 	except:
 		found = False
@@ -782,14 +613,12 @@ def like_post(request, author_id, post_id):
 		# Local post
 		liked = False
 		try:
-			obj = PostLike.objects.get(post_id=post, author=AuthorSerializer(request.user.author).data)
+			obj = PostLike.objects.get(post_id=post, author_id=str(request.author.id))
 		except:
-			author = Author.objects.get(id=request.user.author.id)
+			author = request.author
 
-			like_instance = PostLike(post_id=post, author=AuthorSerializer(request.user.author).data)
+			like_instance = PostLike(post_id=post, author=AuthorSerializer(request.author).data)
 			like_instance.save()
-			post.likes_count = post.likes_count + 1
-			post.save()
 			liked = True
 
 			# Add to inbox
@@ -797,8 +626,6 @@ def like_post(request, author_id, post_id):
 			content_author.inbox.post_like_items.add(like_instance)
 
 		else:
-			post.likes_count -= 1
-			post.save()
 			obj.delete()
 		return redirect('Profile:view_post', author_id, post_id)
 		# if post.contentType == Post.ContentType.PLAIN:
@@ -813,7 +640,7 @@ def like_post(request, author_id, post_id):
 		# 	if comment_form.is_valid():
 		# 		new_comment = comment_form.save(commit=False)
 		# 		new_comment.post = post
-		# 		new_comment.author = AuthorSerializer(request.user.author).data
+		# 		new_comment.author = AuthorSerializer(request.author).data
 		# 		new_comment.save()
 		# 		comment_form = CommentForm()
 		# 		return redirect('Profile:view_post', author_id, post_id)
@@ -821,10 +648,10 @@ def like_post(request, author_id, post_id):
 		# else:
 		# 	comment_form = CommentForm()
 		#
-		# if current_user.author.id == post.author.id or post.visibility == 'PUBLIC':
+		# if request.author.id == post.author.id or post.visibility == 'PUBLIC':
 		# 	comments = post.comments
 		# else:
-		# 	comments = post.comments.filter(author__id=current_user.author.id)
+		# 	comments = post.comments.filter(author__id=request.author.id)
 		# comment_form = CommentForm()
 		# return render(request, 'profile/post.html', {'post':post, 'content':content, 'current_user':current_user, 'liked': liked, 'comments':comments, 'comment_form':comment_form})
 	else:
@@ -840,19 +667,18 @@ def like_post(request, author_id, post_id):
 			json_data = {}
 
 			# revise some part of author json data
-			author_object = AuthorSerializer(current_user.author).data
+			author_object = AuthorSerializer(request.author).data
 			author_object['authorID'] = author_object['id']
 			author_object['id'] = host+author_object['id']
 			author_object['host'] = host
 			author_object['url'] = host+'author/'+author_object['authorID']
-			json_data['summary'] = current_user.author.displayName + ' likes your post'
+			json_data['summary'] = request.author.displayName + ' likes your post'
 			json_data['type'] = 'Like'
 			json_data['author'] = author_object
 			json_data['object'] = target + 'service/author/' + author_id +'/posts/'+post_id
 			json_data['postID'] = post_id
 
-			url = target+'service/author/'+author_id+'/inbox/'
-			response = requests.post(url, data=json.dumps(json_data), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
+			outbox.enqueue(author_id, json_data, connection=connection)
 			liked = True
 			count += 1
 
@@ -871,7 +697,7 @@ def like_post(request, author_id, post_id):
 
 
 def private_post(request, author_id):
-	author = request.user.author
+	author = request.author
 	try:
 		# LOCAL
 		to_author = Author.objects.get(id=author_id)
@@ -905,99 +731,46 @@ def private_post(request, author_id):
 			form.instance.author = author
 			form.instance.to_remote_author_id = author_id
 			if form.is_valid():
-				for connection in Connection.objects.all():
-					url = connection.url + 'service/author/' + str(author_id)
-					get_response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-					if get_response.status_code == 200:
-						# This guys exist
-						body = {
-							"type": "post",
-							"title": form.instance.title,
-							"id": f"{form.instance.id}",
-							"source": form.instance.source,
-							"origin": form.instance.origin,
-							"description": form.instance.origin,
-							"contentType": form.instance.contentType,
-							"author": {
-								"type": "author",
-								"id": str(author.id),
-								"authorID": str(author.id),
-								"host": TEAM3_URL,
-								"displayName": author.displayName,
-								"url": f"{TEAM3_URL}author/{author.id}",
-								"github": f"https://github.com/{author.github}/"
-							},
-							"categories": [category.name for category in form.instance.categories.all()],
-							"comments": f"{TEAM3_URL}author/{author.id}/posts/{form.instance.id}/comments",
-							"published": str(form.instance.timestamp),
-							"visibility": "PRIVATE_TO_AUTHOR",
-							"unlisted": False
-						}
-						inbox_url = connection.url + 'service/author/' + str(author_id) + '/inbox/'
-						post_response = requests.post(inbox_url, json.dumps(body), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-						print(post_response.status_code)
-						post = form.save(commit=False)
-						post.save()
-						return redirect('Profile:view_posts', author.id)
+				# Only keep the DM if some node actually hosts the recipient
+				connection = routing.author_connection(author_id)
+				if connection is None:
+					messages.error(request, 'No connected node knows this author')
+					return render(request, "profile/private_post.html", {'form':form})
+				post = form.save(commit=False)
+				post.save()
+				outbox.enqueue(str(author_id), remote_post_body(author, post, "PRIVATE_TO_AUTHOR"), connection=connection)
+				return redirect('Profile:view_posts', author.id)
 			else:
 				print(form.errors)
 
 def inbox(request):
-	author = Author.objects.get(id=request.user.author.id)
-
-	# Private means direct DM or from someone is not your friend (yet)
-	private_posts = Post.objects.filter(to_author=request.user.author.id)
-
-	# Friends posts contain all the post from the people you follow
-	friend_posts = author.inbox.post_items.all()
-	posts = private_posts | friend_posts
+	author = request.author
+	inbox = author.inbox
 
-	# Grab friend requests from inbox
-	friend_requests = author.inbox.follow_items.all()
+	if request.method == "POST" and "clear_signal" in request.POST:
+		inbox.clear()
 
-	# Grab likes from inbox
-	likes = author.inbox.post_like_items.all()
+	# New is the default view; private posts sent to the author are inbox items like the rest
+	cleared = {"All": None, "Cleared": True}.get(request.GET.get("inbox_option"), False)
+	if request.method == "POST":
+		cleared = False
+	posts = inbox.posts(cleared)
+	friend_requests = inbox.follows(cleared)
+	likes = inbox.likes(cleared)
 
-	if request.method == "GET":
-		inbox_option = request.GET.get("inbox_option")
-		if inbox_option == "All":
-			posts = posts.order_by('-timestamp')
-		elif inbox_option == "Cleared":
-			posts = author.inbox.post_items_cleared.all().order_by('-timestamp')
-			friend_requests = author.inbox.follow_items_cleared.all()
-			likes = author.inbox.post_like_items_cleared.all()
-		else:
-			posts = posts.difference(author.inbox.post_items_cleared.all()).order_by('-timestamp')
-			friend_requests = friend_requests.difference(author.inbox.follow_items_cleared.all())
-			likes = likes.difference(author.inbox.post_like_items_cleared.all())
-
-		return render(request, 'profile/inbox.html', {'posts':posts, 'author':author, 'friend_requests': friend_requests, 'likes': likes})
-	elif request.method == "POST":
-		if "clear_signal" in request.POST:
-			author.inbox.post_items_cleared.add(*posts)
-			author.inbox.follow_items_cleared.add(*friend_requests)
-			author.inbox.post_like_items_cleared.add(*likes)
-
-		posts = posts.difference(author.inbox.post_items_cleared.all()).order_by('-timestamp')
-		friend_requests = friend_requests.difference(author.inbox.follow_items_cleared.all())
-		likes = likes.difference(author.inbox.post_like_items_cleared.all())
-
-		return render(request, 'profile/inbox.html', {'posts': posts, 'author': author, 'friend_requests': friend_requests, 'likes': likes})
+	return render(request, 'profile/inbox.html', {'posts': posts, 'author': author, 'friend_requests': friend_requests, 'likes': likes})
 
 def handle_remote_likes(current_user, author_id, post_id):
 	liked = False
 	target_url = None
 	target_con = None
 	count = 0
-	for connection in Connection.objects.all():
-		url = connection.url + 'service/author/' + author_id + '/post/' + post_id + '/likes'
-		response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
+	connection = routing.post_connection(author_id, post_id)
+	if connection is not None:
+		likes = federation.get_json(connection, 'service/author/' + author_id + '/post/' + post_id + '/likes')
 		target_url = connection.url
 		target_con = connection
-		print(response.status_code,'\n')
-		if response.status_code == 200:
-			likes = response.json()
-
+		if likes is not None:
 			for like in likes['likes']:
 				count += 1
 				if like['author']['id'] == current_user.id:
@@ -1008,20 +781,17 @@ def handle_remote_likes(current_user, author_id, post_id):
 
 
 def remote_comments(request,author_id,post_id):
-	for connection in Connection.objects.all():
-		url = connection.url + 'service/author/' + author_id + '/posts/' + post_id + '/'
-		response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-		if response.status_code == 200:
-			post = response.json()
-
+	connection = routing.post_connection(author_id, post_id)
+	if connection is not None:
+		post = federation.get_json(connection, 'service/author/' + author_id + '/posts/' + post_id + '/')
+		if post is not None:
 			if request.method == 'POST' and request.POST.get('content')!=None:
 				comment_form = CommentForm(data=request.POST)
 				if comment_form.is_valid():
 					json_data = {}
 					json_data['comment'] = request.POST.get('content')
-					comment_url = connection.url + 'service/author/' + author_id + '/posts/' + post_id + '/comment/'
-					# comment_url = connection.url + 'service/author/' + request.user.author.id + '/posts/' + post_id + '/comment/'
-					response = requests.post(comment_url, data=json.dumps(json_data), headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
+					# comment_url = connection.url + 'service/author/' + request.author.id + '/posts/' + post_id + '/comment/'
+					response = federation.post(connection, 'service/author/' + author_id + '/posts/' + post_id + '/comment/', json_data)
 
 			if post['visibility'] == 'PUBLIC':
 				comments = post['comments']
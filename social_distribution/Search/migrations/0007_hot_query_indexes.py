@@ -0,0 +1,21 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Search', '0006_auto_20210411_1726'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['receiver', 'sender'], name='friendrequest_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['receiver', 'remote_sender'], name='friendrequest_remote_idx'),
+        ),
+    ]
@@ -18,6 +18,12 @@ class FriendRequest(models.Model):
     remote_sender = models.CharField(max_length=100, blank=True, null=True)
     remote_username = models.CharField(max_length=100, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['receiver', 'sender'], name='friendrequest_sender_idx'),
+            models.Index(fields=['receiver', 'remote_sender'], name='friendrequest_remote_idx'),
+        ]
+
     # https://stackoverflow.com/questions/18396547/django-rest-framework-adding-additional-field-to-modelserializer
     @property
     def type(self):
@@ -1,7 +1,6 @@
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, redirect
 from django.contrib.auth.models import User
-import requests
 import json
 
 from .forms import SearchForm
@@ -9,8 +8,7 @@ from .models import FriendRequest
 
 from Profile.models import Author
 from api.models import Connection
-
-DEFAULT_HEADERS = {'Referer': 'https://team3-socialdistribution.herokuapp.com/', 'Mode': 'no-cors'}
+from api import directory
 
 # Create your views here.
 def results(request):
@@ -18,11 +16,8 @@ def results(request):
     authors = Author.objects.all()
     authors = list(authors)
 
-    for connection in Connection.objects.all():
-        url = connection.url + 'service/authors'
-        response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-        if response.status_code == 200:
-            for author in response.json()['items']:
-                authors.append(author)    
+    # One indexed lookup against the mirrored remote directories
+    for remote_author in directory.search(query):
+        authors.append(remote_author.data)
 
     return render(request, 'results.html', {'query': query, 'authors': authors})
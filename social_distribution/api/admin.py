@@ -1,5 +1,144 @@
 from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from social_distribution import metrics
 from . import models
 
 # Register your models here.
-admin.site.register(models.Connection)
\ No newline at end of file
+
+def telemetry_rows(calls):
+    """
+    One row per endpoint of a connection's calls (as from metrics.collect_calls), slowest in total first.
+    """
+    skipped = (metrics.OPEN, metrics.BUSY, metrics.DEADLINE)
+    rows = {}
+    for (_, _, endpoint, outcome), totals in calls.items():
+        row = rows.setdefault(endpoint, {'endpoint': endpoint, 'calls': 0, 'statuses': {}, 'timeouts': 0, 'errors': 0,
+                                         'skipped': 0, 'seconds': 0, 'bytes': 0, 'buckets': [0] * len(metrics.BUCKETS)})
+        row['calls'] += totals['calls']
+        row['seconds'] += totals['seconds']
+        row['bytes'] += totals['bytes']
+        row['buckets'] = [a + b for a, b in zip(row['buckets'], totals['buckets'])]
+        if outcome == metrics.TIMEOUT:
+            row['timeouts'] += totals['calls']
+        elif outcome == metrics.ERROR:
+            row['errors'] += totals['calls']
+        elif outcome in skipped:
+            row['skipped'] += totals['calls']
+        else:
+            row['statuses'][outcome] = totals['calls']
+
+    for row in rows.values():
+        row['statuses'] = ', '.join(f'{status}: {n}' for status, n in sorted(row['statuses'].items()))
+        row['avg_ms'] = round(row['seconds'] * 1000 / row['calls'])
+        # Bounds of the histogram bucket holding the 95th percentile
+        row['p95_ms'] = f'> {round(metrics.BUCKETS[-1] * 1000)}'
+        for bound, n in zip(metrics.BUCKETS, row['buckets']):
+            if n >= 0.95 * row['calls']:
+                row['p95_ms'] = f'≤ {round(bound * 1000)}'
+                break
+    return sorted(rows.values(), key=lambda row: row['seconds'], reverse=True)
+
+
+class ConnectionHealthInline(admin.StackedInline):
+    model = models.ConnectionHealth
+    readonly_fields = ('state', 'opened_at', 'retry_at', 'window_calls', 'window_failures', 'avg_latency_ms', 'last_error', 'updated')
+    can_delete = False
+
+
+@admin.register(models.Connection)
+class ConnectionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'url', 'breaker_state', 'retry_at', 'telemetry_link')
+    inlines = (ConnectionHealthInline,)
+
+    def get_urls(self):
+        return [
+            path('<path:object_id>/telemetry/', self.admin_site.admin_view(self.telemetry_view),
+                 name='api_connection_telemetry'),
+        ] + super().get_urls()
+
+    def telemetry_view(self, request, object_id):
+        """
+        The calls this site made to the connection, per endpoint, summed over every worker.
+        """
+        connection = self.get_object(request, unquote(object_id))
+        if connection is None:
+            return self._get_obj_does_not_exist_redirect(request, self.model._meta, object_id)
+        rows = telemetry_rows(metrics.collect_calls(connection))
+        return TemplateResponse(request, 'admin/api/connection/telemetry.html', {
+            **self.admin_site.each_context(request),
+            'title': f'Telemetry: {connection}',
+            'opts': self.model._meta,
+            'original': connection,
+            'rows': rows,
+            'total_calls': sum(row['calls'] for row in rows),
+            'total_seconds': sum(row['seconds'] for row in rows),
+        })
+
+    def telemetry_link(self, connection):
+        return format_html('<a href="{}">Telemetry</a>', reverse('admin:api_connection_telemetry', args=[connection.pk]))
+    telemetry_link.short_description = 'Telemetry'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('health')
+
+    def breaker_state(self, connection):
+        try:
+            return connection.health.state
+        except models.ConnectionHealth.DoesNotExist:
+            return models.ConnectionHealth.State.CLOSED
+
+    def retry_at(self, connection):
+        try:
+            return connection.health.retry_at
+        except models.ConnectionHealth.DoesNotExist:
+            return None
+
+
+@admin.register(models.ConnectionHealth)
+class ConnectionHealthAdmin(admin.ModelAdmin):
+    list_display = ('connection', 'state', 'retry_at', 'window_calls', 'window_failures', 'avg_latency_ms', 'last_error', 'updated')
+    list_filter = ('state',)
+
+
+admin.site.register(models.RemoteAuthor)
+
+
+@admin.register(models.RemotePost)
+class RemotePostAdmin(admin.ModelAdmin):
+    list_display = ('remote_id', 'connection', 'author_id', 'timestamp', 'synced')
+    list_filter = ('connection',)
+    list_select_related = ('connection',)
+
+
+@admin.register(models.OutboxItem)
+class OutboxItemAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'connection', 'status', 'attempts', 'next_attempt', 'last_status', 'last_error', 'created')
+    list_filter = ('status', 'connection')
+    list_select_related = ('connection',)
+
+
+@admin.register(models.RemoteRoute)
+class RemoteRouteAdmin(admin.ModelAdmin):
+    list_display = ('remote_id', 'kind', 'connection', 'author_id', 'updated')
+    list_filter = ('kind', 'connection')
+    search_fields = ('remote_id',)
+    list_select_related = ('connection',)
+
+
+@admin.register(models.ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ('author', 'name', 'created', 'expires', 'revoked')
+    list_filter = ('revoked',)
+    list_select_related = ('author__user',)
+    readonly_fields = ('key_hash', 'created')
+    actions = ('revoke',)
+
+    def revoke(self, request, queryset):
+        # One by one, so each token leaves the authentication cache
+        for token in queryset.filter(revoked__isnull=True):
+            token.revoke()
+    revoke.short_description = 'Revoke selected tokens'
@@ -0,0 +1,155 @@
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ConnectionHealth
+
+
+WINDOW = getattr(settings, 'FEDERATION_BREAKER_WINDOW', 60)
+MIN_CALLS = getattr(settings, 'FEDERATION_BREAKER_MIN_CALLS', 5)
+FAILURE_RATIO = getattr(settings, 'FEDERATION_BREAKER_FAILURE_RATIO', 0.5)
+SLOW_CALL = getattr(settings, 'FEDERATION_BREAKER_SLOW_CALL', 5)
+OPEN_SECONDS = getattr(settings, 'FEDERATION_BREAKER_OPEN_SECONDS', 30)
+# How long a worker trusts its copy of the shared state before re-reading it
+STATE_TTL = 2
+STATS_INTERVAL = 10
+
+State = ConnectionHealth.State
+
+
+class _Breaker:
+    def __init__(self):
+        self.calls = deque()
+        self.state = State.CLOSED
+        self.retry_at = None
+        self.loaded = 0
+        self.persisted = 0
+        self.dirty = False
+        self.tripped = False
+        self.last_error = ''
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def _breaker(connection):
+    with _lock:
+        if connection.id not in _breakers:
+            _breakers[connection.id] = _Breaker()
+        return _breakers[connection.id]
+
+
+def _load(connection, breaker):
+    health = ConnectionHealth.objects.filter(connection_id=connection.id).first()
+    if health:
+        breaker.state = health.state
+        breaker.retry_at = health.retry_at
+    breaker.loaded = time.monotonic()
+
+
+def _transition(connection, breaker, state, retry_at=None):
+    now = timezone.now()
+    fields = {'state': state, 'retry_at': retry_at}
+    if state == State.OPEN:
+        fields['opened_at'] = now
+    ConnectionHealth.objects.update_or_create(connection_id=connection.id, defaults=fields)
+    breaker.state = state
+    breaker.retry_at = retry_at
+    breaker.loaded = time.monotonic()
+
+
+def allow(connection, probe):
+    """
+    Whether requests to this connection should be sent at all.
+    Open breakers are skipped instantly. Once an open breaker's cool-down is over, one worker
+    claims the half-open state and runs probe(connection); success closes the breaker.
+    Must be called from the request thread, since it may touch the database.
+    """
+    breaker = _breaker(connection)
+    if time.monotonic() - breaker.loaded > STATE_TTL:
+        _load(connection, breaker)
+
+    if breaker.state == State.CLOSED:
+        return True
+    now = timezone.now()
+    if breaker.retry_at and breaker.retry_at > now:
+        return False
+
+    # Cool-down over: only the worker that wins this update gets to probe
+    claimed = ConnectionHealth.objects.filter(connection_id=connection.id, state=breaker.state, retry_at=breaker.retry_at) \
+        .update(state=State.HALF_OPEN, retry_at=now + timedelta(seconds=OPEN_SECONDS))
+    if not claimed:
+        breaker.loaded = 0
+        return False
+
+    if probe(connection):
+        with _lock:
+            breaker.calls.clear()
+        _transition(connection, breaker, State.CLOSED)
+        return True
+    _transition(connection, breaker, State.OPEN, now + timedelta(seconds=OPEN_SECONDS))
+    return False
+
+
+def record(connection, ok, latency, error=''):
+    """
+    Record the outcome of a call. Thread safe and memory only; persist() writes any resulting
+    state change. Calls slower than FEDERATION_BREAKER_SLOW_CALL count as failures.
+    """
+    breaker = _breaker(connection)
+    failed = not ok or latency > SLOW_CALL
+    now = time.monotonic()
+    with _lock:
+        breaker.calls.append((now, failed, latency))
+        while breaker.calls and breaker.calls[0][0] < now - WINDOW:
+            breaker.calls.popleft()
+        if error:
+            breaker.last_error = error[:200]
+
+        calls = len(breaker.calls)
+        failures = sum(1 for _, f, _ in breaker.calls if f)
+        if breaker.state == State.CLOSED and calls >= MIN_CALLS and failures / calls >= FAILURE_RATIO:
+            breaker.state = State.OPEN
+            breaker.retry_at = timezone.now() + timedelta(seconds=OPEN_SECONDS)
+            breaker.tripped = breaker.dirty = True
+        elif now - breaker.persisted > STATS_INTERVAL:
+            breaker.dirty = True
+
+
+def persist(connections):
+    """
+    Write tripped breakers and window counters to ConnectionHealth. Call from the request thread.
+    """
+    for connection in connections:
+        breaker = _breaker(connection)
+        with _lock:
+            if not breaker.dirty:
+                continue
+            calls = list(breaker.calls)
+            tripped, retry_at = breaker.tripped, breaker.retry_at
+            breaker.dirty = breaker.tripped = False
+
+        fields = {
+            'window_calls': len(calls),
+            'window_failures': sum(1 for _, failed, _ in calls if failed),
+            'avg_latency_ms': int(sum(latency for _, _, latency in calls) * 1000 / len(calls)) if calls else 0,
+            'last_error': breaker.last_error,
+        }
+        if tripped:
+            fields.update(state=State.OPEN, retry_at=retry_at, opened_at=timezone.now())
+        ConnectionHealth.objects.update_or_create(connection_id=connection.id, defaults=fields)
+        breaker.persisted = time.monotonic()
+        breaker.loaded = breaker.persisted
+
+
+def reset():
+    """
+    Forget the in-process state (used by tests).
+    """
+    with _lock:
+        _breakers.clear()
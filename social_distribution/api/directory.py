@@ -0,0 +1,249 @@
+from datetime import timedelta
+from urllib.parse import urljoin
+
+from django.conf import settings
+from django.db import connection as db_connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import federation, routing
+from .models import Connection, RemoteAuthor, RemotePost
+
+
+DIRECTORY_TTL = getattr(settings, 'FEDERATION_DIRECTORY_TTL', 300)
+DIRECTORY_PATH = 'service/authors/'
+LISTING_MAX_PAGES = getattr(settings, 'FEDERATION_LISTING_MAX_PAGES', 50)
+
+def _items(page):
+    if isinstance(page, dict):
+        page = page.get('items') or page.get('posts') or []
+    return [item for item in page if isinstance(item, dict)] if isinstance(page, list) else []
+
+
+def fetch_listings(jobs):
+    """
+    Fetch listings from remote nodes, following the next link of each page until the listing ends.
+    Parameters
+    ----------
+    jobs: iterable of (key, connection, path)
+    Returns
+    -------
+    {key: (items, complete)} for every job whose first page answered. complete is False when a later page
+    did not answer, its next link pointed off the node, or FEDERATION_LISTING_MAX_PAGES ran out: rows
+    may be missing, so nothing should be pruned for them.
+    """
+    pending = {key: (connection, path) for key, connection, path in jobs}
+    listings, visited = {}, {}
+    for _ in range(LISTING_MAX_PAGES):
+        if not pending:
+            break
+        pages = federation.fetch_all((key, connection, path) for key, (connection, path) in pending.items())
+        following = {}
+        for key, (connection, path) in pending.items():
+            if key not in pages:
+                if key in listings:
+                    listings[key] = (listings[key][0], False)
+                continue
+            page = pages[key]
+            items, complete = listings.get(key, ([], True))
+            items.extend(_items(page))
+            listings[key] = (items, complete)
+            visited.setdefault(key, set()).add(path)
+
+            link = page.get('next') if isinstance(page, dict) else None
+            if not link:
+                continue
+            url = urljoin(connection.url, str(link))
+            next_path = url[len(connection.url):] if url.startswith(connection.url) else None
+            if next_path is None or next_path in visited[key]:
+                listings[key] = (items, False)
+            else:
+                following[key] = (connection, next_path)
+        pending = following
+    for key in pending:
+        listings[key] = (listings[key][0], False)
+    return listings
+
+
+def sync(connections=None):
+    """
+    Mirror the author listing of each connection into RemoteAuthor, following its pages.
+    Only rows that appeared, changed or disappeared are written; nothing is deleted for a listing that
+    could not be read to the end.
+    Returns a dict of connection name -> (created, updated, deleted); nodes that did not answer are left out.
+    """
+    if connections is None:
+        connections = Connection.objects.exclude(name='localhost')
+    connections = list(connections)
+    listings = fetch_listings((c.id, c, DIRECTORY_PATH) for c in connections)
+
+    stats = {}
+    for connection in connections:
+        if connection.id not in listings:
+            continue
+        stats[connection.name] = _apply(connection, *listings[connection.id])
+    return stats
+
+
+def _apply(connection, items, complete=True):
+    now = timezone.now()
+    existing = {ra.remote_id: ra for ra in RemoteAuthor.objects.filter(connection=connection)}
+
+    created, updated = [], []
+    seen = set()
+    for item in items:
+        remote_id = str(item.get('id', ''))
+        if not remote_id or remote_id in seen:
+            continue
+        seen.add(remote_id)
+        display_name = (item.get('displayName') or '')[:200]
+        current = existing.get(remote_id)
+        if current is None:
+            created.append(RemoteAuthor(connection=connection, remote_id=remote_id, displayName=display_name,
+                                        search_name=display_name.lower()[:200], data=item, synced=now))
+        elif current.data != item:
+            current.data = item
+            current.displayName = display_name
+            current.search_name = display_name.lower()[:200]
+            current.synced = now
+            updated.append(current)
+
+    RemoteAuthor.objects.bulk_create(created)
+    RemoteAuthor.objects.bulk_update(updated, ['data', 'displayName', 'search_name', 'synced'])
+    deleted = 0
+    if complete:
+        deleted, _ = RemoteAuthor.objects.filter(connection=connection).exclude(remote_id__in=seen).delete()
+    routing.learn_authors(connection, seen)
+    Connection.objects.filter(pk=connection.pk).update(authors_synced=now)
+    return len(created), len(updated), deleted
+
+
+def _timestamp(item):
+    published = item.get('published') or item.get('timestamp')
+    try:
+        value = parse_datetime(str(published))
+    except ValueError:
+        return None
+    if value is not None and timezone.is_naive(value):
+        value = timezone.make_aware(value, timezone.utc)
+    return value
+
+
+def sync_posts(connections=None):
+    """
+    Mirror the public posts of every mirrored author of each connection into RemotePost, following their pages.
+    A connection's posts are only pruned when every one of its authors' listings was read to the end.
+    Returns a dict of connection name -> (created, updated, deleted); nodes that did not answer are left out.
+    """
+    if connections is None:
+        connections = Connection.objects.exclude(name='localhost')
+    connections = list(connections)
+    authors = list(RemoteAuthor.objects.filter(connection__in=connections).values_list('connection_id', 'remote_id'))
+    connection_by_id = {c.id: c for c in connections}
+    listings = fetch_listings(((connection_id, remote_id), connection_by_id[connection_id],
+                               f'service/author/{routing.key(remote_id)}/posts/')
+                              for connection_id, remote_id in authors)
+
+    items = {}
+    complete = {connection_id: True for connection_id, _ in authors}
+    for connection_id, remote_id in authors:
+        if (connection_id, remote_id) not in listings:
+            complete[connection_id] = False
+            continue
+        author_items, author_complete = listings[(connection_id, remote_id)]
+        items.setdefault(connection_id, []).extend(author_items)
+        complete[connection_id] = complete[connection_id] and author_complete
+
+    stats = {}
+    for connection in connections:
+        if connection.id in items:
+            stats[connection.name] = _apply_posts(connection, items[connection.id], complete[connection.id])
+    return stats
+
+
+def _apply_posts(connection, items, complete=True):
+    now = timezone.now()
+    existing = {rp.remote_id: rp for rp in RemotePost.objects.filter(connection=connection)}
+
+    created, updated = [], []
+    seen = set()
+    for item in items:
+        if item.get('visibility') != 'PUBLIC' or item.get('unlisted'):
+            continue
+        remote_id = routing.key(item.get('id', ''))
+        timestamp = _timestamp(item)
+        if not remote_id or remote_id in seen or timestamp is None:
+            continue
+        seen.add(remote_id)
+        author = item.get('author')
+        author_id = routing.key(author.get('id', '')) if isinstance(author, dict) else ''
+        current = existing.get(remote_id)
+        if current is None:
+            created.append(RemotePost(connection=connection, remote_id=remote_id, author_id=author_id,
+                                      timestamp=timestamp, data=item, synced=now))
+        elif current.data != item:
+            current.data, current.author_id, current.timestamp, current.synced = item, author_id, timestamp, now
+            updated.append(current)
+
+    RemotePost.objects.bulk_create(created)
+    RemotePost.objects.bulk_update(updated, ['data', 'author_id', 'timestamp', 'synced'])
+    deleted = 0
+    if complete:
+        deleted, _ = RemotePost.objects.filter(connection=connection).exclude(remote_id__in=seen).delete()
+    Connection.objects.filter(pk=connection.pk).update(posts_synced=now)
+    return len(created), len(updated), deleted
+
+
+def _claim_stale(connections, field):
+    stale_before = timezone.now() - timedelta(seconds=DIRECTORY_TTL)
+    claimed = []
+    for connection in connections:
+        synced = getattr(connection, field)
+        if synced is not None and synced >= stale_before:
+            continue
+        # Claim the refresh so other workers skip it, and a node that is down is retried at most once per TTL
+        if Connection.objects.filter(pk=connection.pk, **{field: synced}).update(**{field: timezone.now()}):
+            claimed.append(connection)
+    return claimed
+
+
+def refresh(connections=None):
+    """
+    Sync the author and public post mirrors of connections not synced for FEDERATION_DIRECTORY_TTL seconds.
+    Run by federation_worker; web requests only read the mirrors, as they are.
+    Returns (author stats, post stats) as from sync and sync_posts.
+    """
+    if connections is None:
+        connections = Connection.objects.exclude(name='localhost')
+    connections = list(connections)
+    authors = sync(_claim_stale(connections, 'authors_synced'))
+    posts = sync_posts(_claim_stale(connections, 'posts_synced'))
+    return authors, posts
+
+
+def lookup(author_id):
+    """
+    Find a remote author by the id their node reports. Returns a RemoteAuthor or None.
+    """
+    return RemoteAuthor.objects.select_related('connection').filter(remote_id=author_id).first()
+
+
+def prefix(field, value):
+    """
+    Q for values of field that start with value, in a form the field's index can serve: LIKE 'value%' on
+    PostgreSQL, where Django adds a pattern_ops index to db_index columns, and the same range on SQLite,
+    which only uses an index for LIKE on NOCASE columns.
+    """
+    if not value:
+        return Q()
+    if db_connection.vendor == 'sqlite' and ord(value[-1]) < 0x10FFFF:
+        return Q(**{field + '__gte': value, field + '__lt': value[:-1] + chr(ord(value[-1]) + 1)})
+    return Q(**{field + '__startswith': value})
+
+
+def search(query):
+    """
+    Remote authors whose displayName starts with query, ignoring case.
+    """
+    return RemoteAuthor.objects.filter(prefix('search_name', query.lower())).order_by('displayName')
@@ -0,0 +1,284 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from social_distribution import metrics
+from . import breaker
+
+
+DEFAULT_HEADERS = {'Referer': 'https://team3-socialdistribution.herokuapp.com/', 'Mode': 'no-cors'}
+
+FANOUT_WORKERS = getattr(settings, 'FEDERATION_FANOUT_WORKERS', 16)
+PER_CONNECTION_LIMIT = getattr(settings, 'FEDERATION_PER_CONNECTION_LIMIT', 4)
+FANOUT_DEADLINE = getattr(settings, 'FEDERATION_FANOUT_DEADLINE', 10)
+CONNECT_TIMEOUT = getattr(settings, 'FEDERATION_CONNECT_TIMEOUT', 3.05)
+READ_TIMEOUT = getattr(settings, 'FEDERATION_READ_TIMEOUT', 10)
+MAX_RETRIES = getattr(settings, 'FEDERATION_MAX_RETRIES', 2)
+RETRY_BACKOFF = getattr(settings, 'FEDERATION_RETRY_BACKOFF', 0.25)
+PROBE_PATH = getattr(settings, 'FEDERATION_PROBE_PATH', '')
+PROBE_TIMEOUT = getattr(settings, 'FEDERATION_PROBE_TIMEOUT', 2)
+
+# Methods that are safe to send twice; POSTs are only retried when the connection was never made.
+RETRY_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUSES = {502, 503, 504}
+
+# Path segment -> logical endpoint, for telemetry; the last known segment of a path wins
+ENDPOINTS = {
+    'authors': 'authors', 'author': 'authors',
+    'posts': 'posts', 'post': 'posts',
+    'inbox': 'inbox',
+    'likes': 'likes', 'liked': 'likes',
+    'comments': 'comments', 'comment': 'comments',
+    'followers': 'followers',
+    'friends': 'friends',
+    'friendrequests': 'friendrequests',
+}
+
+# One pool per process, shared by every view that fans out to remote nodes.
+_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='federation')
+_limits = {}
+_sessions = {}
+_lock = threading.Lock()
+
+
+def deadline(seconds=None):
+    """
+    Absolute point in time (time.monotonic) after which fan-out results are dropped.
+    """
+    return time.monotonic() + (seconds if seconds is not None else FANOUT_DEADLINE)
+
+
+def _limit_for(connection):
+    with _lock:
+        if connection.id not in _limits:
+            _limits[connection.id] = threading.BoundedSemaphore(PER_CONNECTION_LIMIT)
+        return _limits[connection.id]
+
+
+def session_for(connection):
+    """
+    Keep-alive session for a connection, rebuilt when its url or credentials change.
+    """
+    key = (connection.url, connection.outgoing_username, connection.outgoing_password)
+    with _lock:
+        cached = _sessions.get(connection.id)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        session = requests.Session()
+        session.headers.update(DEFAULT_HEADERS)
+        session.auth = (connection.outgoing_username, connection.outgoing_password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PER_CONNECTION_LIMIT)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if cached:
+            cached[1].close()
+        _sessions[connection.id] = (key, session)
+        return session
+
+
+def endpoint(path):
+    """
+    Logical endpoint of a path on a remote node, e.g. 'service/author/1/posts/2/comment/' -> 'comments'.
+    """
+    for segment in reversed(path.split('?')[0].strip('/').split('/')):
+        if segment in ENDPOINTS:
+            return ENDPOINTS[segment]
+    return 'other'
+
+
+def _size(response):
+    content = response.content
+    return len(content) if isinstance(content, bytes) else 0
+
+
+def _backoff(attempt):
+    # Exponential backoff with full jitter so workers don't retry in lockstep
+    return RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def probe(connection):
+    """
+    Cheap liveness check used to close an open circuit breaker: any non-5xx answer counts.
+    """
+    started = time.monotonic()
+    try:
+        response = session_for(connection).get(connection.url + PROBE_PATH, allow_redirects=False,
+                                                timeout=(CONNECT_TIMEOUT, PROBE_TIMEOUT))
+    except requests.RequestException as e:
+        metrics.record_call(connection, 'probe', _outcome(e), time.monotonic() - started)
+        return False
+    metrics.record_call(connection, 'probe', response.status_code, time.monotonic() - started, _size(response))
+    return response.status_code < 500
+
+
+def _outcome(error):
+    return metrics.TIMEOUT if isinstance(error, requests.Timeout) else metrics.ERROR
+
+
+def _send(connection, method, path, until=None, retries=None, **kwargs):
+    method = method.upper()
+    retries = MAX_RETRIES if retries is None else retries
+    limit = _limit_for(connection)
+    called = endpoint(path)
+
+    def remaining():
+        return None if until is None else until - time.monotonic()
+
+    wait_for = remaining()
+    if wait_for is not None and wait_for <= 0:
+        metrics.record_call(connection, called, metrics.DEADLINE, 0)
+        return None
+    queued = time.monotonic()
+    if not limit.acquire(timeout=READ_TIMEOUT if wait_for is None else wait_for):
+        metrics.record_call(connection, called, metrics.BUSY, time.monotonic() - queued)
+        return None
+    try:
+        session = session_for(connection)
+        attempt = 0
+        while True:
+            left = remaining()
+            if left is not None and left <= 0:
+                return None
+            read_timeout = READ_TIMEOUT if left is None else min(READ_TIMEOUT, left)
+            kwargs['timeout'] = (min(CONNECT_TIMEOUT, read_timeout), read_timeout)
+            started = time.monotonic()
+            try:
+                response = session.request(method, connection.url + path, **kwargs)
+            except requests.RequestException as e:
+                metrics.record_call(connection, called, _outcome(e), time.monotonic() - started)
+                breaker.record(connection, False, time.monotonic() - started, type(e).__name__)
+                retryable = method in RETRY_METHODS or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt >= retries:
+                    return None
+            else:
+                metrics.record_call(connection, called, response.status_code, time.monotonic() - started, _size(response))
+                breaker.record(connection, response.status_code < 500, time.monotonic() - started,
+                               f'HTTP {response.status_code}' if response.status_code >= 500 else '')
+                if response.status_code not in RETRY_STATUSES or method not in RETRY_METHODS or attempt >= retries:
+                    return response
+
+            pause = _backoff(attempt)
+            left = remaining()
+            if left is not None and pause >= left:
+                return None
+            time.sleep(pause)
+            attempt += 1
+    finally:
+        limit.release()
+
+
+def request(connection, method, path, until=None, retries=None, **kwargs):
+    """
+    Send a request to a remote node through its pooled session.
+    Parameters
+    ----------
+    connection: the Connection to talk to; path is appended to connection.url
+    until: optional deadline() value; timeouts and retries never run past it
+    retries: override FEDERATION_MAX_RETRIES
+    Returns
+    -------
+    The Response, or None if the node's circuit breaker is open or the node could not be
+    reached (or the in-flight cap could not be acquired) before running out of time and retries.
+    """
+    if not breaker.allow(connection, probe):
+        metrics.record_call(connection, endpoint(path), metrics.OPEN, 0)
+        return None
+    try:
+        return _send(connection, method, path, until, retries, **kwargs)
+    finally:
+        breaker.persist([connection])
+
+
+def get(connection, path, **kwargs):
+    return request(connection, 'GET', path, **kwargs)
+
+
+def post(connection, path, body=None, **kwargs):
+    """
+    POST body (a dict, sent as JSON text like the rest of the node's payloads) to a remote node.
+    """
+    if body is not None:
+        kwargs['data'] = json.dumps(body)
+    return request(connection, 'POST', path, **kwargs)
+
+
+def _decode(response):
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+def get_json(connection, path, until=None):
+    """
+    GET path from a remote node and decode it. Returns None unless the node answered 200 with JSON.
+    """
+    return _decode(request(connection, 'GET', path, until=until))
+
+
+def _fetch_json(connection, path, until):
+    # Runs on the fan-out pool: breaker checks and writes happen in fetch_all's thread
+    return _decode(_send(connection, 'GET', path, until))
+
+
+def fetch_all(jobs, until=None):
+    """
+    Run GET requests against remote nodes concurrently.
+    Parameters
+    ----------
+    jobs: iterable of (key, connection, path); path is appended to connection.url
+    until: deadline() value shared by every request in this call
+    Returns
+    -------
+    A dict of key -> decoded JSON for every job that answered 200 before the deadline.
+    Slow or failing nodes are simply missing from the result.
+    """
+    until = until or deadline()
+    futures = {}
+    allowed = {}
+    for key, connection, path in jobs:
+        # Nodes with an open breaker are skipped without a request
+        if connection.id not in allowed:
+            allowed[connection.id] = (connection, breaker.allow(connection, probe))
+        if allowed[connection.id][1]:
+            futures[_executor.submit(_fetch_json, connection, path, until)] = key
+        else:
+            metrics.record_call(connection, endpoint(path), metrics.OPEN, 0)
+
+    done, not_done = wait(futures, timeout=max(until - time.monotonic(), 0))
+    for future in not_done:
+        future.cancel()
+    breaker.persist(connection for connection, ok in allowed.values() if ok)
+
+    results = {}
+    for future in done:
+        data = future.result()
+        if data is not None:
+            results[futures[future]] = data
+    return results
+
+
+def remote_directories(connections, path='service/authors/', until=None):
+    """
+    Fetch the author listing of every connection concurrently.
+    Returns a list of (connection, author json) pairs.
+    """
+    connections = list(connections)
+    pages = fetch_all(((connection.id, connection, path) for connection in connections), until)
+    authors = []
+    for connection in connections:
+        page = pages.get(connection.id)
+        if page:
+            for author in page.get('items', []):
+                authors.append((connection, author))
+    return authors
+
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Profile.models import Author, Post
+from api import plain
+from api.serializers import AuthorSerializer, PostSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-object cost of the DRF serializers and api.plain on the rows in this database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20, help='Times each list is serialized')
+
+    def time(self, serialize, rows, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            serialize(rows)
+        return (time.perf_counter() - started) / (repeat * len(rows)) * 1e6
+
+    def plain_list(self, serialize):
+        # As the list views use api.plain: one Context per response, one call per row
+        def run(rows):
+            context = plain.Context()
+            return [serialize(row, context) for row in rows]
+        return run
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        # Rows are loaded once up front so only serialization is timed
+        cases = [
+            ('author', list(AuthorSerializer.setup_eager_loading(Author.objects.all())),
+             lambda rows: AuthorSerializer(rows, many=True).data, plain.author),
+            ('post', list(PostSerializer.setup_eager_loading(Post.objects.all())),
+             lambda rows: PostSerializer(rows, many=True).data, plain.post),
+        ]
+        for name, rows, drf, serialize in cases:
+            if not rows:
+                self.stdout.write(f'{name}: no rows')
+                continue
+            drf_us, plain_us = self.time(drf, rows, repeat), self.time(self.plain_list(serialize), rows, repeat)
+            self.stdout.write(f'{name}: {len(rows)} rows, DRF {drf_us:.1f}us/object, '
+                              f'plain {plain_us:.1f}us/object ({drf_us / plain_us:.1f}x)')
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import directory, outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued OutboxItems to remote inboxes, and keep the remote author and post mirrors fresh'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit')
+        parser.add_argument('--batch', type=int, default=50, help='Items leased per round')
+        parser.add_argument('--lease', type=int, default=outbox.LEASE_SECONDS, help='Seconds an item stays leased')
+        parser.add_argument('--poll', type=float, default=2, help='Seconds to sleep when nothing is due')
+        parser.add_argument('--refresh', type=float, default=60,
+                            help='Seconds between checks for remote mirrors older than FEDERATION_DIRECTORY_TTL')
+
+    def handle(self, *args, **options):
+        worker = outbox.worker_name()
+        refreshed = None
+        while True:
+            if refreshed is None or time.monotonic() - refreshed >= options['refresh']:
+                refreshed = time.monotonic()
+                self.refresh()
+
+            items = outbox.claim(worker, options['batch'], options['lease'])
+            if items:
+                delivered = outbox.deliver(items, options['lease'])
+                self.stdout.write(f'{delivered}/{len(items)} delivered')
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['poll'])
+
+    def refresh(self):
+        authors, posts = directory.refresh()
+        for name, (created, updated, deleted) in authors.items():
+            self.stdout.write(f'{name}: {created} new, {updated} updated, {deleted} removed')
+        for name, (created, updated, deleted) in posts.items():
+            self.stdout.write(f'{name} posts: {created} new, {updated} updated, {deleted} removed')
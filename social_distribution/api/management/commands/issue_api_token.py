@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Profile.models import Author
+from api.models import ApiToken
+
+
+class Command(BaseCommand):
+    help = 'Issue an api token for a local author and print its key'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--name', default='', help='Label shown in the admin')
+        parser.add_argument('--days', type=float, help='Days until the token expires (default: never)')
+
+    def handle(self, *args, **options):
+        try:
+            author = Author.objects.get(user__username=options['username'])
+        except Author.DoesNotExist:
+            raise CommandError(f'No local author named {options["username"]}')
+        lifetime = None if options['days'] is None else timedelta(days=options['days'])
+        token, key = ApiToken.objects.issue(author, name=options['name'], lifetime=lifetime)
+        self.stdout.write(key)
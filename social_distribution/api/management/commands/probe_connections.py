@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import breaker, federation
+from api.models import Connection, ConnectionHealth
+
+
+class Command(BaseCommand):
+    help = 'Probe nodes whose circuit breaker is open and close the breaker once they answer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and probe every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            tripped = Connection.objects.filter(health__state__in=[ConnectionHealth.State.OPEN, ConnectionHealth.State.HALF_OPEN])
+            for connection in tripped:
+                # allow() only probes once the cool-down is over and this process wins the half-open claim
+                state = 'closed' if breaker.allow(connection, federation.probe) else 'open'
+                self.stdout.write(f'{connection.name}: {state}')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
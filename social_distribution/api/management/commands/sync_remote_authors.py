@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import directory
+from api.models import Connection
+
+
+class Command(BaseCommand):
+    help = 'Mirror the author directories (and optionally public posts) of remote nodes into RemoteAuthor and RemotePost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connection', help='Only sync the connection with this name')
+        parser.add_argument('--posts', action='store_true', help='Also mirror the public posts of every author')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and sync every INTERVAL seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            connections = Connection.objects.exclude(name='localhost')
+            if options['connection']:
+                connections = connections.filter(name=options['connection'])
+
+            stats = directory.sync(connections)
+            for name, (created, updated, deleted) in stats.items():
+                self.stdout.write(f'{name}: {created} new, {updated} updated, {deleted} removed')
+            if options['posts']:
+                for name, (created, updated, deleted) in directory.sync_posts(connections).items():
+                    self.stdout.write(f'{name} posts: {created} new, {updated} updated, {deleted} removed')
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
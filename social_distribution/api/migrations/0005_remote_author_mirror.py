@@ -0,0 +1,34 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_auto_20210411_1701'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='authors_synced',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RemoteAuthor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remote_id', models.CharField(db_index=True, max_length=200)),
+                ('displayName', models.CharField(blank=True, db_index=True, max_length=200)),
+                ('data', models.JSONField()),
+                ('synced', models.DateTimeField(default=django.utils.timezone.now)),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remote_authors', to='api.connection')),
+            ],
+            options={
+                'unique_together': {('connection', 'remote_id')},
+            },
+        ),
+    ]
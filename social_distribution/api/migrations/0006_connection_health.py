@@ -0,0 +1,31 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_remote_author_mirror'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConnectionHealth',
+            fields=[
+                ('connection', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='health', serialize=False, to='api.connection')),
+                ('state', models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half-open', 'Half Open')], default='closed', max_length=10)),
+                ('opened_at', models.DateTimeField(blank=True, null=True)),
+                ('retry_at', models.DateTimeField(blank=True, null=True)),
+                ('window_calls', models.IntegerField(default=0)),
+                ('window_failures', models.IntegerField(default=0)),
+                ('avg_latency_ms', models.IntegerField(default=0)),
+                ('last_error', models.CharField(blank=True, max_length=200)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'connection health',
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_connection_health'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=200)),
+                ('path', models.CharField(max_length=300)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('delivered', 'Delivered'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('lease_until', models.DateTimeField(blank=True, null=True)),
+                ('leased_by', models.CharField(blank=True, max_length=100)),
+                ('last_status', models.IntegerField(blank=True, null=True)),
+                ('last_error', models.CharField(blank=True, max_length=200)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('delivered', models.DateTimeField(blank=True, null=True)),
+                ('connection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='api.connection')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboxitem',
+            index=models.Index(fields=['status', 'next_attempt'], name='api_outboxi_status_e2e077_idx'),
+        ),
+    ]
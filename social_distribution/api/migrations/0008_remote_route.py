@@ -0,0 +1,40 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def route_mirrored_authors(apps, schema_editor):
+    RemoteAuthor = apps.get_model('api', 'RemoteAuthor')
+    RemoteRoute = apps.get_model('api', 'RemoteRoute')
+    routes = {}
+    for remote_id, connection_id in RemoteAuthor.objects.values_list('remote_id', 'connection_id'):
+        remote_id = remote_id.strip().rstrip('/').rsplit('/', 1)[-1]
+        routes.setdefault(remote_id, RemoteRoute(kind='author', remote_id=remote_id, connection_id=connection_id))
+    RemoteRoute.objects.bulk_create(routes.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RemoteRoute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('author', 'Author'), ('post', 'Post')], default='author', max_length=10)),
+                ('remote_id', models.CharField(max_length=200)),
+                ('author_id', models.CharField(blank=True, max_length=200)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('connection', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='routes', to='api.connection')),
+            ],
+            options={
+                'unique_together': {('kind', 'remote_id')},
+            },
+        ),
+        migrations.RunPython(route_mirrored_authors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.6 on 2026-10-18 03:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_remote_route'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='connection',
+            name='posts_synced',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='RemotePost',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('remote_id', models.CharField(max_length=200)),
+                ('author_id', models.CharField(blank=True, max_length=200)),
+                ('timestamp', models.DateTimeField()),
+                ('data', models.JSONField()),
+                ('synced', models.DateTimeField(default=django.utils.timezone.now)),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='remote_posts', to='api.connection')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='remotepost',
+            index=models.Index(fields=['-timestamp', '-remote_id'], name='remotepost_timeline_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='remotepost',
+            unique_together={('connection', 'remote_id')},
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def fill_search_names(apps, schema_editor):
+    RemoteAuthor = apps.get_model('api', 'RemoteAuthor')
+    authors = []
+    for author in RemoteAuthor.objects.only('pk', 'displayName').iterator(chunk_size=500):
+        author.search_name = author.displayName.lower()[:200]
+        authors.append(author)
+        if len(authors) == 500:
+            RemoteAuthor.objects.bulk_update(authors, ['search_name'])
+            authors = []
+    RemoteAuthor.objects.bulk_update(authors, ['search_name'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_api_token'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='remoteauthor',
+            name='search_name',
+            field=models.CharField(blank=True, db_index=True, max_length=200),
+        ),
+        migrations.RunPython(fill_search_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='remoteauthor',
+            name='displayName',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
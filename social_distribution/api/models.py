@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils import timezone
+import hashlib
+import secrets
 import uuid
 
 # Create your models here.
@@ -13,8 +16,191 @@ class Connection(models.Model):
     outgoing_username = models.CharField(max_length=20, null=True, blank=True)
     outgoing_password = models.CharField(max_length=20, null=True, blank=True)
 
+    # Last time the remote author directory was mirrored into RemoteAuthor
+    authors_synced = models.DateTimeField(null=True, blank=True)
+    # Last time the remote public posts were mirrored into RemotePost
+    posts_synced = models.DateTimeField(null=True, blank=True)
+
     def is_authenticated(self):
         return True
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class RemoteAuthor(models.Model):
+    """
+    Local copy of an entry in a remote node's `service/authors` listing.
+    Kept up to date by api.directory so views don't have to download whole directories.
+    """
+    connection = models.ForeignKey(Connection, on_delete=models.CASCADE, related_name='remote_authors')
+    remote_id = models.CharField(max_length=200, db_index=True)
+    displayName = models.CharField(max_length=200, blank=True)
+    # Lower-cased displayName, for directory.search's indexed prefix lookups
+    search_name = models.CharField(max_length=200, blank=True, db_index=True)
+    data = models.JSONField()
+    synced = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('connection', 'remote_id')
+
+    def save(self, *args, **kwargs):
+        self.search_name = self.displayName.lower()[:200]
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.displayName
+
+
+class RemotePost(models.Model):
+    """
+    Local copy of a public post listed by a remote node, for timelines.
+    Kept up to date by api.directory alongside the author mirror.
+    """
+    connection = models.ForeignKey(Connection, on_delete=models.CASCADE, related_name='remote_posts')
+    remote_id = models.CharField(max_length=200)
+    author_id = models.CharField(max_length=200, blank=True)
+    timestamp = models.DateTimeField()
+    data = models.JSONField()
+    synced = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('connection', 'remote_id')
+        # Timelines read newest first
+        indexes = [models.Index(fields=['-timestamp', '-remote_id'], name='remotepost_timeline_idx')]
+
+    def __str__(self):
+        return self.data.get('title', self.remote_id)
+
+
+class ConnectionHealth(models.Model):
+    """
+    Circuit breaker state for a Connection, shared by every worker through the database.
+    Written by api.breaker; the counters describe the last window seen by the writing worker.
+    """
+    class State(models.TextChoices):
+        CLOSED = 'closed'
+        OPEN = 'open'
+        HALF_OPEN = 'half-open'
+
+    connection = models.OneToOneField(Connection, on_delete=models.CASCADE, primary_key=True, related_name='health')
+    state = models.CharField(max_length=10, choices=State.choices, default=State.CLOSED)
+    opened_at = models.DateTimeField(null=True, blank=True)
+    retry_at = models.DateTimeField(null=True, blank=True)
+
+    window_calls = models.IntegerField(default=0)
+    window_failures = models.IntegerField(default=0)
+    avg_latency_ms = models.IntegerField(default=0)
+    last_error = models.CharField(max_length=200, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'connection health'
+
+    def __str__(self):
+        return f'{self.connection} ({self.state})'
+
+
+class OutboxItem(models.Model):
+    """
+    A payload waiting to be POSTed to a remote inbox by `manage.py federation_worker`.
+    connection stays empty until the worker has found which node hosts the recipient.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        DELIVERED = 'delivered'
+        FAILED = 'failed'
+
+    connection = models.ForeignKey(Connection, on_delete=models.CASCADE, null=True, blank=True, related_name='outbox')
+    recipient = models.CharField(max_length=200)
+    path = models.CharField(max_length=300)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    lease_until = models.DateTimeField(null=True, blank=True)
+    leased_by = models.CharField(max_length=100, blank=True)
+
+    last_status = models.IntegerField(null=True, blank=True)
+    last_error = models.CharField(max_length=200, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    delivered = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        return f'{self.payload.get("type", "item")} for {self.recipient} ({self.status})'
+
+
+class RemoteRoute(models.Model):
+    """
+    Which Connection hosts a remote author or post, so looking one up costs a single request.
+    An empty connection is a negative entry: no node knew the id when it was last checked.
+    Maintained by api.routing.
+    """
+    class Kind(models.TextChoices):
+        AUTHOR = 'author'
+        POST = 'post'
+
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.AUTHOR)
+    remote_id = models.CharField(max_length=200)
+    connection = models.ForeignKey(Connection, on_delete=models.CASCADE, null=True, blank=True, related_name='routes')
+    # For posts, the author they were reached through
+    author_id = models.CharField(max_length=200, blank=True)
+    updated = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('kind', 'remote_id')
+
+    def __str__(self):
+        return f'{self.kind} {self.remote_id} -> {self.connection or "unknown"}'
+
+
+def hash_token(key):
+    # Keys are long random strings, so a fast hash is enough; only the hash is stored
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ApiTokenManager(models.Manager):
+    def issue(self, author, name='', lifetime=None):
+        """
+        New token for a local author.
+        Parameters
+        ----------
+        author: the Author the token acts as
+        name: label shown in the admin
+        lifetime: timedelta until the token expires, or None for a token that only ends when revoked
+        Returns
+        -------
+        (ApiToken, key). The key is not stored and can't be shown again.
+        """
+        key = secrets.token_urlsafe(32)
+        expires = None if lifetime is None else timezone.now() + lifetime
+        return self.create(author=author, name=name, key_hash=hash_token(key), expires=expires), key
+
+
+class ApiToken(models.Model):
+    """
+    Credential for scripted api clients, sent as "Authorization: Token <key>" instead of a username and
+    password in the body. Checked by social_distribution.authentication.TokenAuth.
+    """
+    author = models.ForeignKey('Profile.Author', on_delete=models.CASCADE, related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    key_hash = models.CharField(max_length=64, unique=True)
+    created = models.DateTimeField(default=timezone.now)
+    expires = models.DateTimeField(null=True, blank=True)
+    revoked = models.DateTimeField(null=True, blank=True)
+
+    objects = ApiTokenManager()
+
+    def is_active(self):
+        return self.revoked is None and (self.expires is None or self.expires > timezone.now())
+
+    def revoke(self):
+        self.revoked = timezone.now()
+        self.save(update_fields=['revoked'])
+
+    def __str__(self):
+        return f'{self.name or "token"} for {self.author}'
@@ -0,0 +1,148 @@
+import os
+import random
+import socket
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import federation, routing
+from .models import Connection, OutboxItem
+
+
+MAX_ATTEMPTS = getattr(settings, 'FEDERATION_OUTBOX_MAX_ATTEMPTS', 8)
+RETRY_BASE = getattr(settings, 'FEDERATION_OUTBOX_RETRY_BASE', 30)
+LEASE_SECONDS = getattr(settings, 'FEDERATION_OUTBOX_LEASE', 120)
+
+DELIVERED_STATUSES = (200, 201, 202, 204, 304)
+
+Status = OutboxItem.Status
+
+# Sent with item= once a remote inbox has accepted it, for bookkeeping that must wait for delivery
+delivered = Signal()
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(recipient, payload, connection=None, path=None):
+    """
+    Queue payload for the inbox of remote author `recipient`. Returns immediately;
+    delivery, retries and finding the recipient's node are left to the worker.
+    """
+    return OutboxItem.objects.create(
+        recipient=recipient,
+        payload=payload,
+        connection=connection,
+        path=path or f'service/author/{recipient}/inbox/',
+    )
+
+
+def claim(worker, limit=50, lease=LEASE_SECONDS):
+    """
+    Lease up to `limit` due items for this worker. An item whose lease ran out (crashed worker)
+    becomes claimable again, so every item is delivered at least once.
+    """
+    now = timezone.now()
+    claimable = Q(status=Status.PENDING, next_attempt__lte=now) & (Q(lease_until__isnull=True) | Q(lease_until__lt=now))
+    ids = list(OutboxItem.objects.filter(claimable).order_by('next_attempt').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+
+    lease_until = now + timedelta(seconds=lease)
+    # Re-checking the condition in the UPDATE keeps two workers from leasing the same row
+    OutboxItem.objects.filter(claimable, id__in=ids).update(lease_until=lease_until, leased_by=worker)
+    return list(OutboxItem.objects.select_related('connection').filter(id__in=ids, leased_by=worker, lease_until=lease_until))
+
+
+def _resolve(item, connections):
+    """
+    Find the node hosting the recipient through the routing index.
+    """
+    return routing.author_connection(item.recipient, connections)
+
+
+def _retry(item, now, error='', status=None):
+    item.attempts += 1
+    item.last_error = error[:200]
+    item.last_status = status
+    if item.attempts >= MAX_ATTEMPTS:
+        item.status = Status.FAILED
+    else:
+        delay = RETRY_BASE * (2 ** (item.attempts - 1))
+        item.next_attempt = now + timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _renew(item, lease):
+    """
+    Extend the lease of item before posting it. False if it ran out and another worker has claimed the item since.
+    """
+    lease_until = timezone.now() + timedelta(seconds=lease)
+    return OutboxItem.objects.filter(id=item.id, leased_by=item.leased_by).update(lease_until=lease_until) == 1
+
+
+def _save(item):
+    """
+    Write the outcome of an attempt and release the lease, unless another worker holds the item by now.
+    Returns whether it was written.
+    """
+    return OutboxItem.objects.filter(id=item.id, leased_by=item.leased_by).update(
+        connection=item.connection, status=item.status, attempts=item.attempts, next_attempt=item.next_attempt,
+        last_status=item.last_status, last_error=item.last_error, delivered=item.delivered,
+        lease_until=None, leased_by='') == 1
+
+
+def deliver(items, lease=LEASE_SECONDS):
+    """
+    POST leased items, grouped per Connection so each node's keep-alive session is reused.
+    Each item's lease is renewed for `lease` seconds just before it is posted and its outcome written right after,
+    so a slow node can't keep the rest of the batch past its lease; items another worker has claimed meanwhile
+    are left to it.
+    Returns the number of items delivered.
+    """
+    connections = list(Connection.objects.exclude(name='localhost'))
+    batches = defaultdict(list)
+    unresolved = []
+    for item in items:
+        if item.connection_id is None:
+            item.connection = _resolve(item, connections)
+        if item.connection is None:
+            unresolved.append(item)
+        else:
+            batches[item.connection_id].append(item)
+
+    now = timezone.now()
+    for item in unresolved:
+        _retry(item, now, 'No node knows this author')
+        _save(item)
+
+    delivered_count = 0
+    for batch in batches.values():
+        connection = batch[0].connection
+        for item in batch:
+            if not _renew(item, lease):
+                continue
+            response = federation.post(connection, item.path, item.payload)
+            now = timezone.now()
+            if response is None:
+                _retry(item, now, 'Node unreachable')
+            elif response.status_code in DELIVERED_STATUSES:
+                item.status = Status.DELIVERED
+                item.delivered = now
+                item.last_status = response.status_code
+                item.attempts += 1
+            elif 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                # The node rejected the payload itself; retrying won't help
+                item.status = Status.FAILED
+                item.attempts += 1
+                item.last_status = response.status_code
+            else:
+                _retry(item, now, f'HTTP {response.status_code}', response.status_code)
+            if _save(item) and item.status == Status.DELIVERED:
+                delivered_count += 1
+                delivered.send(sender=OutboxItem, item=item)
+    return delivered_count
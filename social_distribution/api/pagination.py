@@ -0,0 +1,272 @@
+"""
+Pagination for the api list endpoints.
+
+Two modes, both bounded by API_MAX_PAGE_SIZE:
+- ?page=N&size=M, as in the project spec (1-based page numbers)
+- ?cursor=...&size=M, an opaque keyset cursor; pages cost the same however deep they are
+Requests without page, size or cursor get the whole list as a bare json list, as remote nodes expect.
+
+A list is made of one or more Sections (a queryset, the fields it is ordered by, and how to serialize
+a row), read one after the other. Cursors remember the section and the ordering values of a row.
+
+Streamed pages (paginate(..., stream=True)) pick their rows by ordering values only, then load, serialize
+and write the full rows API_STREAM_CHUNK_SIZE at a time, so a worker never holds a whole page of posts.
+"""
+import base64
+import json
+from itertools import groupby
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+
+PAGE_SIZE = getattr(settings, 'API_PAGE_SIZE', 50)
+MAX_PAGE_SIZE = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+STREAM_CHUNK_SIZE = getattr(settings, 'API_STREAM_CHUNK_SIZE', 20)
+
+
+class Section:
+    """
+    Parameters
+    ----------
+    queryset: rows of this section; its own ordering is replaced by ordering
+    ordering: field names, '-' for descending, ending in a unique field
+    serialize: row -> json
+    """
+
+    def __init__(self, queryset, ordering, serialize):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.serialize = serialize
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+
+    def ordered(self, backwards=False):
+        if backwards:
+            return self.queryset.order_by(*(name[1:] if name.startswith('-') else '-' + name for name in self.ordering))
+        return self.queryset.order_by(*self.ordering)
+
+    def after(self, values, backwards=False):
+        """
+        Rows that come after (or before, when backwards) the row with the given ordering values.
+        """
+        condition = Q()
+        for i, (name, value) in enumerate(zip(self.ordering, values)):
+            descending = name.startswith('-') != backwards
+            step = Q(**{f'{self.fields[i].name}__{"lt" if descending else "gt"}': value})
+            for field, previous in zip(self.fields[:i], values[:i]):
+                step &= Q(**{field.name: previous})
+            condition |= step
+        return self.ordered(backwards).filter(condition)
+
+    def light(self):
+        """
+        This section with only the ordering values and primary key of its rows loaded.
+        """
+        names = {field.name for field in self.fields} | {self.queryset.model._meta.pk.name}
+        queryset = self.queryset.select_related(None).prefetch_related(None).only(*names)
+        return Section(queryset, self.ordering, self.serialize)
+
+    def key(self, row):
+        return [field.value_to_string(row) for field in self.fields]
+
+    def parse(self, key):
+        if not isinstance(key, list) or len(key) != len(self.fields):
+            raise ValueError(key)
+        return [field.to_python(value) for field, value in zip(self.fields, key)]
+
+
+def _size(request):
+    try:
+        size = int(request.query_params.get('size', PAGE_SIZE))
+    except ValueError:
+        raise NotFound('Invalid page size.')
+    return min(max(size, 1), MAX_PAGE_SIZE)
+
+
+def _encode(section, key, backwards):
+    data = json.dumps({'s': section, 'k': key, 'b': int(backwards)}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _decode(cursor, sections):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        section = int(data['s'])
+        if not 0 <= section < len(sections):
+            raise ValueError(section)
+        return section, sections[section].parse(data['k']), bool(data['b'])
+    except (ValueError, TypeError, KeyError, ValidationError):
+        raise NotFound('Invalid cursor.')
+
+
+def _json(value):
+    # JSONRenderer renders None as an empty body, not null
+    return b'null' if value is None else JSONRenderer().render(value)
+
+
+class Page:
+    def __init__(self, request, sections, rows, next_query=None, prev_query=None, explicit=False, stream=False):
+        self.sections = sections
+        self.rows = rows
+        self.next = self._link(request, next_query)
+        self.prev = self._link(request, prev_query)
+        # Clients that asked for a page get the spec's envelope; plain requests keep the bare list
+        self.explicit = explicit
+        self.stream = stream
+
+    @property
+    def items(self):
+        return list(self._items())
+
+    def _items(self):
+        if not self.stream:
+            for i, row in self.rows:
+                yield self.sections[i].serialize(row)
+            return
+        # Rows were picked with Section.light; load the full ones a chunk at a time, in page order
+        for start in range(0, len(self.rows), STREAM_CHUNK_SIZE):
+            for i, chunk in groupby(self.rows[start:start + STREAM_CHUNK_SIZE], key=lambda entry: entry[0]):
+                section = self.sections[i]
+                for row in section.ordered().filter(pk__in=[row.pk for _, row in chunk]):
+                    yield section.serialize(row)
+
+    def _render(self, kind, extra):
+        # Byte for byte what Response would render for the same page
+        envelope = self.explicit or extra
+        yield JSONRenderer().render({'type': kind, **extra})[:-1] + b',"items":[' if envelope else b'['
+        for n, item in enumerate(self._items()):
+            yield (b',' if n else b'') + JSONRenderer().render(item)
+        yield b'],"next":' + _json(self.next) + b',"prev":' + _json(self.prev) + b'}' if envelope else b']'
+
+    @staticmethod
+    def _link(request, query):
+        if query is None:
+            return None
+        params = request.query_params.copy()
+        for name in ('page', 'cursor'):
+            params.pop(name, None)
+        params.update(query)
+        return request.build_absolute_uri(request.path + '?' + urlencode(sorted(params.items())))
+
+    def response(self, kind, **extra):
+        """
+        Response for this page. kind is the spec's 'type' of the list; extra keys go in the envelope
+        and force it even for unpaginated requests.
+        """
+        links = [f'<{url}>; rel="{rel}"' for rel, url in (('next', self.next), ('prev', self.prev)) if url]
+        headers = {'Link': ', '.join(links)} if links else None
+        if self.stream:
+            response = StreamingHttpResponse(self._render(kind, extra), content_type='application/json')
+            for name, value in (headers or {}).items():
+                response[name] = value
+            return response
+        if not self.explicit and not extra:
+            return Response(self.items, headers=headers)
+        return Response({'type': kind, **extra, 'items': self.items, 'next': self.next, 'prev': self.prev},
+                        headers=headers)
+
+
+def _walk(sections, start, key, size, backwards):
+    # Up to size + 1 (section, row) pairs from the given position, crossing into the following sections;
+    # every row when size is None
+    order = range(start, -1, -1) if backwards else range(start, len(sections))
+    rows = []
+    for i in order:
+        section = sections[i]
+        if i == start and key is not None:
+            queryset = section.after(key, backwards)
+        else:
+            queryset = section.ordered(backwards)
+        if size is None:
+            rows += [(i, row) for row in queryset]
+            continue
+        rows += [(i, row) for row in queryset[:size + 1 - len(rows)]]
+        if len(rows) > size:
+            break
+    return rows
+
+
+def _by_cursor(request, sections, size):
+    start, key, backwards = _decode(request.query_params['cursor'], sections)
+    rows = _walk(sections, start, key, size, backwards)
+    more = len(rows) > size
+    rows = rows[:size]
+    if backwards:
+        rows.reverse()
+
+    next_query = prev_query = None
+    if rows:
+        if more or backwards:
+            last = rows[-1]
+            next_query = {'cursor': _encode(last[0], sections[last[0]].key(last[1]), False)}
+        if more or not backwards:
+            first = rows[0]
+            prev_query = {'cursor': _encode(first[0], sections[first[0]].key(first[1]), True)}
+    return rows, next_query, prev_query
+
+
+def _by_number(request, sections, size):
+    try:
+        number = int(request.query_params.get('page', 1))
+    except ValueError:
+        raise NotFound('Invalid page.')
+    number = max(number, 1)
+
+    skip = (number - 1) * size
+    rows = []
+    for i, section in enumerate(sections):
+        queryset = section.ordered()
+        if skip:
+            count = queryset.count()
+            if skip >= count:
+                skip -= count
+                continue
+        rows += [(i, row) for row in queryset[skip:skip + size + 1 - len(rows)]]
+        skip = 0
+        if len(rows) > size:
+            break
+
+    more = len(rows) > size
+    next_query = {'page': number + 1} if more else None
+    prev_query = {'page': number - 1} if number > 1 else None
+    return rows[:size], next_query, prev_query
+
+
+def paginate(request, *sections, stream=False):
+    """
+    The page of sections a request asked for.
+    Parameters
+    ----------
+    request: DRF request; reads page, size and cursor from its query string
+    sections: Sections, listed in the order they are read
+    stream: whether Page.response streams the json, loading rows in chunks
+    Returns
+    -------
+    A Page of rows. Only clients that pass page, size or cursor are paged; plain requests get every row.
+    """
+    params = request.query_params
+    explicit = any(name in params for name in ('page', 'size', 'cursor'))
+    walked = [section.light() for section in sections] if stream else sections
+    if not explicit:
+        return Page(request, sections, _walk(walked, 0, None, None, False), stream=stream)
+
+    size = _size(request)
+    if 'cursor' in params:
+        rows, next_query, prev_query = _by_cursor(request, walked, size)
+    elif 'page' in params:
+        rows, next_query, prev_query = _by_number(request, walked, size)
+    else:
+        rows = _walk(walked, 0, None, size, False)
+        next_query = None
+        if len(rows) > size:
+            rows = rows[:size]
+            last = rows[-1]
+            next_query = {'cursor': _encode(last[0], walked[last[0]].key(last[1]), False)}
+        prev_query = None
+    return Page(request, sections, rows, next_query, prev_query, explicit, stream)
@@ -0,0 +1,137 @@
+"""
+Plain-dict serializers for the hot federation endpoints.
+
+Each function builds the same json as its DRF serializer in serializers.py (same keys, same order,
+same value formats) without going through DRF's per-field machinery. The site domain and the
+serialized authors are looked up once per response and shared through a Context.
+The list views render their pages with these, one row at a time (see post_page, author_page and
+inbox_page in views.py). Keep them in step with serializers.py; api.tests.PlainSerializerTest checks
+that those views render what the serializers would.
+"""
+from django.contrib.sites.models import Site
+from django.urls import reverse
+from django.utils import timezone
+
+from Profile import images
+from .serializers import FriendRequestSerializer, PostSerializer
+
+
+class Context:
+    """
+    Per-response state: the site domain and every author serialized so far.
+    """
+
+    def __init__(self):
+        self.domain = Site.objects.get_current().domain
+        self.authors = {}
+        # FriendRequest.url is the api author url of the request's own id
+        self.request_url = self.domain + reverse('api:author', kwargs={'author_id': '0'})[:-1]
+
+
+def _datetime(value):
+    # Same format as rest_framework.fields.DateTimeField with the default ISO 8601 setting
+    if not value:
+        return None
+    if isinstance(value, str):
+        return value
+    tz = timezone.get_current_timezone()
+    value = value.astimezone(tz) if timezone.is_aware(value) else timezone.make_aware(value, tz)
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def author(instance, context):
+    """
+    Same as AuthorSerializer(instance).data. Authors are cached in context by primary key.
+    """
+    if instance is None:
+        return None
+    data = context.authors.get(instance.pk)
+    if data is None:
+        host = instance.remote_host or context.domain
+        data = context.authors[instance.pk] = {
+            'type': 'author',
+            'id': _str(instance.id),
+            'displayName': instance.displayName,
+            'bio': _str(instance.bio),
+            'location': _str(instance.location),
+            'url': host + 'author/' + str(instance.id),
+            'birth_date': instance.birth_date.isoformat() if instance.birth_date else None,
+            'github': _str(instance.github),
+            'host': host,
+        }
+    return data
+
+
+def comment(instance, context):
+    """
+    Same as CommentSerializer(instance).data. Comment.url raises on json authors, so DRF leaves it out.
+    """
+    return {
+        'type': 'comment',
+        'author': instance.author,
+        'content': _str(instance.content),
+        'timestamp': _datetime(instance.timestamp),
+        'id': _str(instance.id),
+    }
+
+
+def post(instance, context):
+    """
+    Same as PostSerializer(instance).data. Expects the preloading done by PostSerializer.setup_eager_loading.
+    """
+    host = context.domain if instance._host == '' else instance._host
+    data = {
+        'type': 'post',
+        'title': _str(instance.title),
+        'id': _str(instance.id),
+        'source': _str(instance.source),
+        'origin': _str(instance.origin),
+        'description': _str(instance.description),
+        'contentType': instance.contentType,
+        'content': (instance.image_id and images.data_url(instance.image_id, instance.contentType)) or _str(instance.content),
+        'author': author(instance.author, context),
+    }
+    # Post.url raises without an author, which DRF treats as a field to skip
+    if instance.author is not None:
+        data['url'] = host + 'author/' + str(instance.author.id) + '/posts/' + str(instance.id)
+    data['comments'] = [comment(c, context) for c in instance.comments.all()]
+    data['categories'] = [category.pk for category in instance.categories.all()]
+    data['timestamp'] = _datetime(instance.timestamp)
+    data['visibility'] = instance.visibility
+    data['unlisted'] = bool(instance.unlisted)
+    data['host'] = host
+    return data
+
+
+def like(instance, context):
+    """
+    Same as PostLikeSerializer(instance).data. Like.summary and Like.url raise for stored likes,
+    so DRF leaves both out.
+    """
+    return {'type': 'Like', 'author': instance.author, 'host': context.domain}
+
+
+def friend_request(instance, context):
+    """
+    Same as FriendRequestSerializer(instance).data. Expects FriendRequestSerializer.setup_eager_loading.
+    """
+    if instance.sender_id is not None:
+        sender = author(instance.sender, context)
+    else:
+        sender = {'type': 'author', 'id': instance.remote_sender, 'displayName': instance.remote_username}
+    return {
+        'type': 'Follow',
+        'summary': instance.summary,
+        'sender': sender,
+        'receiver': author(instance.receiver, context),
+        'url': context.request_url + str(instance.id),
+        'host': context.domain,
+    }
+
@@ -0,0 +1,146 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import federation
+from .models import Connection, RemoteRoute
+
+
+NEGATIVE_TTL = getattr(settings, 'FEDERATION_ROUTE_NEGATIVE_TTL', 300)
+
+Kind = RemoteRoute.Kind
+
+
+def key(remote_id):
+    """
+    Bare id of a remote author or post. Nodes send ids either as-is or as urls ending in the id.
+    """
+    return str(remote_id).strip().rstrip('/').rsplit('/', 1)[-1]
+
+
+def learn(remote_id, connection, kind=Kind.AUTHOR, author_id=''):
+    """
+    Record that connection hosts remote_id. Called whenever a node tells us about one of its authors or posts.
+    """
+    if not remote_id or connection is None:
+        return
+    RemoteRoute.objects.update_or_create(kind=kind, remote_id=key(remote_id), defaults={
+        'connection': connection,
+        'author_id': key(author_id) if author_id else '',
+        'updated': timezone.now(),
+    })
+
+
+def learn_authors(connection, remote_ids):
+    """
+    Bulk version of learn() for a node's whole author listing.
+    """
+    keys = {key(remote_id) for remote_id in remote_ids if remote_id}
+    if not keys:
+        return
+    now = timezone.now()
+    RemoteRoute.objects.filter(kind=Kind.AUTHOR, remote_id__in=keys).exclude(connection=connection) \
+        .update(connection=connection, updated=now)
+    RemoteRoute.objects.bulk_create([RemoteRoute(kind=Kind.AUTHOR, remote_id=k, connection=connection, updated=now)
+                                     for k in keys], ignore_conflicts=True)
+
+
+def learn_from_payload(payload, connection):
+    """
+    Route the author (and post) an incoming inbox payload is about to the node that sent it.
+    """
+    if not isinstance(payload, dict):
+        return
+    kind = str(payload.get('type', '')).lower()
+    author = (payload.get('sender') or payload.get('actor')) if kind == 'follow' else payload.get('author')
+    if not isinstance(author, dict) or not author.get('id'):
+        return
+    learn(author['id'], connection)
+    if kind == 'post' and payload.get('id'):
+        learn(payload['id'], connection, Kind.POST, author['id'])
+
+
+def _cached(kind, keys):
+    # Positive routes, plus negative ones that have not expired yet
+    fresh_after = timezone.now() - timedelta(seconds=NEGATIVE_TTL)
+    found = {}
+    for route in RemoteRoute.objects.select_related('connection').filter(kind=kind, remote_id__in=keys):
+        if route.connection_id is not None or route.updated >= fresh_after:
+            found[route.remote_id] = route.connection
+    return found
+
+
+def _discover(keys, connections):
+    """
+    Ask every node about the ids nobody has routed yet, all at once.
+    Ids no node answered for get a negative entry.
+    """
+    jobs = [((c.id, k), c, f'service/author/{k}/') for k in keys for c in connections]
+    answered = federation.fetch_all(jobs)
+
+    found = {}
+    for connection in connections:
+        for k in keys:
+            if k not in found and (connection.id, k) in answered:
+                found[k] = connection
+
+    now = timezone.now()
+    for k in keys:
+        RemoteRoute.objects.update_or_create(kind=Kind.AUTHOR, remote_id=k,
+                                             defaults={'connection': found.get(k), 'updated': now})
+    return found
+
+
+def author_connections(author_ids, connections=None):
+    """
+    Find the Connection hosting each remote author.
+    Parameters
+    ----------
+    author_ids: remote author ids (bare or as urls)
+    connections: nodes to ask about unknown ids; defaults to every remote connection
+    Returns
+    -------
+    A dict of author id (as given) -> Connection, or None for authors no node knows about.
+    """
+    keys = {author_id: key(author_id) for author_id in author_ids}
+    found = _cached(Kind.AUTHOR, set(keys.values()))
+
+    missing = set(keys.values()) - set(found)
+    if missing:
+        if connections is None:
+            connections = Connection.objects.exclude(name='localhost')
+        found.update(_discover(sorted(missing), list(connections)))
+
+    return {author_id: found.get(k) for author_id, k in keys.items()}
+
+
+def author_connection(author_id, connections=None):
+    """
+    The Connection hosting a remote author, or None if no node knows them.
+    """
+    return author_connections([author_id], connections)[author_id]
+
+
+def post_connection(author_id, post_id):
+    """
+    The Connection hosting a remote post: the one it was last seen on, otherwise its author's.
+    """
+    found = _cached(Kind.POST, {key(post_id)})
+    if found:
+        return next(iter(found.values()))
+    connection = author_connection(author_id)
+    if connection is not None:
+        learn(post_id, connection, Kind.POST, author_id)
+    return connection
+
+
+def find_authors(author_ids):
+    """
+    Fetch remote authors from the node hosting each of them, concurrently.
+    Returns a dict of author id -> author json for the authors that were found.
+    """
+    routes = author_connections(author_ids)
+    jobs = [(author_id, connection, f'service/author/{key(author_id)}/')
+            for author_id, connection in routes.items() if connection is not None]
+    return federation.fetch_all(jobs)
@@ -1,16 +1,35 @@
 from rest_framework import serializers
 
 from Profile.models import Author, Post, Comment, PostLike, CommentLike, Inbox
+from Profile import images
 from Search.models import FriendRequest
 
 from django.contrib.auth.models import User
 
 
+def author_data(serializer, author):
+    """
+    Serialized author, shared through the serializer context so an author appearing in many rows
+    of one response is only serialized once.
+    """
+    if author is None:
+        return None
+    authors = serializer.context.setdefault('authors', {})
+    if author.pk not in authors:
+        authors[author.pk] = AuthorSerializer(author, context=serializer.context).data
+    return authors[author.pk]
+
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Author
         fields = ('type', 'id', 'displayName', 'bio', 'location', 'url', 'birth_date', 'github', 'host')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        # displayName reads author.user
+        return queryset.select_related('user')
+
 class PostSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -19,11 +38,20 @@ class PostSerializer(serializers.ModelSerializer):
                     'contentType', 'content', 'author', 'url', 'comments', 'categories', 'timestamp',
                     'visibility', 'unlisted', 'host')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Preload what to_representation reads, so serializing a list costs the same few queries at any length.
+        """
+        return queryset.select_related('author__user').prefetch_related('comments', 'categories')
+
     # https://stackoverflow.com/questions/41312558/django-rest-framework-post-nested-objects
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['author'] = AuthorSerializer(Author.objects.get(pk=data['author'])).data
-        data['comments'] = CommentSerializer(Comment.objects.filter(id__in=data['comments']), many=True).data
+        if instance.image_id:
+            data['content'] = images.data_url(instance.image_id, instance.contentType) or data['content']
+        data['author'] = author_data(self, instance.author)
+        data['comments'] = CommentSerializer(instance.comments.all(), many=True).data
         return data
 
     # https://www.django-rest-framework.org/tutorial/4-authentication-and-permissions/
@@ -36,11 +64,19 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         model = FriendRequest
         fields = ('type', 'summary', 'sender', 'receiver', 'url', 'host')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('sender__user', 'receiver__user')
+
     # https://stackoverflow.com/questions/41312558/django-rest-framework-post-nested-objects
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        data['sender'] = AuthorSerializer(Author.objects.get(pk=data['sender'])).data
-        data['receiver'] = AuthorSerializer(Author.objects.get(pk=data['receiver'])).data
+        if instance.sender_id is not None:
+            data['sender'] = author_data(self, instance.sender)
+        else:
+            # Requests from other nodes only know who sent them by id
+            data['sender'] = {'type': 'author', 'id': instance.remote_sender, 'displayName': instance.remote_username}
+        data['receiver'] = author_data(self, instance.receiver)
         return data
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -72,14 +108,13 @@ class InboxSerializer(serializers.ModelSerializer):
         # https://stackoverflow.com/questions/54793036/drf-serializer-for-heterogneous-list-of-related-models
         items = []
 
-        for item in instance.follow_items.all():
-            items.append(FriendRequestSerializer(item).data)
+        follows = FriendRequestSerializer.setup_eager_loading(instance.follow_items.all())
+        items += FriendRequestSerializer(follows, many=True, context=self.context).data
 
-        for item in instance.post_items.all():
-            items.append(PostSerializer(item).data)
+        posts = PostSerializer.setup_eager_loading(instance.post_items.all())
+        items += PostSerializer(posts, many=True, context=self.context).data
 
-        for item in instance.post_like_items.all():
-            items.append(PostLikeSerializer(item).data)
+        items += PostLikeSerializer(instance.post_like_items.all(), many=True, context=self.context).data
 
 
 
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from social_distribution import authentication
+from .models import ApiToken, Connection
+
+
+@receiver(post_save, sender=Connection)
+@receiver(post_delete, sender=Connection)
+def invalidate_credentials(sender, **kwargs):
+    # Credentials may have changed; ConnectionAuth rebuilds its index on the next request
+    authentication.invalidate()
+
+
+@receiver(post_save, sender=ApiToken)
+@receiver(post_delete, sender=ApiToken)
+def forget_token(sender, instance, **kwargs):
+    # Revoked or deleted tokens stop working at once in this process, within API_AUTH_INDEX_TTL in others
+    authentication.forget_token(instance.key_hash)
@@ -1,18 +1,46 @@
 from django.test import TestCase
+from django.core.management import call_command
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
 from requests.auth import HTTPBasicAuth
 from base64 import b64encode
 from uuid import uuid4
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
+from django.utils import timezone
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import json
+import os
+import subprocess
+import tempfile
+import time
 
-from .models import Connection
-from Profile.models import Author, Post, Comment, Like, PostLike, CommentLike
-from .serializers import AuthorSerializer
+from .models import ApiToken, Connection, ConnectionHealth, OutboxItem, RemoteAuthor, RemotePost, RemoteRoute, hash_token
+from Profile.models import Author, Post, PostCategory, Comment, Like, PostLike, CommentLike
+from Search.models import FriendRequest
+from .serializers import AuthorSerializer, FriendRequestSerializer, InboxSerializer, PostSerializer
+from . import directory, federation, outbox, pagination, plain, routing
+from social_distribution import authentication, metrics
 
 # https://www.django-rest-framework.org/api-guide/testing/
 
+def isolate_metrics(test):
+    """
+    Give a test empty request metrics in a spool directory of its own.
+    """
+    root = tempfile.TemporaryDirectory()
+    test.addCleanup(root.cleanup)
+    for name, value in (('ROOT', root.name), ('_totals', {}), ('_calls', {}), ('_spool', None)):
+        patcher = mock.patch.object(metrics, name, value)
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
+
 def setup_auth():
     return Connection(
         name="test",
@@ -43,7 +71,8 @@ class AuthorsTest(APITestCase):
         url = '/authors'
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assert_('test1' in str(response.content) and 'test2' in str(response.content))
+        content = str(response.getvalue())
+        self.assert_('test1' in content and 'test2' in content)
 
     def get_specific_author(self):
         self.setup()
@@ -76,7 +105,8 @@ class PostsTest(APITestCase):
         url = '/posts'
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
-        self.assert_('Test Post 1' in str(response.content) and 'Test Post 2' in str(response.content))
+        content = str(response.getvalue())
+        self.assert_('Test Post 1' in content and 'Test Post 2' in content)
 
     def test_get_specific_post(self):
         self.setup()
@@ -169,6 +199,28 @@ class LikeTest(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assert_('test3' in str(response.content))
 
+    def test_like_post_once(self):
+        self.setup()
+        url = '/author/' + str(self.post1.author.id) + '/inbox'
+        remote_id = str(uuid4())
+        post_data = {
+            'type':'like',
+            'author':{
+                'id':'https://remote.example/author/' + remote_id,
+                'host':'https://remote.example/',
+                'displayName':'test3',
+            },
+            'postID':str(self.post1.id),
+        }
+        for _ in range(2):
+            response = self.client.post(url, post_data, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(PostLike.objects.filter(post_id=self.post1).count(), 1, 'A second like by the same author should be ignored')
+
+        response = self.client.get('/author/' + remote_id + '/liked')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.getvalue())), 1)
+
 
 class FriendTest(APITestCase):
     def setup(self):
@@ -194,4 +246,684 @@ class FriendTest(APITestCase):
         }
         response = self.client.post(url, post_data, format='json')
         self.assertEqual(response.status_code, 200)
-        self.assert_(sender_id in self.user1.author.remote_followers)
\ No newline at end of file
+        self.assert_(sender_id in self.user1.author.remote_followers)
+
+class FanOutTest(TestCase):
+    def setup(self):
+        self.fast = Connection.objects.create(name='fast', url='http://fast/')
+        self.slow = Connection.objects.create(name='slow', url='http://slow/')
+
+    def fake_get(self, method, url, **kwargs):
+        response = mock.Mock(status_code=200)
+        if url.startswith('http://slow/'):
+            time.sleep(1)
+        response.json.return_value = {'items': [{'id': url}]}
+        return response
+
+    def test_fetch_all(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get):
+            results = federation.fetch_all([('a', self.fast, 'service/authors/'), ('b', self.fast, 'service/author/1/')])
+        self.assertEqual(set(results), {'a', 'b'})
+        self.assertEqual(results['b']['items'][0]['id'], 'http://fast/service/author/1/')
+
+    def test_deadline_returns_partial_results(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get):
+            start = time.monotonic()
+            authors = federation.remote_directories([self.fast, self.slow], until=federation.deadline(0.3))
+            elapsed = time.monotonic() - start
+        self.assertLess(elapsed, 0.9, 'Slow node should not hold up the page')
+        self.assertEqual([connection for connection, _ in authors], [self.fast])
+
+
+class DirectoryTest(TestCase):
+    def setup(self):
+        self.conn = Connection.objects.create(name='remote', url='http://remote/')
+        self.listing = {'items': [
+            {'id': 'a1', 'displayName': 'alice'},
+            {'id': 'b2', 'displayName': 'bob'},
+        ]}
+
+    def fake_get(self, method, url, **kwargs):
+        response = mock.Mock(status_code=200)
+        response.json.return_value = self.listing
+        return response
+
+    def test_sync(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get):
+            stats = directory.sync()
+        self.assertEqual(stats, {'remote': (2, 0, 0)})
+
+        self.listing = {'items': [
+            {'id': 'a1', 'displayName': 'alice2'},
+            {'id': 'c3', 'displayName': 'carol'},
+        ]}
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get):
+            stats = directory.sync()
+        self.assertEqual(stats, {'remote': (1, 1, 1)})
+        self.assertEqual(set(RemoteAuthor.objects.values_list('displayName', flat=True)), {'alice2', 'carol'})
+
+    def test_sync_follows_pages(self):
+        self.setup()
+        pages = {
+            'service/authors/': {'items': [{'id': 'a1', 'displayName': 'alice'}], 'next': 'http://remote/service/authors/?page=2'},
+            'service/authors/?page=2': {'items': [{'id': 'b2', 'displayName': 'Bob'}], 'next': '/service/authors/?page=3'},
+            'service/authors/?page=3': {'items': [{'id': 'c3', 'displayName': 'carol'}]},
+        }
+
+        def fake_get(method, url, **kwargs):
+            path = url[len('http://remote/'):]
+            if path not in pages:
+                return mock.Mock(status_code=500)
+            response = mock.Mock(status_code=200)
+            response.json.return_value = pages[path]
+            return response
+
+        with mock.patch('api.federation.requests.Session.request', side_effect=fake_get):
+            self.assertEqual(directory.sync(), {'remote': (3, 0, 0)})
+        self.assertEqual([ra.remote_id for ra in directory.search('BO')], ['b2'])
+
+        # A listing that breaks off after page 1 updates what it has, but deletes nothing
+        pages['service/authors/']['items'][0]['displayName'] = 'alice2'
+        del pages['service/authors/?page=2']
+        with mock.patch('api.federation.requests.Session.request', side_effect=fake_get):
+            self.assertEqual(directory.sync(), {'remote': (0, 1, 0)})
+        self.assertEqual(RemoteAuthor.objects.count(), 3)
+
+        # So does one whose next link leaves the node
+        pages['service/authors/']['next'] = 'http://elsewhere/service/authors/?page=2'
+        with mock.patch('api.federation.requests.Session.request', side_effect=fake_get):
+            self.assertEqual(directory.sync(), {'remote': (0, 0, 0)})
+        self.assertEqual(RemoteAuthor.objects.count(), 3)
+
+    def test_lookup_uses_mirror(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get) as get:
+            self.assertIsNone(directory.lookup('b2'))
+            self.assertEqual(get.call_count, 0, 'Lookups should only read the mirror')
+
+            directory.refresh()
+            directory.refresh()
+            self.assertEqual(directory.lookup('b2').data['displayName'], 'bob')
+            self.assertEqual([ra.remote_id for ra in directory.search('ali')], ['a1'])
+            self.assertIsNone(directory.lookup('zz'))
+        self.assertEqual(get.call_count, 3, 'Directory and posts should only be downloaded once while fresh')
+
+    def test_sync_posts(self):
+        self.setup()
+        posts = {
+            'a1': [{'id': 'http://remote/author/a1/posts/p1', 'title': 'one', 'visibility': 'PUBLIC',
+                    'published': '2021-03-01T10:00:00+00:00', 'author': {'id': 'a1'}},
+                   {'id': 'p2', 'title': 'friends', 'visibility': 'FRIENDS', 'published': '2021-03-01T11:00:00+00:00'}],
+            'b2': [{'id': 'p3', 'title': 'three', 'visibility': 'PUBLIC', 'published': '2021-03-02T10:00:00Z'}],
+        }
+
+        def fake_get(method, url, **kwargs):
+            if url.endswith('service/authors/'):
+                return self.fake_get(method, url)
+            response = mock.Mock(status_code=200)
+            response.json.return_value = {'items': posts[url.split('/')[-3]]}
+            return response
+
+        with mock.patch('api.federation.requests.Session.request', side_effect=fake_get):
+            call_command('federation_worker', '--once', stdout=StringIO())
+        self.assertEqual(list(RemotePost.objects.order_by('timestamp').values_list('remote_id', 'author_id')),
+                         [('p1', 'a1'), ('p3', '')])
+
+
+class FederationClientTest(TestCase):
+    def setup(self):
+        self.conn = Connection.objects.create(name='remote', url='http://remote/', outgoing_username='u', outgoing_password='p')
+
+    def test_session_is_reused(self):
+        self.setup()
+        session = federation.session_for(self.conn)
+        self.assertIs(federation.session_for(self.conn), session)
+        self.assertEqual(session.auth, ('u', 'p'))
+
+        self.conn.outgoing_password = 'changed'
+        self.assertIsNot(federation.session_for(self.conn), session, 'New credentials should get a new session')
+
+    def test_retries_idempotent_requests(self):
+        self.setup()
+        responses = [mock.Mock(status_code=503), mock.Mock(status_code=200)]
+        with mock.patch('api.federation.requests.Session.request', side_effect=responses) as request, \
+                mock.patch('api.federation.time.sleep'):
+            response = federation.get(self.conn, 'service/authors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 2)
+        connect_timeout, read_timeout = request.call_args[1]['timeout']
+        self.assertLessEqual(connect_timeout, read_timeout)
+
+    def test_does_not_retry_post(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=federation.requests.ReadTimeout) as request, \
+                mock.patch('api.federation.time.sleep'):
+            response = federation.post(self.conn, 'service/author/1/inbox/', {'type': 'like'})
+        self.assertIsNone(response)
+        self.assertEqual(request.call_count, 1)
+
+
+class BreakerTest(TestCase):
+    def setup(self):
+        self.conn = Connection.objects.create(name='flaky', url='http://flaky/')
+
+    def test_opens_after_failures(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=federation.requests.ConnectionError) as request:
+            for _ in range(5):
+                self.assertIsNone(federation.get(self.conn, 'service/authors/', retries=0))
+            self.assertEqual(request.call_count, 5)
+
+            self.assertIsNone(federation.get(self.conn, 'service/authors/'))
+            self.assertEqual(federation.fetch_all([('a', self.conn, 'service/authors/')]), {})
+            self.assertEqual(request.call_count, 5, 'Open breaker should skip the node without a request')
+        self.assertEqual(ConnectionHealth.objects.get(connection=self.conn).state, ConnectionHealth.State.OPEN)
+
+    def test_probe_closes_breaker(self):
+        self.setup()
+        ConnectionHealth.objects.create(connection=self.conn, state=ConnectionHealth.State.OPEN,
+                                        retry_at=timezone.now() - timedelta(seconds=1))
+        with mock.patch('api.federation.requests.Session.request', return_value=mock.Mock(status_code=200)) as request:
+            response = federation.get(self.conn, 'service/authors/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 2, 'One probe, then the real request')
+        self.assertEqual(ConnectionHealth.objects.get(connection=self.conn).state, ConnectionHealth.State.CLOSED)
+
+
+class FederationTelemetryTest(TestCase):
+    def setup(self):
+        self.conn = Connection.objects.create(name='remote', url='http://remote/')
+        isolate_metrics(self)
+
+    def test_calls_are_counted(self):
+        self.setup()
+        self.assertEqual(federation.endpoint('service/author/1/posts/2/comment/'), 'comments')
+        self.assertEqual(federation.endpoint('service/author/1/post/2/likes'), 'likes')
+        self.assertEqual(federation.endpoint('service/authors/?page=2'), 'authors')
+
+        responses = [mock.Mock(status_code=503, content=b''), mock.Mock(status_code=200, content=b'{"items": []}'),
+                     federation.requests.ReadTimeout(), federation.requests.ConnectionError()]
+        with mock.patch('api.federation.requests.Session.request', side_effect=responses), \
+                mock.patch('api.federation.time.sleep'):
+            federation.get(self.conn, 'service/authors/')
+            federation.post(self.conn, 'service/author/1/inbox/', {'type': 'like'})
+            federation.post(self.conn, 'service/author/1/inbox/', {'type': 'like'})
+        calls = metrics.collect_calls(self.conn)
+        self.assertEqual({key[2:]: totals['calls'] for key, totals in calls.items()},
+                         {('authors', '503'): 1, ('authors', '200'): 1, ('inbox', 'timeout'): 1, ('inbox', 'error'): 1})
+        self.assertEqual(calls[(str(self.conn.id), 'remote', 'authors', '200')]['bytes'], 13)
+        self.assertIn('federation_requests_total{connection_id="%s",connection="remote",endpoint="inbox",outcome="timeout"} 1\n'
+                      % self.conn.id, metrics.render(**metrics.read()))
+
+    def test_admin_dashboard(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=federation.requests.ConnectTimeout):
+            federation.fetch_all([('a', self.conn, 'service/author/1/posts/')])
+        staff = User.objects.create_user('staff', 'staff@gmail.com', 'pwd', is_active=True, is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:api_connection_telemetry', args=[self.conn.pk]))
+        self.assertEqual(response.status_code, 200)
+        rows = response.context['rows']
+        self.assertEqual([(row['endpoint'], row['calls'], row['timeouts']) for row in rows], [('posts', 3, 3)])
+        telemetry_url = reverse('admin:api_connection_telemetry', args=[self.conn.pk])
+        self.assertContains(self.client.get(reverse('admin:api_connection_changelist')), telemetry_url)
+        self.assertContains(self.client.get(reverse('admin:api_connection_change', args=[self.conn.pk])), telemetry_url)
+
+
+class OutboxTest(TestCase):
+    def setup(self):
+        self.conn = Connection.objects.create(name='remote', url='http://remote/')
+        self.conn.authors_synced = timezone.now()
+        self.conn.save()
+        routing.learn('r1', self.conn)
+
+    def test_deliver(self):
+        self.setup()
+        item = outbox.enqueue('r1', {'type': 'like'})
+        with mock.patch('api.federation.requests.Session.request', return_value=mock.Mock(status_code=201)) as request:
+            self.assertEqual(outbox.deliver(outbox.claim('w1')), 1)
+        self.assertEqual(request.call_args[0][1], 'http://remote/service/author/r1/inbox/')
+
+        item.refresh_from_db()
+        self.assertEqual(item.status, OutboxItem.Status.DELIVERED)
+        self.assertEqual(item.connection, self.conn)
+        self.assertEqual(outbox.claim('w1'), [])
+
+    def test_failure_is_retried_later(self):
+        self.setup()
+        item = outbox.enqueue('r1', {'type': 'like'}, connection=self.conn)
+        with mock.patch('api.federation.requests.Session.request', return_value=mock.Mock(status_code=500)):
+            self.assertEqual(outbox.deliver(outbox.claim('w1')), 0)
+
+        item.refresh_from_db()
+        self.assertEqual(item.status, OutboxItem.Status.PENDING)
+        self.assertEqual(item.attempts, 1)
+        self.assertGreater(item.next_attempt, timezone.now())
+        self.assertIsNone(item.lease_until)
+
+    def test_claims_do_not_overlap(self):
+        self.setup()
+        outbox.enqueue('r1', {'type': 'like'}, connection=self.conn)
+        self.assertEqual(len(outbox.claim('w1')), 1)
+        self.assertEqual(outbox.claim('w2'), [], 'A leased item should not be handed to a second worker')
+
+        OutboxItem.objects.update(lease_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(len(outbox.claim('w2')), 1, 'An expired lease should be claimable again')
+
+    def test_slow_batch_keeps_its_leases(self):
+        self.setup()
+        for _ in range(3):
+            outbox.enqueue('r1', {'type': 'like'}, connection=self.conn)
+        items = outbox.claim('w1', lease=60)
+        taken = []
+
+        def slow_post(method, url, **kwargs):
+            # Each post outlasts the lease the batch was claimed with: all but the item being posted, whose lease
+            # was just renewed, expire, and w2 takes them
+            waiting = OutboxItem.objects.filter(leased_by='w1').order_by('-lease_until').values_list('id', flat=True)[1:]
+            OutboxItem.objects.filter(id__in=list(waiting)).update(lease_until=timezone.now() - timedelta(seconds=1))
+            taken.extend(outbox.claim('w2'))
+            return mock.Mock(status_code=201)
+
+        with mock.patch('api.federation.requests.Session.request', side_effect=slow_post) as request:
+            delivered = outbox.deliver(items, lease=60)
+            self.assertEqual(delivered + len(taken), 3)
+            self.assertEqual(request.call_count, delivered, 'Items w2 took over are not posted by w1 as well')
+        for item in taken:
+            item.refresh_from_db()
+            self.assertEqual((item.status, item.leased_by), (OutboxItem.Status.PENDING, 'w2'), "w1 does not overwrite w2's items")
+
+
+class RoutingTest(TestCase):
+    def setup(self):
+        self.a = Connection.objects.create(name='a', url='http://a/')
+        self.b = Connection.objects.create(name='b', url='http://b/')
+
+    def fake_get(self, method, url, **kwargs):
+        # Node a lists alice; node b knows bob but doesn't list him
+        response = mock.Mock(status_code=404)
+        if url == 'http://a/service/authors/':
+            response.status_code = 200
+            response.json.return_value = {'items': [{'id': 'alice', 'displayName': 'alice'}]}
+        elif url == 'http://b/service/author/bob/':
+            response.status_code = 200
+            response.json.return_value = {'id': 'bob', 'displayName': 'bob'}
+        elif url == 'http://b/service/authors/':
+            response.status_code = 200
+            response.json.return_value = {'items': []}
+        return response
+
+    def test_directory_sync_routes_authors(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get) as request:
+            directory.sync()
+            calls = request.call_count
+            self.assertEqual(routing.author_connection('https://a/author/alice'), self.a)
+            self.assertEqual(request.call_count, calls, 'Routed authors should not need a request')
+
+    def test_discovery_and_negative_cache(self):
+        self.setup()
+        with mock.patch('api.federation.requests.Session.request', side_effect=self.fake_get) as request:
+            routes = routing.author_connections(['bob', 'nobody'])
+            self.assertEqual(routes, {'bob': self.b, 'nobody': None})
+            calls = request.call_count
+
+            self.assertEqual(routing.find_authors(['bob', 'nobody']), {'bob': {'id': 'bob', 'displayName': 'bob'}})
+            self.assertEqual(request.call_count, calls + 1, 'Only bob\'s node should be asked, once')
+        self.assertIsNone(RemoteRoute.objects.get(remote_id='nobody').connection)
+
+    def test_learn_from_inbox(self):
+        self.setup()
+        routing.learn_from_payload({'type': 'post', 'id': 'p1', 'author': {'id': 'http://b/author/carol'}}, self.b)
+        with mock.patch('api.federation.requests.Session.request') as request:
+            self.assertEqual(routing.author_connection('carol'), self.b)
+            self.assertEqual(routing.post_connection('carol', 'p1'), self.b)
+        request.assert_not_called()
+
+
+class ConnectionAuthTest(APITestCase):
+    def setup(self):
+        self.conn = setup_auth()
+        self.conn.save()
+        Connection.objects.create(name='other', incoming_username='other', incoming_password='secret')
+        self.client.credentials(HTTP_AUTHORIZATION=AUTH)
+
+    def test_credentials_are_indexed(self):
+        self.setup()
+        self.assertEqual(self.client.get('/authors').status_code, 200)
+        before = authentication.request_counts().get(self.conn.id, 0)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/authors').status_code, 200)
+        self.assertFalse([q for q in queries if 'api_connection' in q['sql']], 'Authentication should not query connections')
+        self.assertEqual(authentication.request_counts()[self.conn.id], before + 1)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + b64encode(b'1234:wrong').decode('ascii'))
+        self.assertEqual(self.client.get('/authors').status_code, 403)
+
+    def test_saving_a_connection_updates_the_index(self):
+        self.setup()
+        self.assertEqual(self.client.get('/authors').status_code, 200)
+        self.conn.incoming_password = 'changed'
+        self.conn.save()
+        self.assertEqual(self.client.get('/authors').status_code, 403)
+        self.client.credentials(HTTP_AUTHORIZATION='Basic ' + b64encode(b'1234:changed').decode('ascii'))
+        self.assertEqual(self.client.get('/authors').status_code, 200)
+        self.conn.delete()
+        self.assertEqual(self.client.get('/authors').status_code, 403)
+
+
+class ApiTokenTest(APITestCase):
+    def setup(self):
+        self.conn = setup_auth()
+        self.conn.save()
+        self.client.credentials(HTTP_AUTHORIZATION=AUTH)
+        self.user = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        self.author = self.user.author
+        self.other = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+
+    def test_issue_use_and_revoke(self):
+        self.setup()
+        url = '/author/' + str(self.author.id) + '/tokens'
+        self.assertEqual(self.client.post(url, {'username': 'test1', 'password': 'wrong'}, format='json').status_code, 401)
+        response = self.client.post(url, {'username': 'test1', 'password': 'pwd', 'name': 'script'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        key = response.data['token']
+        self.assertEqual(ApiToken.objects.get().key_hash, hash_token(key))
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        follower_url = '/author/' + str(self.other.id) + '/followers/' + str(self.author.id)
+        with mock.patch('api.views.authenticate') as password_check:
+            self.assertEqual(self.client.put(follower_url, {}, format='json').status_code, 200)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.delete(follower_url, {}, format='json').status_code, 204)
+        password_check.assert_not_called()
+        self.assertFalse([q for q in queries if 'api_apitoken' in q['sql']], 'Known tokens should come from the cache')
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.put(follower_url, {}, format='json').status_code, 403)
+
+    def test_clear_inbox_with_credentials(self):
+        self.setup()
+        inbox_url = '/author/' + str(self.author.id) + '/inbox'
+        post = Post.objects.create(title='sent', author=self.other, visibility='PRIVATE', to_author=self.author)
+
+        # A node passing the author's own password along
+        self.assertEqual(self.client.delete(inbox_url, {'username': 'test2', 'password': 'pwd'}, format='json').status_code, 401)
+        self.assertEqual(self.client.delete(inbox_url, {'username': 'test1', 'password': 'pwd'}, format='json').status_code, 204)
+        self.assertEqual(self.author.inbox.posts(cleared=False).count(), 0)
+
+        self.author.inbox.post_items.remove(post)
+        self.author.inbox.post_items.add(post)
+        _, key = ApiToken.objects.issue(self.other)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(self.client.delete(inbox_url).status_code, 401, "Another author's token")
+        _, key = ApiToken.objects.issue(self.author)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(self.client.delete(inbox_url).status_code, 204)
+        self.assertEqual(self.author.inbox.posts(cleared=False).count(), 0)
+
+    def test_expired_token(self):
+        self.setup()
+        _, key = ApiToken.objects.issue(self.author, lifetime=timedelta(seconds=-1))
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        self.assertEqual(self.client.get('/authors').status_code, 403)
+        self.client.credentials(HTTP_AUTHORIZATION='Token nonsense')
+        self.assertEqual(self.client.get('/authors').status_code, 403)
+
+
+class MetricsTest(APITestCase):
+    def setup(self):
+        self.conn = setup_auth()
+        self.conn.save()
+        self.client.credentials(HTTP_AUTHORIZATION=AUTH)
+        self.user = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        isolate_metrics(self)
+
+    def test_per_view_totals(self):
+        self.setup()
+        self.client.get('/authors').getvalue()
+        self.client.get('/nowhere')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/author/' + str(self.user.author.id))
+
+        views = metrics.collect()
+        totals = views['api:author']
+        self.assertEqual((totals['requests'], totals['queries'], totals['bytes']), (1, len(queries), len(response.content)))
+        self.assertEqual(totals['buckets'][-1], 1)
+        # Streamed responses count the queries made while streaming
+        self.assertGreater(views['api:api.views.authors']['queries'], 0)
+        self.assertEqual(views[metrics.UNRESOLVED]['requests'], 1)
+
+        # Another worker's spool file
+        with open(os.path.join(metrics.ROOT, 'other.json'), 'w') as file:
+            json.dump({'buckets': metrics.BUCKETS, 'views': {'api:author': totals}}, file)
+        self.assertEqual(metrics.collect()['api:author']['requests'], 2)
+
+    def test_spool_files_expire(self):
+        self.setup()
+        self.client.get('/author/' + str(self.user.author.id))
+        totals = metrics.collect()['api:author']
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        names = {
+            'exited': f'{metrics.HOST}-{exited.pid}-0.json',
+            'other host': 'elsewhere-1-0.json',
+            'stale': 'elsewhere-2-0.json',
+        }
+        for name in names.values():
+            with open(os.path.join(metrics.ROOT, name), 'w') as file:
+                json.dump({'buckets': metrics.BUCKETS, 'views': {'api:author': totals}}, file)
+        stale = time.time() - metrics.SPOOL_EXPIRY * metrics.WRITE_INTERVAL - 1
+        os.utime(os.path.join(metrics.ROOT, names['stale']), (stale, stale))
+
+        self.assertEqual(metrics.collect()['api:author']['requests'], 2, 'Only this worker and the other host count')
+        self.assertEqual(sorted(name for name in os.listdir(metrics.ROOT) if not name.startswith(metrics.HOST)),
+                         [names['other host']])
+        self.assertEqual(len(os.listdir(metrics.ROOT)), 2, "This worker's own file is kept")
+
+    def test_endpoint_is_staff_only(self):
+        self.setup()
+        self.client.credentials()
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.logout()
+
+        staff = User.objects.create_user('staff', 'staff@gmail.com', 'pwd', is_active=True, is_staff=True)
+        _, key = ApiToken.objects.issue(staff.author)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + key)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        # The two refused requests, not yet this one
+        self.assertIn('django_view_requests_total{view="metrics"} 2\n', response.content.decode())
+        self.assertIn('django_view_latency_seconds_bucket{view="metrics",le="+Inf"} 2\n', response.content.decode())
+
+
+class QueryCountTest(APITestCase):
+    def setup(self):
+        self.conn = setup_auth()
+        self.conn.save()
+        self.client.credentials(HTTP_AUTHORIZATION=AUTH)
+        self.users = [User.objects.create_user(f'test{i}', f'test{i}@gmail.com', 'pwd', is_active=True) for i in range(3)]
+        self.category = PostCategory.objects.create(name='test')
+        # Builds the credential index, so the counts below are the per-request ones
+        self.client.get('/authors')
+
+    def add_posts(self, count):
+        for i in range(count):
+            author = self.users[i % len(self.users)].author
+            post = Post.objects.create(title=f'Post {i}', author=author)
+            post.categories.add(self.category)
+            Comment.objects.create(post=post, author=AuthorSerializer(author).data, content='hi')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+            # Streamed responses run their queries as the body is read
+            content = response.getvalue()
+        self.assertEqual(response.status_code, 200)
+        return len(queries), json.loads(content)
+
+    def test_list_endpoints_are_constant(self):
+        self.setup()
+        author_posts = '/author/' + str(self.users[0].author.id) + '/posts'
+        self.add_posts(3)
+        small = [self.count_queries(url)[0] for url in ('/posts', '/authors', author_posts)]
+
+        self.add_posts(12)
+        User.objects.create_user('test9', 'test9@gmail.com', 'pwd', is_active=True)
+        large = [self.count_queries(url)[0] for url in ('/posts', '/authors', author_posts)]
+        self.assertEqual(small, large, 'Queries should not grow with the number of rows')
+
+        _, posts = self.count_queries('/posts')
+        self.assertEqual(len(posts), 15)
+        self.assertEqual(posts[0]['comments'][0]['content'], 'hi')
+        self.assertEqual(posts[0]['author']['displayName'], posts[0]['comments'][0]['author']['displayName'])
+
+
+class PlainSerializerTest(APITestCase):
+    def setup(self):
+        self.users = [User.objects.create_user(f'test{i}', f'test{i}@gmail.com', 'pwd', is_active=True) for i in range(2)]
+        self.author = self.users[0].author
+        self.author.bio = 'bio'
+        self.author.birth_date = timezone.now().date()
+        self.author.save()
+        self.remote = Author.objects.create(remote_host='https://remote.example.com/', remote_username='remote')
+        category = PostCategory.objects.create(name='test')
+
+        self.post = Post.objects.create(title='Post', author=self.author, content='body')
+        self.post.categories.add(category)
+        Comment.objects.create(post=self.post, author=AuthorSerializer(self.remote).data, content='hi')
+        Post.objects.create(title='Orphan', _host='https://remote.example.com/')
+        self.like = PostLike.objects.create(post_id=self.post, author=AuthorSerializer(self.users[1].author).data)
+
+        inbox = self.author.inbox
+        inbox.post_items.add(self.post)
+        inbox.post_like_items.add(self.like)
+        inbox.follow_items.add(FriendRequest.objects.create(sender=self.users[1].author, receiver=self.author))
+        inbox.follow_items.add(FriendRequest.objects.create(remote_sender='abc', remote_username='remote', receiver=self.author))
+
+    def assertRendersSame(self, expected, actual):
+        self.assertEqual(JSONRenderer().render(expected), JSONRenderer().render(actual))
+
+    def items(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.getvalue())
+        # Bare lists for the streamed authors and posts, an object for the inbox
+        return data if isinstance(data, list) else data['items']
+
+    def test_matches_drf_serializers(self):
+        self.setup()
+        self.client.force_authenticate(self.users[0])
+        authors = AuthorSerializer.setup_eager_loading(Author.objects.order_by('id'))
+        self.assertRendersSame(AuthorSerializer(authors, many=True).data, self.items('/authors'))
+
+        posts = PostSerializer.setup_eager_loading(Post.objects.order_by('-timestamp', '-id'))
+        self.assertRendersSame(PostSerializer(posts, many=True).data, self.items('/posts'))
+
+        follows = self.author.inbox.follow_items.order_by('id')
+        self.assertEqual(len(follows), 2)
+        expected = [*FriendRequestSerializer(follows, many=True).data, *InboxSerializer(self.author.inbox).data['items'][2:]]
+        self.assertRendersSame(expected, self.items(f'/author/{self.author.id}/inbox'))
+
+
+class PaginationTest(APITestCase):
+    def setup(self):
+        self.conn = setup_auth()
+        self.conn.save()
+        self.client.credentials(HTTP_AUTHORIZATION=AUTH)
+        self.user = User.objects.create_user('test1', 'test1@gmail.com', 'pwd', is_active=True)
+        now = timezone.now()
+        # Two posts share a timestamp so the id has to break the tie
+        self.posts = [Post.objects.create(title=f'Post {i}', author=self.user.author, timestamp=now - timedelta(minutes=i // 2))
+                      for i in range(7)]
+        self.expected = [str(p.id) for p in sorted(self.posts, key=lambda p: (p.timestamp, p.id), reverse=True)]
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.getvalue())
+
+    def test_page_numbers(self):
+        self.setup()
+        page = self.get('/posts?page=2&size=3')
+        self.assertEqual(page['type'], 'posts')
+        self.assertEqual([p['id'] for p in page['items']], self.expected[3:6])
+        self.assertTrue(page['next'].endswith('/posts?page=3&size=3'))
+        self.assertTrue(page['prev'].endswith('/posts?page=1&size=3'))
+
+        last = self.get('/posts?page=3&size=3')
+        self.assertEqual([p['id'] for p in last['items']], self.expected[6:])
+        self.assertIsNone(last['next'])
+
+    def test_cursor(self):
+        self.setup()
+        seen = []
+        page = self.get('/posts?size=2')
+        pages = [page]
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append(page)
+        for page in pages:
+            seen += [p['id'] for p in page['items']]
+        self.assertEqual(seen, self.expected)
+
+        back = self.get(pages[-1]['prev'])
+        self.assertEqual(back['items'], pages[-2]['items'])
+        self.assertEqual(self.get(back['next'])['items'], pages[-1]['items'])
+
+    def test_plain_request_gets_everything(self):
+        self.setup()
+        # Remote nodes that don't page must not lose rows
+        with mock.patch.object(pagination, 'PAGE_SIZE', 5):
+            response = self.client.get('/posts')
+            self.assertEqual([p['id'] for p in json.loads(response.getvalue())], self.expected)
+            self.assertFalse(response.has_header('Link'))
+            page = self.get('/posts?size=5')
+        self.assertEqual([p['id'] for p in page['items']], self.expected[:5])
+        self.assertIsNotNone(page['next'])
+
+        page = self.get(f'/posts?size={pagination.MAX_PAGE_SIZE + 50}')
+        self.assertEqual(len(page['items']), 7)
+        self.assertEqual(self.client.get('/posts?cursor=garbage').status_code, 404)
+
+    def test_inbox_sections(self):
+        self.setup()
+        other = User.objects.create_user('test2', 'test2@gmail.com', 'pwd', is_active=True).author
+        inbox = self.user.author.inbox
+        inbox.follow_items.add(FriendRequest.objects.create(sender=other, receiver=self.user.author))
+        inbox.post_items.add(*self.posts[:3])
+        self.client.force_authenticate(self.user)
+
+        url = '/author/' + str(self.user.author.id) + '/inbox'
+        first = self.get(url + '?size=2')
+        self.assertEqual(first['type'], 'inbox')
+        self.assertEqual([item['type'] for item in first['items']], ['Follow', 'post'])
+        second = self.get(first['next'])
+        self.assertEqual([item['type'] for item in second['items']], ['post', 'post'])
+        self.assertIsNone(second['next'])
+
+    def test_streamed_pages(self):
+        self.setup()
+        posts = PostSerializer.setup_eager_loading(Post.objects.order_by('-timestamp', '-id'))
+        with mock.patch.object(pagination, 'STREAM_CHUNK_SIZE', 2):
+            response = self.client.get('/posts')
+            self.assertTrue(response.streaming)
+            self.assertEqual(response.getvalue(), JSONRenderer().render(PostSerializer(posts, many=True).data))
+
+            page = self.client.get('/posts?size=3').getvalue()
+            expected = {'type': 'posts', 'items': PostSerializer(posts[:3], many=True).data, 'next': json.loads(page)['next'], 'prev': None}
+            self.assertEqual(page, JSONRenderer().render(expected))
+
+            # Chunks that cross from post likes into comment likes
+            liker = {'id': 'liker'}
+            for post in self.posts[:3]:
+                PostLike.objects.create(post_id=post, author=liker)
+            comment = Comment.objects.create(post=self.posts[0], author=liker, content='hi')
+            CommentLike.objects.create(comment_id=comment, author=liker)
+            liked = json.loads(self.client.get('/author/liker/liked').getvalue())
+            self.assertEqual(len(liked), 4)
@@ -20,6 +20,7 @@ urlpatterns = [
     path('author/<str:author_id>/posts/<str:post_id>/comments/<str:comment_id>/likes', views.comment_likes),
     path('author/<str:author_id>/liked', views.liked),
     path('author/<str:author_id>/inbox', views.inbox),
+    path('author/<str:author_id>/tokens', views.tokens),
     path('authors', views.authors),
     path('posts', views.get_all_posts),
     path('authors/search/<str:query>', views.author_search),
@@ -41,6 +42,7 @@ urlpatterns = [
     path('api/authors/search/<str:query>', views.author_search),
     path('api/posts', views.get_all_posts),
     path('api/inbox/<str:author_id>', views.inbox),
+    path('api/author/<str:author_id>/tokens', views.tokens),
 
 ]
 
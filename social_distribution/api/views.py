@@ -1,4 +1,5 @@
 from django.contrib.auth import authenticate
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 
@@ -8,16 +9,16 @@ from rest_framework.parsers import JSONParser
 from rest_framework import status
 from rest_framework.response import Response
 
-from .serializers import AuthorSerializer, PostSerializer, CommentSerializer, LikeSerializer, PostLikeSerializer, CommentLikeSerializer, FriendRequestSerializer, InboxSerializer
-from Profile.models import Author, Post, Comment, PostLike, CommentLike
+from .serializers import AuthorSerializer, PostSerializer, CommentSerializer, LikeSerializer, FriendRequestSerializer
+from Profile.models import Author, Follow, Post, Comment, PostLike, CommentLike
 from Search.models import FriendRequest
-from .models import Connection
+from .models import ApiToken, Connection
+from . import directory, pagination, plain, routing
 
 import traceback
+from datetime import timedelta
 
 
-DEFAULT_HEADERS = {'Referer': 'https://team3-socialdistribution.herokuapp.com/', 'Mode': 'no-cors'}
-
 # https://www.django-rest-framework.org/tutorial/1-serialization/ - was consulted in writing code
 
 @api_view(['GET'])
@@ -27,8 +28,58 @@ def get_all_posts(request):
 	"""
 
 	posts = Post.objects.filter(visibility=Post.Visibility.PUBLIC, unlisted=False)
-	serializer = PostSerializer(posts, many=True)
-	return Response(serializer.data)
+	return post_page(request, posts, stream=True)
+
+
+def has_credentials(request):
+	return isinstance(request.auth, ApiToken) or ('username' in request.data and 'password' in request.data)
+
+
+def credentials_user(request):
+	"""
+	User whose credentials came with the request: the owner of the api token it was made with, or else the
+	username and password in its body. Checking a password costs a full PBKDF2 hash; scripts should use tokens.
+	"""
+	if isinstance(request.auth, ApiToken):
+		return request.user
+	if not has_credentials(request):
+		return None
+	return authenticate(username=request.data['username'], password=request.data['password'])
+
+
+def post_page(request, posts, stream=False):
+	"""
+	A page of posts, newest first. stream writes the json a few posts at a time (see api/pagination.py).
+	"""
+	context = plain.Context()
+	posts = pagination.Section(PostSerializer.setup_eager_loading(posts), ('-timestamp', '-id'), lambda row: plain.post(row, context))
+	return pagination.paginate(request, posts, stream=stream).response('posts')
+
+
+def author_page(request, authors, kind='authors', stream=False):
+	"""
+	A page of authors, ordered by id.
+	"""
+	context = plain.Context()
+	authors = pagination.Section(AuthorSerializer.setup_eager_loading(authors), ('id',), lambda row: plain.author(row, context))
+	return pagination.paginate(request, authors, stream=stream).response(kind)
+
+
+def inbox_page(request, owner):
+	"""
+	A page of owner's inbox: follow requests, then posts (newest first), then likes.
+	"""
+	context = plain.Context()
+	inbox = owner.inbox
+	page = pagination.paginate(
+		request,
+		pagination.Section(FriendRequestSerializer.setup_eager_loading(inbox.follow_items.all()), ('id',),
+						   lambda row: plain.friend_request(row, context)),
+		pagination.Section(PostSerializer.setup_eager_loading(inbox.post_items.all()), ('-timestamp', '-id'),
+						   lambda row: plain.post(row, context)),
+		pagination.Section(inbox.post_like_items.all(), ('id',), lambda row: plain.like(row, context)),
+	)
+	return page.response('inbox', author=owner.url)
 
 
 # Create your views here.
@@ -43,8 +94,7 @@ def authors(request):
 		return HttpResponse(status=404)
 
 	if request.method == 'GET':
-		serializer = AuthorSerializer(authors, many=True)
-		return Response(serializer.data)
+		return author_page(request, authors, stream=True)
 
 	else:
 		return Response(serializer.errors, status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -56,7 +106,7 @@ def author_search(request, query):
 	Retrieve or update an author.
 	"""
 	if request.method == 'GET':
-		authors = Author.objects.filter(user__username__contains=query)
+		authors = AuthorSerializer.setup_eager_loading(Author.objects.filter(user__username__contains=query))
 		serializer = AuthorSerializer(authors, many=True)
 		return Response(serializer.data)
 
@@ -96,15 +146,13 @@ def post(request, author_id, post_id):
 	# Create new post
 	if request.method == 'PUT':
 		# See if credentials supplied
-		if 'password' not in request.data or 'username' not in request.data:
+		if not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if author_id == str(Author.objects.get(user__username=username).id):
+				if author_id == str(user.author.id):
 					author = Author.objects.get(id=author_id)
 					instance = Post.objects.create(author=author, id=post_id)
 					serializer = PostSerializer(instance, data=request.data)
@@ -138,15 +186,13 @@ def post(request, author_id, post_id):
 		return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 	elif request.method == 'DELETE':
-		if 'password' not in request.data or 'username' not in request.data:
+		if not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if str(Author.objects.get(user__username=username).id) == str(Post.objects.get(id=post_id).author.id):
+				if str(user.author.id) == str(Post.objects.get(id=post_id).author.id):
 					print(author_id)
 					print(Post.objects.get(id=post_id).author.id)
 					post.delete()
@@ -164,9 +210,8 @@ def posts(request, author_id):
 	"""
 
 	if request.method == 'GET':
-		posts = Post.objects.filter(author__id=author_id, visibility='PUBLIC', unlisted=False).all()
-		serializer = PostSerializer(posts, many=True)
-		return Response(serializer.data)
+		posts = Post.objects.filter(author__id=author_id, visibility='PUBLIC', unlisted=False)
+		return post_page(request, posts)
 
 	elif request.method == 'POST':
 		author = Author.objects.get(id=author_id)
@@ -181,9 +226,7 @@ def posts(request, author_id):
 def friends(request, author_id):
 	""" Retrieve friends for an author or create a new one """
 	if request.method == 'GET':
-		following = Author.objects.get(id=author_id).following.all()
-		followers = Author.objects.get(id=author_id).followers.all()
-		friends = following & followers
+		friends = AuthorSerializer.setup_eager_loading(Follow.objects.friends_of(Author.objects.get(id=author_id)))
 
 		serializer = AuthorSerializer(friends, many=True)
 		return Response(serializer.data)
@@ -206,15 +249,13 @@ def friend(request, author_id, friend_id):
 
 	# Add a friend
 	elif request.method == 'PUT':
-		if 'password' not in request.data or 'username' not in request.data:
+		if not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if author_id == str(Author.objects.get(user__username=username).id):
+				if author_id == str(user.author.id):
 					author.friends.add(friend)
 					return HttpResponse(status=200)
 
@@ -227,20 +268,18 @@ def friend(request, author_id, friend_id):
 
 	elif request.method == 'DELETE':
 
-		if request.user is not None and author_id == str(Author.objects.get(user__username=request.user).id):
+		if request.author and author_id == str(request.author.id):
 			author.friends.remove(friend)
 			return Response(status=status.HTTP_204_NO_CONTENT)
 
-		elif 'password' not in request.data or 'username' not in request.data:
+		elif not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if author_id == str(Author.objects.get(user__username=username).id):
+				if author_id == str(user.author.id):
 					author.friends.remove(friend)
 					return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -257,26 +296,24 @@ def friend(request, author_id, friend_id):
 def requests(request, author_id):
 	""" Retrieve friend requests for an author"""
 	try:
-		requests = FriendRequest.objects.filter(receiver_id=author_id).all()
+		requests = FriendRequestSerializer.setup_eager_loading(FriendRequest.objects.filter(receiver_id=author_id))
 	except:
 		return HttpResponse(status=404)
 
 
 	if request.method == 'GET':
 		# Check current logged in user
-		if request.user is not None and author_id == str(Author.objects.get(user__username=request.user).id):
+		if request.author and author_id == str(request.author.id):
 			serializer = FriendRequestSerializer(requests, many=True)
 			return Response(serializer.data)
 
-		elif 'password' not in request.data or 'username' not in request.data:
+		elif not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 		else:
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if author_id == str(Author.objects.get(user__username=username).id):
+				if author_id == str(user.author.id):
 					serializer = FriendRequestSerializer(requests, many=True)
 					return Response(serializer.data)
 				else:
@@ -298,32 +335,28 @@ def request(request, author_id, sender_id):
 
 	if request.method == 'GET':
 		# Check current logged in user
-		if request.user is not None and ( sender_id == str(Author.objects.get(user__username=request.user).id) or author_id == str(Author.objects.get(user__username=request.user).id)):
+		if request.author and (sender_id == str(request.author.id) or author_id == str(request.author.id)):
 			serializer = FriendRequestSerializer(friend_request)
 			return Response(serializer.data)
 
-		elif 'password' not in request.data or 'username' not in request.data:
+		elif not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 		else:
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if sender_id == str(Author.objects.get(user__username=username).id):
+				if sender_id == str(user.author.id):
 					serializer = FriendRequestSerializer(friend_request)
 
 					our_host = 'https://team3-socialdistribution.herokuapp.com/'
 
 				# GET the remote friend requests
-					for connection in Connection.objects.all():
-						url = connection.url + 'service/authors'
-						response = requests.get(url, headers=DEFAULT_HEADERS, auth=(connection.outgoing_username, connection.outgoing_password))
-						for author9 in response.json()['items']:
-							if author9['id'] == sender_id:
-								request_url = f'{connection.url}service/author/{sender_id}/follow_remote_3/{author_id}/{our_host}'
-								# Parse their json here
-								# TODO
+					remote_sender = directory.lookup(sender_id)
+					if remote_sender:
+						connection = remote_sender.connection
+						request_url = f'{connection.url}service/author/{sender_id}/follow_remote_3/{author_id}/{our_host}'
+						# Parse their json here
+						# TODO
 
 					return Response(serializer.data)
 
@@ -346,14 +379,9 @@ def request(request, author_id, sender_id):
 			# - Receiver is local author object
 			# - Remote_sender is the remote author's UUID
 			instance = FriendRequest.objects.get_or_create(receiver=receiver, remote_sender=remote_sender, remote_username=remote_sender_username)
-			# Add to `remote_followers_uuid` list
-			if receiver.remote_followers_uuid != None and remote_sender not in receiver.remote_followers_uuid:
-				receiver.remote_followers_uuid += f' {remote_sender}'
-			else:
-				receiver.remote_followers_uuid = remote_sender
+			receiver.add_remote_follower(remote_sender)
 			# Send a following API to the remote author?
 			# TODO
-			receiver.save()
 			return Response({'message':'success'}, status=status.HTTP_200_OK)
 
 		else:
@@ -362,19 +390,17 @@ def request(request, author_id, sender_id):
 
 	elif request.method == 'DELETE':
 		# Log in with those credentials
-		if request.user is not None and sender_id == str(Author.objects.get(user__username=request.user).id):
+		if request.author and sender_id == str(request.author.id):
 			friend_request.delete()
 			return Response(status=status.HTTP_204_NO_CONTENT)
 
-		elif 'password' not in request.data or 'username' not in request.data:
+		elif not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 
 		else:
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if sender_id == str(Author.objects.get(user__username=username).id):
+				if sender_id == str(user.author.id):
 					friend_request.delete()
 					return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -387,8 +413,7 @@ def request(request, author_id, sender_id):
 def followers(request, author_id):
 	if request.method == 'GET':
 		followers = Author.objects.get(id=author_id).followers.all()
-		serializer = AuthorSerializer(followers, many=True)
-		return Response(serializer.data)
+		return author_page(request, followers, 'followers')
 
 @api_view(['GET', 'PUT', 'DELETE'])
 def follower(request, author_id, follower_id):
@@ -403,7 +428,7 @@ def follower(request, author_id, follower_id):
 		return HttpResponse(status=404)
 
 	if request.method == 'GET':
-		if follower in author.followers.all():
+		if author.followers.filter(id=follower.id).exists():
 			serializer = AuthorSerializer(follower)
 			return Response(serializer.data)
 		# Not a follower
@@ -411,17 +436,14 @@ def follower(request, author_id, follower_id):
 
 	# Add as follower
 	elif request.method == 'PUT':
-		if 'password' not in request.data or 'username' not in request.data:
+		if not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if follower_id == str(Author.objects.get(user__username=username).id):
-					author.followers.add(follower)
-					follower.following.add(author)
+				if follower_id == str(user.author.id):
+					Follow.objects.follow(follower, author)
 					return HttpResponse(status=200)
 				else:
 					return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -432,17 +454,14 @@ def follower(request, author_id, follower_id):
 
 	elif request.method == 'DELETE':
 		# TODO: add authentication
-		if 'password' not in request.data or 'username' not in request.data:
+		if not has_credentials(request):
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if follower_id == str(Author.objects.get(user__username=username).id):
-					author.followers.remove(follower)
-					follower.following.remove(author)
+				if follower_id == str(user.author.id):
+					Follow.objects.unfollow(follower, author)
 					return Response(status=status.HTTP_204_NO_CONTENT)
 				else:
 					return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -456,20 +475,20 @@ def comments(request, author_id, post_id):
 	Get comments from a post or create a post and auto generate an id for it.
 	"""
 	if request.method == 'GET':
-		post = Post.objects.get(id=post_id)
+		post = Post.objects.without_body().get(id=post_id)
 
 		# if post.visibility != 'PUBLIC':
 		# 	return Response(status=status.HTTP_401_UNAUTHORIZED)
 
-		comments = post.comments.all()
-		serializer = CommentSerializer(comments, many=True)
-		return Response(serializer.data)
+		context = plain.Context()
+		comments = pagination.Section(post.comments.all(), ('timestamp', 'id'), lambda row: plain.comment(row, context))
+		return pagination.paginate(request, comments).response('comments')
 
 	elif request.method == 'POST':
 		# TODO: add authentication
 		if request.data['type'].lower() == "comment":
 			# Grab post
-			post = Post.objects.get(id=post_id)
+			post = Post.objects.without_body().get(id=post_id)
 			
 			comment_author_json = request.data['author']
 
@@ -509,7 +528,7 @@ def comment(request, author_id, post_id, comment_id):
 	"""
 
 	if request.method == 'GET':
-		post = Post.objects.get(id=post_id)
+		post = Post.objects.without_body().get(id=post_id)
 
 		if post.visibility != 'PUBLIC':
 			return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -529,34 +548,20 @@ def inbox(request, author_id):
 	"""
 	if request.method == 'GET':
 		# check if the one performing this request is the valid inbox's Author
-		if ('password' not in request.data) or ('username' not in request.data):
-			try:
-				if author_id != str(request.user.author.id):
-					return Response(status=status.HTTP_401_UNAUTHORIZED)
-			except AttributeError as e:
-				return Response(status=status.HTTP_401_UNAUTHORIZED)
-			else:
-				pass
+		if not has_credentials(request) and not (request.author and author_id == str(request.author.id)):
+			return Response(status=status.HTTP_401_UNAUTHORIZED)
 		# user already authenticated on the web
-		if author_id == str(request.user.author.id):
-
-			inbox = Author.objects.get(id=author_id).inbox
-			inbox_serializer = InboxSerializer(inbox)
+		if request.author and author_id == str(request.author.id):
 
-			return Response(inbox_serializer.data)
+			return inbox_page(request, request.author)
 
 		# for example autheticating via Curl
 		else:
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if author_id == str(Author.objects.get(user__username=username).id):
+				if author_id == str(user.author.id):
 
-					inbox = Author.objects.get(id=author_id).inbox
-					inbox_serializer = InboxSerializer(inbox)
-
-					return Response(inbox_serializer.data)
+					return inbox_page(request, Author.objects.get(id=author_id))
 
 				else:
 					return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -566,6 +571,10 @@ def inbox(request, author_id):
 		# Add authentication here
 		data = request.data
 
+		# Remember which node the sender lives on, so we can reach them without asking every node
+		if isinstance(request.user, Connection):
+			routing.learn_from_payload(data, request.user)
+
 		# ------ FRIEND REQUEST ------ #
 
 		if data['type'].lower() == 'follow' and data['sender']['id'] != None and data['receiver']['id'] == author_id: #remote
@@ -579,12 +588,7 @@ def inbox(request, author_id):
 				# - Remote_sender is the remote author's UUID
 				instance, _ = FriendRequest.objects.get_or_create(receiver=receiver, remote_sender=remote_sender, remote_username=remote_sender_username)
 				receiver.inbox.follow_items.add(instance)
-				# Add to `remote_followers_uuid` list
-				if receiver.remote_followers_uuid != None and remote_sender not in receiver.remote_followers_uuid:
-					receiver.remote_followers_uuid += f' {remote_sender}'
-				else:
-					receiver.remote_followers_uuid = remote_sender
-				receiver.save()
+				receiver.add_remote_follower(remote_sender)
 				return Response({'message':'success'}, status=status.HTTP_200_OK)
 			except:
 				traceback.print_exc()
@@ -595,13 +599,8 @@ def inbox(request, author_id):
 			# check if the author is friend/follow you
 			receiver = Author.objects.get(id=author_id)
 			sender_id = data["author"]["id"]
-			try:
-				receiver_remote_following = receiver.remote_following_uuid.strip().split(" ")
-			except:
-				receiver_remote_following = []
-			valid_remote_senders = receiver_remote_following
 			# REMOTE SENDER
-			if sender_id in valid_remote_senders:
+			if receiver.is_following_remote(sender_id):
 				try:
 					if data["visibility"].upper() in "FRIENDS" + "PRIVATE" and author_id == data["receiver"]:
 						instance = Post(
@@ -661,7 +660,7 @@ def inbox(request, author_id):
 
 		elif data['type'].lower() == 'like':
 			if 'postID' in data.keys():
-				post = Post.objects.filter(id=data['postID']).first()
+				post = Post.objects.without_body().filter(id=data['postID']).first()
 				if not post:
 					return HttpResponse("Post not found", status=404)
 
@@ -675,9 +674,12 @@ def inbox(request, author_id):
 						author = data['author'],
 						post_id = post,
 					)
-					like_object.save()
-					post.likes_count += 1
-					post.save()
+					try:
+						with transaction.atomic():
+							like_object.save()
+					except IntegrityError:
+						# This author already liked the post
+						return Response({'message':'success'}, status=status.HTTP_200_OK)
 					post_author = post.author
 					post_author.inbox.post_like_items.add(like_object)
 
@@ -701,44 +703,18 @@ def inbox(request, author_id):
 			return Response(status=status.HTTP_400_BAD_REQUEST)
 
 	elif request.method == 'DELETE':
-		if ('password' not in request.data) or ('username' not in request.data):
-			try:
-				if author_id != str(request.user.author.id):
-					return Response(status=status.HTTP_401_UNAUTHORIZED)
-			except AttributeError as e:
-				return Response(status=status.HTTP_401_UNAUTHORIZED)
-			else:
-				pass
-		if author_id == str(request.user.author.id):
-
-			author = Author.objects.get(id=author_id)
-
-			posts = author.inbox.post_items
-			requests = author.inbox.follow_items
-			likes = author.inbox.post_like_items
-
-			author.inbox.post_items_cleared.add(*posts)
-			author.inbox.follow_items_cleared.add(*friend_requests)
-			author.inbox.post_like_items_cleared.add(*likes)
+		if not has_credentials(request) and not (request.author and author_id == str(request.author.id)):
+			return Response(status=status.HTTP_401_UNAUTHORIZED)
+		if request.author and author_id == str(request.author.id):
 
+			request.author.inbox.clear()
 			return Response(status=status.HTTP_204_NO_CONTENT)
 		else:
 			# Log in with those credentials
-			username = request.data['username']
-			password = request.data['password']
-			user = authenticate(username=username, password=password)
+			user = credentials_user(request)
 			if user is not None:
-				if follower_id == str(Author.objects.get(user__username=username).id):
-					author = Author.objects.get(id=author_id)
-
-					posts = author.inbox.post_items
-					requests = author.inbox.follow_items
-					likes = author.inbox.post_like_items
-
-					author.inbox.post_items_cleared.add(*posts)
-					author.inbox.follow_items_cleared.add(*friend_requests)
-					author.inbox.post_like_items_cleared.add(*likes)
-
+				if author_id == str(user.author.id):
+					user.author.inbox.clear()
 					return Response(status=status.HTTP_204_NO_CONTENT)
 				else:
 					return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -749,9 +725,9 @@ def inbox(request, author_id):
 @api_view(['GET'])
 def post_likes(request, author_id, post_id):
 	if request.method == 'GET':
-		likes = PostLike.objects.filter(post_id=post_id)
-		serializer = PostLikeSerializer(likes, many=True)
-		return Response(serializer.data)
+		context = plain.Context()
+		likes = pagination.Section(PostLike.objects.filter(post_id=post_id), ('id',), lambda row: plain.like(row, context))
+		return pagination.paginate(request, likes).response('likes')
 
 	else:
 		return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -759,9 +735,10 @@ def post_likes(request, author_id, post_id):
 @api_view(['GET'])
 def comment_likes(request, author_id, post_id, comment_id):
 	if request.method == 'GET':
+		context = plain.Context()
 		likes = CommentLike.objects.filter(post_id=post_id, comment_id=comment_id)
-		serializer = CommentLikeSerializer(likes, many=True)
-		return Response(serializer.data)
+		likes = pagination.Section(likes, ('id',), lambda row: plain.like(row, context))
+		return pagination.paginate(request, likes).response('likes')
 
 	else:
 		return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -769,15 +746,41 @@ def comment_likes(request, author_id, post_id, comment_id):
 @api_view(['GET'])
 def liked(request, author_id):
 	if request.method == 'GET':
-		post_likes = PostLike.objects.filter(author_id=author_id).all()
-		post_serializer = PostLikeSerializer(post_likes, many=True)
+		context = plain.Context()
+		# Post likes first, then comment likes
+		page = pagination.paginate(
+			request,
+			pagination.Section(PostLike.objects.filter(author_id=author_id), ('id',), lambda row: plain.like(row, context)),
+			pagination.Section(CommentLike.objects.filter(author_id=author_id), ('id',), lambda row: plain.like(row, context)),
+			stream=True,
+		)
+		return page.response('liked')
+
+	else:
+		return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
-		comment_likes = CommentLike.objects.filter(author_id=author_id).all()
-		comment_serializer = CommentLikeSerializer(comment_likes, many=True)
 
-		# Very hacky
-		likes = list(post_serializer.data) + list(comment_serializer.data)
-		return Response(likes)
+@api_view(['POST', 'DELETE'])
+def tokens(request, author_id):
+	"""
+	POST: issue an api token for author_id, given its username and password (or another of its tokens).
+	Optional body fields: name, and days until the token expires.
+	DELETE: revoke the token the request was made with.
+	"""
+	if request.method == 'POST':
+		user = credentials_user(request)
+		if user is None or author_id != str(user.author.id):
+			return Response(status=status.HTTP_401_UNAUTHORIZED)
+		try:
+			days = request.data.get('days')
+			lifetime = None if days is None else timedelta(days=float(days))
+		except (TypeError, ValueError):
+			return Response({'days': 'Must be a number.'}, status=status.HTTP_400_BAD_REQUEST)
+		token, key = ApiToken.objects.issue(user.author, name=str(request.data.get('name', ''))[:100], lifetime=lifetime)
+		return Response({'type': 'token', 'token': key, 'expires': token.expires}, status=status.HTTP_201_CREATED)
 
 	else:
-		return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+		if not isinstance(request.auth, ApiToken) or author_id != str(request.auth.author_id):
+			return Response(status=status.HTTP_401_UNAUTHORIZED)
+		request.auth.revoke()
+		return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,6 +1,90 @@
+import copy
+import hashlib
+import threading
+import time
 from base64 import b64encode
-from rest_framework import authentication
-from api.models import Connection
+from collections import Counter
+
+from django.conf import settings
+from rest_framework import authentication, exceptions
+from api.models import ApiToken, Connection, hash_token
+
+
+# Other worker processes don't see this one's Connection signals, so the index is also rebuilt after a while
+INDEX_TTL = getattr(settings, 'API_AUTH_INDEX_TTL', 60)
+TOKEN_CACHE_SIZE = getattr(settings, 'API_TOKEN_CACHE_SIZE', 10000)
+
+_lock = threading.Lock()
+_index = None
+_built = 0
+_requests = Counter()
+_tokens = {}
+
+
+def _digest(header):
+    return hashlib.sha256(header.encode()).digest()
+
+
+def credential_index():
+    """
+    {SHA-256 of an Authorization header: Connection} for every connection's incoming credentials.
+    """
+    global _index, _built
+    with _lock:
+        if _index is None or time.monotonic() - _built > INDEX_TTL:
+            index = {}
+            for connection in Connection.objects.all():
+                if connection.incoming_username is None or connection.incoming_password is None:
+                    continue
+                user_pwd = connection.incoming_username + ':' + connection.incoming_password
+                header = 'Basic ' + b64encode(bytes(user_pwd, 'ASCII')).decode()
+                index.setdefault(_digest(header), connection)
+            _index, _built = index, time.monotonic()
+        return _index
+
+
+def invalidate(**kwargs):
+    """
+    Drop the credential index; connected to Connection's post_save and post_delete in api.signals.
+    """
+    global _index
+    with _lock:
+        _index = None
+
+
+def cached_token(key_hash):
+    """
+    The ApiToken with this key hash, with its author and user loaded, from this process's cache.
+    """
+    with _lock:
+        cached = _tokens.get(key_hash)
+    if cached is not None and time.monotonic() - cached[1] <= INDEX_TTL:
+        return cached[0]
+    token = ApiToken.objects.select_related('author__user').filter(key_hash=key_hash).first()
+    if token is not None:
+        with _lock:
+            # Unknown keys are never cached, so the cache only holds issued tokens
+            if len(_tokens) >= TOKEN_CACHE_SIZE:
+                _tokens.clear()
+            _tokens[key_hash] = (token, time.monotonic())
+    return token
+
+
+def forget_token(key_hash):
+    """
+    Drop a token from the cache; connected to ApiToken's post_save and post_delete in api.signals.
+    """
+    with _lock:
+        _tokens.pop(key_hash, None)
+
+
+def request_counts():
+    """
+    {connection id: api requests it made to this process}, for rate accounting.
+    """
+    with _lock:
+        return dict(_requests)
+
 
 # https://stackoverflow.com/a/46428523
 # https://stackoverflow.com/a/32846841
@@ -8,11 +92,35 @@ from api.models import Connection
 class ConnectionAuth(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        token_type, _, credentials = auth_header.partition(' ')
-
-        for connection in Connection.objects.all():
-            user_pwd = connection.incoming_username + ':' + connection.incoming_password
-            expected = b64encode(bytes(user_pwd, 'ASCII')).decode()
-            if token_type == 'Basic' and credentials == expected:
-                return (connection, None)
-        return None
\ No newline at end of file
+        if not auth_header.startswith('Basic '):
+            return None
+
+        # Looked up by digest, so the time a lookup takes says nothing about the stored credentials
+        connection = credential_index().get(_digest(auth_header))
+        if connection is None:
+            return None
+        with _lock:
+            _requests[connection.id] += 1
+        # Views may set attributes on request.user; keep the shared instance clean
+        return (copy.copy(connection), None)
+
+
+class TokenAuth(authentication.BaseAuthentication):
+    """
+    "Authorization: Token <key>" with a key from ApiToken.objects.issue; request.user is the token's author's user
+    and request.auth the ApiToken.
+    """
+    keyword = 'Token'
+
+    def authenticate(self, request):
+        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        if not auth_header.startswith(self.keyword + ' '):
+            return None
+
+        token = cached_token(hash_token(auth_header[len(self.keyword) + 1:].strip()))
+        if token is None or not token.is_active() or token.author.user is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired token.')
+        return (token.author.user, token)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,360 @@
+"""
+Per-view request metrics, exported at /metrics in the Prometheus text format.
+
+MetricsMiddleware counts, for each resolved url name (api:author, Profile:home, ...): requests, a latency
+histogram, SQL queries and the time spent in them, and response bytes. A worker process keeps its own totals
+and writes them to a file of its own under METRICS_ROOT every METRICS_WRITE_INTERVAL seconds; /metrics adds
+up every file, so the numbers cover all the workers sharing that directory. METRICS_ROOT is local to a server,
+so on Heroku each web dyno reports its own workers only: scrape every dyno, or read the numbers per dyno.
+Files of workers that have exited on this host, or that were not written for METRICS_SPOOL_EXPIRY write
+intervals, are deleted as they are read; their totals leave the sums, as they would on a restart.
+
+Calls to remote nodes are counted the same way by record_call (see api/federation.py), per connection,
+logical endpoint and outcome.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import exceptions
+
+from .authentication import TokenAuth
+
+
+ROOT = getattr(settings, 'METRICS_ROOT', os.path.join(settings.BASE_DIR, 'metrics'))
+WRITE_INTERVAL = getattr(settings, 'METRICS_WRITE_INTERVAL', 10)
+SPOOL_EXPIRY = getattr(settings, 'METRICS_SPOOL_EXPIRY', 360)
+BUCKETS = tuple(getattr(settings, 'METRICS_LATENCY_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)))
+
+FIELDS = ('requests', 'seconds', 'queries', 'query_seconds', 'bytes')
+CALL_FIELDS = ('calls', 'seconds', 'bytes')
+COUNTERS = (
+    ('requests', 'django_view_requests_total', 'Requests handled.'),
+    ('queries', 'django_view_sql_queries_total', 'SQL queries run while handling requests.'),
+    ('query_seconds', 'django_view_sql_seconds_total', 'Seconds spent in SQL queries while handling requests.'),
+    ('bytes', 'django_view_response_bytes_total', 'Bytes of response bodies.'),
+)
+# Paths that match no url share one label, so scanners can't grow the label set
+UNRESOLVED = '<unresolved>'
+
+# Outcomes of a remote call besides its HTTP status code
+TIMEOUT = 'timeout'    # no answer before the connect or read timeout
+ERROR = 'error'        # the connection failed
+OPEN = 'open'          # skipped: the node's circuit breaker is open
+BUSY = 'busy'          # skipped: the per-node in-flight cap stayed full
+DEADLINE = 'deadline'  # skipped: the caller's deadline had already passed
+
+logger = logging.getLogger(__name__)
+
+# Spool files are named <host>-<pid>-<random>.json, so a reader can tell which workers are gone
+HOST = socket.gethostname().replace('-', '_')
+
+_lock = threading.Lock()
+_totals = {}
+_calls = {}
+_pid = None
+_spool = None
+_written = time.monotonic()
+
+
+class _Queries:
+    """
+    execute_wrapper counting the queries run through it and the time they take.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+    def watch(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+def _empty(fields=FIELDS):
+    return {**dict.fromkeys(fields, 0), 'buckets': [0] * len(BUCKETS)}
+
+
+def _observe(totals, seconds):
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            totals['buckets'][i] += 1
+
+
+def _merge(merged, totals, fields):
+    for field in fields:
+        merged[field] += totals[field]
+    merged['buckets'] = [a + b for a, b in zip(merged['buckets'], totals['buckets'])]
+
+
+def _reset():
+    # Under _lock. A forked worker starts from zero, in a file of its own
+    global _pid, _spool, _totals, _calls
+    if _pid != os.getpid():
+        _pid, _spool, _totals, _calls = os.getpid(), None, {}, {}
+
+
+def _due():
+    if time.monotonic() - _written > WRITE_INTERVAL:
+        write()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else UNRESOLVED
+
+
+def record(view, seconds, queries, query_seconds, size):
+    """
+    Add one request to this process's totals, and write them out if they are due.
+    """
+    with _lock:
+        _reset()
+        totals = _totals.setdefault(view, _empty())
+        totals['requests'] += 1
+        totals['seconds'] += seconds
+        totals['queries'] += queries
+        totals['query_seconds'] += query_seconds
+        totals['bytes'] += size
+        _observe(totals, seconds)
+    _due()
+
+
+def record_call(connection, endpoint, outcome, seconds, size=0):
+    """
+    Add one call to a remote node to this process's totals.
+    Parameters
+    ----------
+    connection: the Connection called
+    endpoint: logical endpoint, e.g. 'posts' or 'inbox'
+    outcome: the HTTP status code, or one of TIMEOUT, ERROR, OPEN, BUSY and DEADLINE
+    seconds: time the caller spent on the call, retries excluded
+    size: bytes of the response body
+    """
+    key = (str(connection.id), connection.name or connection.url or '', endpoint, str(outcome))
+    with _lock:
+        _reset()
+        totals = _calls.setdefault(key, _empty(CALL_FIELDS))
+        totals['calls'] += 1
+        totals['seconds'] += seconds
+        totals['bytes'] += size
+        _observe(totals, seconds)
+    _due()
+
+
+def write():
+    """
+    Replace this process's spool file with its current totals.
+    """
+    global _spool, _written
+    with _lock:
+        _written = time.monotonic()
+        if not (_totals or _calls) or _pid != os.getpid():
+            return
+        if _spool is None:
+            _spool = f'{HOST}-{_pid}-{uuid.uuid4().hex[:8]}.json'
+        try:
+            os.makedirs(ROOT, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=ROOT, suffix='.tmp', delete=False) as tmp:
+                json.dump({'buckets': BUCKETS, 'views': _totals,
+                           'calls': [[*key, totals] for key, totals in _calls.items()]}, tmp)
+            os.replace(tmp.name, os.path.join(ROOT, _spool))
+        except OSError:
+            logger.warning('Could not write request metrics to %s', ROOT, exc_info=True)
+
+
+atexit.register(write)
+
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists, but belongs to another user
+        pass
+    return True
+
+
+def _expired(name, now):
+    """
+    Whether the spool file name (or a temporary file left by a failed write) belongs to no live worker.
+    """
+    try:
+        if now - os.path.getmtime(os.path.join(ROOT, name)) > SPOOL_EXPIRY * WRITE_INTERVAL:
+            return True
+    except FileNotFoundError:
+        return False
+    if not name.endswith('.json'):
+        return False
+    parts = name[:-len('.json')].rsplit('-', 2)
+    # Only this host's processes can be looked up
+    if len(parts) != 3 or parts[0] != HOST or not parts[1].isdigit():
+        return False
+    pid = int(parts[1])
+    return pid != os.getpid() and not _running(pid)
+
+
+def read():
+    """
+    The totals of every worker, this process's written first: {'views': {view: totals},
+    'calls': {(connection id, connection name, endpoint, outcome): totals}}.
+    """
+    write()
+    views, calls = {}, {}
+    try:
+        names = os.listdir(ROOT)
+    except FileNotFoundError:
+        names = []
+    now = time.time()
+    for name in names:
+        if _expired(name, now):
+            try:
+                os.remove(os.path.join(ROOT, name))
+            except OSError:
+                pass
+            continue
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(ROOT, name)) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            continue
+        # Files from before a change of METRICS_LATENCY_BUCKETS can't be added up with the others
+        if tuple(data.get('buckets', ())) != BUCKETS:
+            continue
+        for view, totals in data['views'].items():
+            _merge(views.setdefault(view, _empty()), totals, FIELDS)
+        for *key, totals in data.get('calls', ()):
+            _merge(calls.setdefault(tuple(key), _empty(CALL_FIELDS)), totals, CALL_FIELDS)
+    return {'views': views, 'calls': calls}
+
+
+def collect():
+    """
+    {view: totals} summed over every worker.
+    """
+    return read()['views']
+
+
+def collect_calls(connection=None):
+    """
+    {(connection id, connection name, endpoint, outcome): totals} summed over every worker, for one
+    Connection or all of them.
+    """
+    calls = read()['calls']
+    if connection is not None:
+        calls = {key: totals for key, totals in calls.items() if key[0] == str(connection.id)}
+    return calls
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _histogram(lines, metric, series):
+    for labels, totals, count in series:
+        for bound, n in zip(BUCKETS, totals['buckets']):
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {n}')
+        lines += [f'{metric}_bucket{{{labels},le="+Inf"}} {count}',
+                  f'{metric}_sum{{{labels}}} {totals["seconds"]}',
+                  f'{metric}_count{{{labels}}} {count}']
+
+
+def render(views, calls=None):
+    """
+    The totals from read, in the Prometheus text exposition format.
+    """
+    lines = []
+    for field, metric, description in COUNTERS:
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        lines += [f'{metric}{{view="{_label(view)}"}} {views[view][field]}' for view in sorted(views)]
+    metric = 'django_view_latency_seconds'
+    lines += [f'# HELP {metric} Seconds from a request reaching the middleware to its last byte.',
+              f'# TYPE {metric} histogram']
+    _histogram(lines, metric, ((f'view="{_label(view)}"', views[view], views[view]['requests']) for view in sorted(views)))
+
+    series = [(','.join(f'{name}="{_label(value)}"' for name, value in
+                        zip(('connection_id', 'connection', 'endpoint', 'outcome'), key)), totals)
+              for key, totals in sorted((calls or {}).items())]
+    for field, metric, description in (
+            ('calls', 'federation_requests_total', 'Calls to remote nodes, by HTTP status or why they failed.'),
+            ('bytes', 'federation_response_bytes_total', 'Bytes of remote nodes\' response bodies.')):
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        lines += [f'{metric}{{{labels}}} {totals[field]}' for labels, totals in series]
+    metric = 'federation_request_duration_seconds'
+    lines += [f'# HELP {metric} Seconds a call to a remote node took.', f'# TYPE {metric} histogram']
+    _histogram(lines, metric, ((labels, totals, totals['calls']) for labels, totals in series))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Records every request with record. Streamed responses are recorded once their last chunk is sent,
+    including the queries run while streaming.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        queries = _Queries()
+        with queries.watch():
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self._stream(request, response.streaming_content, start, queries)
+        else:
+            record(view_name(request), time.perf_counter() - start, queries.count, queries.seconds,
+                   len(response.content))
+        return response
+
+    def _stream(self, request, content, start, queries):
+        size = 0
+        try:
+            with queries.watch():
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            record(view_name(request), time.perf_counter() - start, queries.count, queries.seconds, size)
+
+
+def metrics(request):
+    """
+    The metrics of every worker on the server that answers, for staff: logged in, or with an api token
+    ("Authorization: Token <key>").
+    """
+    user = request.user
+    if not user.is_staff:
+        try:
+            authenticated = TokenAuth().authenticate(request)
+        except exceptions.AuthenticationFailed:
+            authenticated = None
+        if authenticated is not None:
+            user = authenticated[0]
+    if not user.is_staff:
+        return HttpResponse(status=403 if user.is_authenticated else 401)
+    return HttpResponse(render(**read()), content_type='text/plain; version=0.0.4; charset=utf-8')
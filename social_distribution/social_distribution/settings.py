@@ -47,11 +47,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'social_distribution.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Profile.middleware.CurrentAuthorMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +93,16 @@ DATABASES = {
     }
 }
 
+# Shared by every worker and dyno, so a value is computed once per deployment and no worker holds a copy.
+# The table is made by "manage.py createcachetable" (run on release, see the Procfile)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -116,6 +128,7 @@ REST_FRAMEWORK = {
      ),
      'DEFAULT_AUTHENTICATION_CLASSES': (
         'social_distribution.authentication.ConnectionAuth',
+        'social_distribution.authentication.TokenAuth',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -153,4 +166,52 @@ LOGIN_URL = 'login'
 LOGOUT_URL = 'logout'
 LOGIN_REDIRECT_URL = '/'
 
+# Remote node fan-out (see api/federation.py)
+FEDERATION_FANOUT_WORKERS = 16        # threads shared by all fan-outs in a worker process
+FEDERATION_PER_CONNECTION_LIMIT = 4   # concurrent requests to a single node
+FEDERATION_FANOUT_DEADLINE = 10       # seconds before slow nodes are dropped from a page
+FEDERATION_CONNECT_TIMEOUT = 3.05     # seconds to open a connection to a node
+FEDERATION_READ_TIMEOUT = 10          # seconds to wait for a node's response
+FEDERATION_MAX_RETRIES = 2            # extra attempts for failed idempotent requests
+FEDERATION_RETRY_BACKOFF = 0.25       # base of the jittered exponential backoff, in seconds
+FEDERATION_BREAKER_WINDOW = 60        # seconds of calls a breaker looks at
+FEDERATION_BREAKER_MIN_CALLS = 5      # calls in the window before a breaker may trip
+FEDERATION_BREAKER_FAILURE_RATIO = 0.5
+FEDERATION_BREAKER_SLOW_CALL = 5      # seconds after which a call counts as a failure
+FEDERATION_BREAKER_OPEN_SECONDS = 30  # cool-down before an open breaker is probed
+FEDERATION_PROBE_PATH = ''            # appended to Connection.url for the breaker's liveness probe
+FEDERATION_DIRECTORY_TTL = 300        # seconds before federation_worker refreshes a remote author/post mirror
+FEDERATION_LISTING_MAX_PAGES = 50     # pages followed per remote listing; pruning skips listings cut short
+FEDERATION_ROUTE_NEGATIVE_TTL = 300   # seconds an id no node knew about is remembered as unknown
+FEDERATION_OUTBOX_MAX_ATTEMPTS = 8    # deliveries tried before an outbox item is marked failed
+FEDERATION_OUTBOX_RETRY_BASE = 30     # seconds before the first redelivery, doubled per attempt
+FEDERATION_OUTBOX_LEASE = 120         # seconds a worker holds claimed items before others may retry them
+
+# api list endpoints (see api/pagination.py)
+API_PAGE_SIZE = 50                    # rows per page when the client does not pass size
+API_MAX_PAGE_SIZE = 100               # upper bound on size
+API_STREAM_CHUNK_SIZE = 20            # rows loaded at a time by the streamed endpoints
+TIMELINE_PAGE_SIZE = 20               # posts per page of the home timeline (see Profile/timeline.py)
+
+# api authentication: remote nodes and api tokens (see social_distribution/authentication.py)
+API_AUTH_INDEX_TTL = 60               # seconds before a worker rebuilds its credential index or rereads a token
+API_TOKEN_CACHE_SIZE = 10000          # api tokens kept in memory per worker
+
+# Image posts (see Profile/images.py), saved through the default file storage. Dyno disks are wiped on every
+# restart, so production keeps them in S3; run clear_image_bodies only once that storage is set up.
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # development file storage
+if os.environ.get('AWS_STORAGE_BUCKET_NAME'):
+    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+    AWS_STORAGE_BUCKET_NAME = os.environ['AWS_STORAGE_BUCKET_NAME']  # keys come from AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY
+    AWS_DEFAULT_ACL = None            # private; images are served through view_post
+IMAGE_MAX_AGE = 86400                 # seconds a browser may keep a served image
+IMAGE_DATA_URL_TIMEOUT = 3600         # seconds the base64 form of an image stays in the cache
+IMAGE_DATA_URL_CACHE_MAX = 256 * 1024  # bytes above which an image's base64 form is rebuilt each time, not cached
+
+# Per-view request metrics, served at /metrics (see social_distribution/metrics.py)
+METRICS_ROOT = os.path.join(BASE_DIR, 'metrics')  # one file of totals per worker process
+METRICS_WRITE_INTERVAL = 10           # seconds between a worker's writes of its totals
+METRICS_SPOOL_EXPIRY = 360            # write intervals after which an unwritten worker file is deleted
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # histogram bounds, in seconds
+
 django_on_heroku.settings(locals())
@@ -16,9 +16,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import metrics
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics.metrics, name='metrics'),
     path('', include('Profile.urls')),
     path('', include('Search.urls')),
     path('', include('api.urls')),